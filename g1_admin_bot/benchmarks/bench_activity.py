@@ -0,0 +1,112 @@
+"""
+Benchmark for the activity counters behind !stats
+
+Run from the g1_admin_bot folder:
+    python benchmarks/bench_activity.py [--minutes 1440] [--per-minute 2000] [--users 50000] [--channels 200]
+
+Feeds synthetic messages from a busy guild into utils/activity.py with a
+simulated clock, one simulated day by default at 2000 messages a minute
+from 50k users over 200 channels, writing every sealed minute to a
+temporary SQLite file as the cog does. Prints how fast events are counted,
+how long each minute's write takes, the memory held by the counters after
+every simulated hour (it should stay flat however many events came
+before) and how long the !stats queries take over different ranges.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.activity import ActivityStore, CHANNEL, GUILD, USER
+
+GUILD_ID = 830_000_000_000_000_001
+FIRST_CHANNEL_ID = 830_000_000_000_001_000
+FIRST_USER_ID = 730_000_000_000_000_000
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main(args):
+    rng = random.Random(1)
+    path = os.path.join(tempfile.mkdtemp(prefix="g1-activity-"), "activity.db")
+    store = ActivityStore(path)
+
+    # A few users write most of the messages, as in real servers
+    users = [FIRST_USER_ID + int(args.users * rng.random() ** 3) for _ in range(args.per_minute * 10)]
+    channels = [FIRST_CHANNEL_ID + int(args.channels * rng.random() ** 2) for _ in range(args.per_minute * 10)]
+
+    start_clock = (time.time() // 86400 - 1) * 86400
+    write_seconds = []
+    events = 0
+    held = 0
+    tracemalloc.start()
+    print(f"{'hour':>4} {'events':>12} {'counters held':>14} {'traced memory':>14}")
+    for minute in range(args.minutes):
+        base = start_clock + minute * 60
+        for i in range(args.per_minute):
+            j = (minute * args.per_minute + i) % len(users)
+            store.message(GUILD_ID, channels[j], users[j], base + i * 60 / args.per_minute)
+        events += args.per_minute
+        held = max(held, store.pending_keys)
+
+        sealed = store.take_sealed(base + 60)
+        started = time.perf_counter()
+        store.write(sealed)
+        write_seconds.append(time.perf_counter() - started)
+
+        if (minute + 1) % 60 == 0:
+            # Measured with the current minute still held, before it's written
+            print(f"{(minute + 1) // 60:>4} {events:>12,} {held:>14,} "
+                  f"{tracemalloc.get_traced_memory()[0] / 1048576:>11.1f} MB")
+            held = 0
+    tracemalloc.stop()
+
+    # Counting speed on its own, without tracemalloc slowing it down
+    counter = ActivityStore(os.path.join(os.path.dirname(path), "count.db"))
+    started = time.perf_counter()
+    for j in range(len(users)):
+        counter.message(GUILD_ID, channels[j], users[j], start_clock + j * 60 / args.per_minute)
+    count_rate = len(users) / (time.perf_counter() - started)
+    counter.close_db()
+
+    print(f"\nCounted {events:,} messages, {count_rate:,.0f}/s without tracemalloc, "
+          f"{store.rows_written:,} rows written, database {os.path.getsize(path) / 1048576:.1f} MB")
+    print(f"Write per minute: p50 {percentile(write_seconds, 0.5) * 1000:.1f}ms, "
+          f"p99 {percentile(write_seconds, 0.99) * 1000:.1f}ms, max {max(write_seconds) * 1000:.1f}ms")
+
+    until = start_clock + args.minutes * 60
+    print(f"\n{'query':<28} {'1h':>9} {'24h':>9} {'7d':>9}")
+    queries = [
+        ("guild totals", lambda since: store.totals(GUILD_ID, GUILD, GUILD_ID, since, until)),
+        ("channel totals + timeline", lambda since: (store.totals(GUILD_ID, CHANNEL, FIRST_CHANNEL_ID, since, until),
+                                                     store.timeline(GUILD_ID, CHANNEL, FIRST_CHANNEL_ID, since, until))),
+        ("user totals", lambda since: store.totals(GUILD_ID, USER, FIRST_USER_ID, since, until)),
+        ("top channels", lambda since: store.top(GUILD_ID, CHANNEL, since, until)),
+        ("top members", lambda since: store.top(GUILD_ID, USER, since, until)),
+    ]
+    for label, query in queries:
+        timings = []
+        for seconds in (3600, 86400, 7 * 86400):
+            started = time.perf_counter()
+            query(until - seconds)
+            timings.append(time.perf_counter() - started)
+        print(f"{label:<28} " + " ".join(f"{t * 1000:>7.1f}ms" for t in timings))
+
+    store.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", type=int, default=1440, help="simulated minutes")
+    parser.add_argument("--per-minute", type=int, default=2000, help="messages per minute")
+    parser.add_argument("--users", type=int, default=50_000, help="members who write")
+    parser.add_argument("--channels", type=int, default=200, help="channels")
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+"""
+Benchmark for the !setpfp avatar pipeline on large PNG and GIF inputs
+
+Run from the g1_admin_bot folder (needs Pillow):
+    python benchmarks/bench_avatar.py
+
+Each input is generated in memory: a 4000x3000 photo-like PNG that's over the
+upload limit, a 1024x1024 PNG that can be uploaded as is, and animated GIFs at
+640x480 and 1200x1200.
+For each it prints the input and output sizes, what the pipeline did, how long
+prepare_avatar took, and the longest the event loop went without a turn while
+it ran in a thread, next to the stall when run directly on the loop.
+"""
+import asyncio
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.avatars import Image, prepare_avatar
+
+if Image is None:
+    print("Pillow is not installed, nothing to benchmark (pip install pillow)")
+    sys.exit(1)
+
+from PIL import ImageDraw
+
+
+def photo(width, height, seed):
+    """Noise over a gradient, compresses about as badly as a real photo"""
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 40 + seed).convert("RGB")
+    return Image.blend(gradient, noise, 0.5)
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    photo(width, height, 0).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def gif(width, height, frames):
+    background = photo(width, height, 1).convert("P", palette=Image.ADAPTIVE)
+    images = []
+    for i in range(frames):
+        frame = background.copy().convert("RGB")
+        draw = ImageDraw.Draw(frame)
+        x = i * (width - 100) // frames
+        draw.ellipse((x, height // 3, x + 100, height // 3 + 100), fill=(255, 40, 40))
+        images.append(frame.convert("P", palette=Image.ADAPTIVE))
+    buffer = io.BytesIO()
+    images[0].save(buffer, "GIF", save_all=True, append_images=images[1:], duration=40, loop=0)
+    return buffer.getvalue()
+
+
+async def longest_stall(task):
+    longest = 0.0
+    last = time.perf_counter()
+    while not task.done():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        longest = max(longest, now - last)
+        last = now
+    return longest
+
+
+async def run(data):
+    start = time.perf_counter()
+    task = asyncio.ensure_future(asyncio.to_thread(prepare_avatar, data))
+    stall = await longest_stall(task)
+    result, note = task.result()
+    elapsed = time.perf_counter() - start
+
+    # The same work on the loop itself, the stall is the whole run
+    start = time.perf_counter()
+    prepare_avatar(data)
+    blocking = time.perf_counter() - start
+    return result, note, elapsed, stall, blocking
+
+
+def main():
+    inputs = [
+        ("png 4000x3000", png(4000, 3000)),
+        ("png 1024x1024", png(1024, 1024)),
+        ("gif 640x480x60", gif(640, 480, 60)),
+        ("gif 1200x1200x40", gif(1200, 1200, 40)),
+    ]
+
+    print(f"{'input':<18} {'in':>9} {'out':>9} {'time':>8} {'stall':>8} {'inline':>8}  result")
+    for name, data in inputs:
+        result, note, elapsed, stall, blocking = asyncio.run(run(data))
+        print(f"{name:<18} {len(data) / 1e6:>7.2f}MB {len(result) / 1e6:>7.2f}MB "
+              f"{elapsed * 1000:>6.0f}ms {stall * 1000:>6.1f}ms {blocking * 1000:>6.0f}ms  {note}")
+
+
+if __name__ == "__main__":
+    main()
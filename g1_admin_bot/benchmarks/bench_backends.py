@@ -0,0 +1,81 @@
+"""
+Compare the event loop and JSON backends on the gateway replay
+
+Run from the g1_admin_bot folder:
+    python benchmarks/bench_backends.py [--scenario chat] [--events 20000] [--runs 3]
+
+Runs benchmarks/gateway_replay.py once per combination of event_loop
+(asyncio, uvloop) and json_backend (json, orjson), each in its own
+process so the loop and the codec are picked fresh, with no rate limit on
+feeding and no REST limits or latency, so the bot itself is the
+bottleneck. Combinations that need a package that isn't installed are
+skipped. Prints the best of --runs for each: events fed per second,
+decoding and parsing alone, handler latency and RSS growth.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_DIR = os.path.dirname(BENCH_DIR)
+
+EVENT_LOOPS = ["asyncio", "uvloop"]
+JSON_BACKENDS = ["json", "orjson"]
+
+
+def installed(name):
+    return name in ("asyncio", "json") or importlib.util.find_spec(name) is not None
+
+
+def run_replay(args, event_loop, json_backend):
+    fd, report = tempfile.mkstemp(prefix="g1-backends-", suffix=".json")
+    os.close(fd)
+    try:
+        command = [
+            sys.executable, os.path.join(BENCH_DIR, "gateway_replay.py"), args.scenario,
+            "--events", str(args.events), "--rate", "0", "--no-limits", "--drain", str(args.drain),
+            "--event-loop", event_loop, "--json", json_backend, "--report", report,
+        ]
+        result = subprocess.run(command, cwd=BOT_DIR, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(result.stderr[-2000:])
+            return None
+        with open(report) as f:
+            return json.load(f)
+    finally:
+        os.remove(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", choices=["chat", "reactions", "raid"], default="chat")
+    parser.add_argument("--events", type=int, default=20_000, help="events per run")
+    parser.add_argument("--runs", type=int, default=3, help="runs per combination, the best one is shown")
+    parser.add_argument("--drain", type=float, default=10.0, help="seconds to wait for handlers after feeding")
+    args = parser.parse_args()
+
+    print(f"{args.scenario}, {args.events} events, best of {args.runs}\n")
+    print(f"{'event loop':<10} {'json':<7} {'fed/s':>8} {'decode/s':>10} {'parse/s':>8} "
+          f"{'p50':>8} {'p99':>8} {'RSS':>9}")
+    for event_loop in EVENT_LOOPS:
+        for json_backend in JSON_BACKENDS:
+            missing = [name for name in (event_loop, json_backend) if not installed(name)]
+            if missing:
+                print(f"{event_loop:<10} {json_backend:<7} skipped, {' and '.join(missing)} not installed")
+                continue
+            results = [r for r in (run_replay(args, event_loop, json_backend) for _ in range(args.runs)) if r]
+            if not results:
+                print(f"{event_loop:<10} {json_backend:<7} failed")
+                continue
+            best = max(results, key=lambda r: r["fed_per_second"])
+            print(f"{event_loop:<10} {json_backend:<7} {best['fed_per_second']:>8.0f} {best['decode_per_second']:>10.0f} "
+                  f"{best['parse_per_second']:>8.0f} {best['handler_p50'] * 1000:>6.1f}ms "
+                  f"{best['handler_p99'] * 1000:>6.1f}ms {best['memory']['RSS after draining'] / 1048576:>+7.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark for the dice expression engine
+
+Run from the g1_admin_bot folder:
+    python benchmarks/bench_dice.py
+
+Prints rolls per second for typical and huge expressions, then checks that the
+aggregate fast paths match the theoretical mean and variance of the per-die loop,
+and that exploding dice with a drop match a plain simulation of the rules.
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import dice
+
+EXPRESSIONS = [
+    "1d6",
+    "4d6kh3+2",
+    "10d10!",
+    "(2d8+3)*2",
+    "100d6",
+    "1000d6",
+    "100000d6",
+    "1000000d6",
+    "1000000d20kh10",
+    "100000d6!",
+    "1000000d100000",
+]
+
+
+def bench(expression, seconds=0.5):
+    rng = random.Random(1234)
+    dice.roll(expression, rng)  # warm the compile cache
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        dice.roll(expression, rng)
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+
+def naive_sum(rng, count, sides):
+    """What the old !roll did, kept for comparison"""
+    return sum([rng.randint(1, sides) for _ in range(count)])
+
+
+def check_distribution(count, sides, samples=2000):
+    """Mean and variance of the fast path against the exact values for a sum of uniform dice"""
+    rng = random.Random(42)
+    totals = [dice.roll(f"{count}d{sides}", rng)[0] for _ in range(samples)]
+
+    mean = count * (sides + 1) / 2
+    variance = count * (sides * sides - 1) / 12
+    observed_mean = statistics.fmean(totals)
+    observed_variance = statistics.pvariance(totals)
+
+    # Standard errors of the sample mean and sample variance (normal approximation)
+    mean_error = abs(observed_mean - mean) / (variance / samples) ** 0.5
+    variance_error = abs(observed_variance - variance) / (variance * (2 / (samples - 1)) ** 0.5)
+    ok = mean_error < 4 and variance_error < 4
+    return observed_mean, mean, observed_variance, variance, ok
+
+
+def check_keep_highest(count, sides, keep, samples=500):
+    """Keep-highest on the fast path against the per-die loop"""
+    rng = random.Random(7)
+    fast = [dice._roll_large(rng, count, sides, ("kh", keep), False, "")[0] for _ in range(samples)]
+    slow = [dice._roll_small(rng, count, sides, ("kh", keep), False, "")[0] for _ in range(samples)]
+    pooled = (statistics.pvariance(fast) + statistics.pvariance(slow)) / 2 or 1
+    z = abs(statistics.fmean(fast) - statistics.fmean(slow)) / (2 * pooled / samples) ** 0.5
+    return statistics.fmean(fast), statistics.fmean(slow), z < 4
+
+
+def reference_explode_drop(rng, count, sides, mode, n):
+    """Exploding dice with dh/dl rolled die by die, written from the rules rather than from utils/dice.py"""
+    pool = []
+    pending = count
+    rounds = 0
+    while pending and rounds <= dice.MAX_EXPLOSIONS:
+        more = [rng.randint(1, sides) for _ in range(pending)]
+        pool.extend(more)
+        pending = more.count(sides)
+        rounds += 1
+    pool.sort()
+    kept = pool[:len(pool) - n] if mode == "dh" else pool[n:]
+    return sum(kept)
+
+
+def check_explode_drop(count, sides, mode, n, samples=4000):
+    """An exploding pool with a drop against the reference, and exactly n dice dropped on the per-die path"""
+    rng = random.Random(11)
+    expression = f"{count}d{sides}!{mode}{n}"
+    results = [dice.roll(expression, rng) for _ in range(samples)]
+    engine = [total for total, _ in results]
+    reference = [reference_explode_drop(rng, count, sides, mode, n) for _ in range(samples)]
+    pooled = (statistics.pvariance(engine) + statistics.pvariance(reference)) / 2 or 1
+    z = abs(statistics.fmean(engine) - statistics.fmean(reference)) / (2 * pooled / samples) ** 0.5
+    exact = all(group.rolls is None or len(group.dropped) == n for _, groups in results for group in groups)
+    return statistics.fmean(engine), statistics.fmean(reference), z < 4 and exact
+
+
+def main():
+    print(f"numpy: {'yes' if dice.numpy is not None else 'no'}")
+    print()
+    print(f"{'expression':<20} {'rolls/s':>12}")
+    for expression in EXPRESSIONS:
+        print(f"{expression:<20} {bench(expression):>12,.0f}")
+
+    rng = random.Random(1)
+    start = time.perf_counter()
+    naive_sum(rng, 1000000, 6)
+    print(f"{'naive 1000000d6':<20} {1 / (time.perf_counter() - start):>12,.1f}")
+
+    print()
+    print("Fast path distribution checks")
+    failed = False
+    for count, sides in [(2000, 6), (10000, 20), (5000, 100), (2000, 5000)]:
+        observed_mean, mean, observed_variance, variance, ok = check_distribution(count, sides)
+        failed |= not ok
+        print(f"{count}d{sides:<8} mean {observed_mean:,.1f} (expected {mean:,.1f}), "
+              f"variance {observed_variance:,.0f} (expected {variance:,.0f}) {'ok' if ok else 'FAIL'}")
+
+    fast_mean, slow_mean, ok = check_keep_highest(2000, 6, 700)
+    failed |= not ok
+    print(f"2000d6kh700  fast mean {fast_mean:,.2f}, per-die mean {slow_mean:,.2f} {'ok' if ok else 'FAIL'}")
+
+    for count, sides, mode, n, samples in [(4, 6, "dl", 1, 4000), (3, 4, "dh", 1, 4000), (2000, 6, "dl", 100, 300)]:
+        engine_mean, reference_mean, ok = check_explode_drop(count, sides, mode, n, samples)
+        failed |= not ok
+        expression = f"{count}d{sides}!{mode}{n}"
+        print(f"{expression:<12} mean {engine_mean:,.2f}, reference {reference_mean:,.2f} {'ok' if ok else 'FAIL'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
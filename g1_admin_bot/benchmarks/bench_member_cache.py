@@ -0,0 +1,235 @@
+"""
+Benchmark for the member cache modes on a synthetic 500k member guild
+
+Run from the g1_admin_bot folder:
+    python benchmarks/bench_member_cache.py [members]
+
+Members are stand-ins with the same attributes as discord.Member and discord.User,
+so the numbers are close to the library's without connecting to Discord. For each
+mode it prints the members left cached in steady state, their memory (measured
+with tracemalloc and estimated by MemberCachePolicy.memory_report), how long an
+on-demand chunk plus release takes around a broadcast, and the longest the event
+loop went without a turn while releasing.
+"""
+import array
+import asyncio
+import datetime
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.member_cache import MODES, MemberCachePolicy
+
+MEMBERS = 500_000
+ACTIVE = 0.005        # share of members seen within the TTL
+ROLE_HOLDERS = 1000   # members holding a retained role (staff)
+STAFF_ROLE = 900000000000000001
+TTL = 3600
+
+
+class FakeState:
+    pass
+
+
+class FakeUser:
+    __slots__ = ("name", "id", "discriminator", "global_name", "_avatar", "_banner",
+                 "_accent_colour", "bot", "system", "_public_flags", "_state", "_avatar_decoration_data")
+
+    def __init__(self, member_id, state):
+        self.name = f"user{member_id % 10_000_000}"
+        self.id = member_id
+        self.discriminator = "0"
+        self.global_name = f"User {member_id % 100_000}" if member_id % 3 else None
+        self._avatar = f"{member_id:032x}" if member_id % 4 else None
+        self._banner = None
+        self._accent_colour = None
+        self.bot = False
+        self.system = False
+        self._public_flags = 0
+        self._state = state
+        self._avatar_decoration_data = None
+
+
+class FakeMember:
+    __slots__ = ("_roles", "joined_at", "premium_since", "activities", "guild", "pending", "nick",
+                 "timed_out_until", "_permissions", "_client_status", "_user", "_state", "_avatar",
+                 "_banner", "_flags", "_avatar_decoration_data")
+
+    def __init__(self, member_id, guild, roles):
+        self._roles = array.array("Q", roles)
+        self.joined_at = datetime.datetime.fromtimestamp(1_500_000_000 + member_id % 200_000_000, datetime.timezone.utc)
+        self.premium_since = None
+        self.activities = ()
+        self.guild = guild
+        self.pending = False
+        self.nick = f"nick{member_id % 1000}" if member_id % 5 == 0 else None
+        self.timed_out_until = None
+        self._permissions = None
+        self._client_status = None
+        self._user = FakeUser(member_id, guild._state)
+        self._state = guild._state
+        self._avatar = None
+        self._banner = None
+        self._flags = 0
+        self._avatar_decoration_data = None
+
+    @property
+    def id(self):
+        return self._user.id
+
+    def get_role(self, role_id):
+        return role_id if role_id in self._roles else None
+
+
+class FakeGuild:
+    """Just enough of discord.Guild for the cache policy, chunk() 'downloads' every member"""
+
+    def __init__(self, guild_id, member_count, staff, active):
+        self.id = guild_id
+        self.name = "Synthetic Guild"
+        self._state = FakeState()
+        self.member_count = member_count
+        self._members = {}
+        self.member_ids = [(guild_id + i) * 7919 for i in range(member_count)]
+        self.staff = staff
+        self.active = active
+
+    @property
+    def chunked(self):
+        return len(self._members) == self.member_count
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def _add_member(self, member_id):
+        roles = [STAFF_ROLE] if member_id in self.staff else []
+        self._members[member_id] = FakeMember(member_id, self, roles)
+
+    def _remove_member(self, member):
+        self._members.pop(member.id, None)
+
+    async def chunk(self, cache=True):
+        for i, member_id in enumerate(self.member_ids):
+            if member_id not in self._members:
+                self._add_member(member_id)
+            if i % 50_000 == 0:
+                await asyncio.sleep(0)
+
+
+class FakeTimers:
+    def schedule(self, key, delay, callback):
+        pass
+
+
+class FakeBot:
+    def __init__(self, guild):
+        self.guilds = [guild]
+        self.user = None
+        self.timers = FakeTimers()
+
+    def add_listener(self, func, name=None):
+        pass
+
+
+def measure(func):
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+async def longest_stall(until):
+    """Longest gap between turns of the event loop until until() is true"""
+    longest = 0.0
+    last = time.perf_counter()
+    while not until():
+        await asyncio.sleep(0)
+        now = time.perf_counter()
+        longest = max(longest, now - last)
+        last = now
+    return longest
+
+
+async def run_mode(mode, members):
+    rng = random.Random(1)
+    guild_id = 100_000_000_000_000_000
+    guild = FakeGuild(guild_id, members, set(), set())
+    guild.staff = set(rng.sample(guild.member_ids, ROLE_HOLDERS))
+    guild.active = set(rng.sample(guild.member_ids, int(members * ACTIVE)))
+
+    bot = FakeBot(guild)
+    policy = MemberCachePolicy(bot, mode, keep_role_ids=[STAFF_ROLE], ttl=TTL)
+
+    def populate():
+        if mode == "full":
+            # Chunked at startup
+            for member_id in guild.member_ids:
+                guild._add_member(member_id)
+        else:
+            # Only members that showed up in events get cached
+            for member_id in guild.active | guild.staff:
+                guild._add_member(member_id)
+                if member_id in guild.active:
+                    policy.touch(guild.id, member_id)
+
+    start = time.perf_counter()
+    _, steady_bytes = measure(populate)
+    populate_time = time.perf_counter() - start
+    steady_cached = len(guild._members)
+    report = policy.memory_report()
+
+    # A broadcast: chunk on demand, then release
+    gc.collect()
+    start = time.perf_counter()
+    everyone = await policy.acquire(guild)
+    chunk_time = time.perf_counter() - start
+    assert len(everyone) == members
+    del everyone
+
+    start = time.perf_counter()
+    policy.release(guild)
+    stall = await longest_stall(lambda: guild.id not in policy._release_tasks)
+    release_time = time.perf_counter() - start
+    after_cached = len(guild._members)
+
+    return {
+        "mode": mode,
+        "steady_cached": steady_cached,
+        "steady_mb": steady_bytes / 1024 / 1024,
+        "estimate_mb": report["estimated_bytes"] / 1024 / 1024,
+        "per_member": report["bytes_per_member"],
+        "populate_s": populate_time,
+        "chunk_s": chunk_time,
+        "release_s": release_time,
+        "stall_ms": stall * 1000,
+        "after_cached": after_cached,
+    }
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else MEMBERS
+    print(f"Synthetic guild: {members:,} members, {ACTIVE:.1%} active, {ROLE_HOLDERS:,} staff")
+    print()
+    print(f"{'mode':<8} {'cached':>9} {'memory':>9} {'estimate':>9} {'B/member':>9} "
+          f"{'chunk':>8} {'release':>8} {'stall':>8} {'after':>9}")
+
+    for mode in MODES:
+        r = asyncio.run(run_mode(mode, members))
+        print(f"{r['mode']:<8} {r['steady_cached']:>9,} {r['steady_mb']:>7.1f}MB {r['estimate_mb']:>7.1f}MB "
+              f"{r['per_member']:>9,.0f} {r['chunk_s']:>7.2f}s {r['release_s']:>7.2f}s "
+              f"{r['stall_ms']:>6.1f}ms {r['after_cached']:>9,}")
+        gc.collect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Benchmark for the member name index on a synthetic 200k member guild
+
+Run from the g1_admin_bot folder:
+    python benchmarks/bench_member_index.py [members]
+
+Members are stand-ins with the name, global_name and nick of discord.Member,
+named from random syllables with digits, nicknames and accents mixed in the
+way real servers are. Prints how long indexing the guild takes and the memory
+it holds (measured with tracemalloc and estimated by memory_bytes), then the
+latency of exact, prefix, substring and misspelt lookups against a linear scan
+of the members, which is what the library's Member converter does for a name.
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.member_index import GuildIndex, member_keys, normalise
+
+MEMBERS = 200_000
+QUERIES = 500
+SYLLABLES = [
+    "ka", "ri", "mo", "an", "el", "zo", "ë", "lu", "na", "dre", "is", "ta", "vel", "or", "mi", "sha", "ko", "yan",
+    "ab", "bel", "ch", "da", "fa", "gh", "ha", "ib", "ja", "ke", "la", "ma", "nou", "ra", "sa", "ti", "wa", "ya",
+    "ze", "xx", "dark", "pro", "gam", "er", "ninja", "ice", "fox", "wolf", "ben", "amir", "lina", "sof", "yas",
+]
+
+
+class FakeMember:
+    __slots__ = ("id", "name", "global_name", "nick")
+
+    def __init__(self, member_id, rng):
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        self.id = member_id
+        self.name = normalise(word) + (str(rng.randint(0, 9999)) if rng.random() < 0.6 else "")
+        self.global_name = word.title() if rng.random() < 0.7 else None
+        self.nick = f"{word.title()} | {rng.choice(['G1', 'ENSIA', 'Staff', 'Alumni'])}" if rng.random() < 0.2 else None
+
+
+def build(members):
+    # As MemberIndex does for a guild
+    index = GuildIndex(sort=False)
+    for member in members:
+        index.add(member.id, member_keys(member))
+    index.finish()
+    return index
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def typo(word, rng):
+    i = rng.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def linear_scan(members, query):
+    # Like the library's converter: every member, name then global name then nick
+    query = normalise(query)
+    return [m for m in members if query in (normalise(m.name), normalise(m.global_name or ""), normalise(m.nick or ""))]
+
+
+def time_queries(label, queries, search):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+    print(f"  {label:<22} p50 {percentile(latencies, 0.5) * 1e6:>8.0f}us   p99 {percentile(latencies, 0.99) * 1e6:>8.0f}us")
+
+
+def main(count):
+    rng = random.Random(1)
+    members = [FakeMember(700_000_000_000_000_000 + i, rng) for i in range(count)]
+    gc.collect()
+
+    start = time.perf_counter()
+    build(members)
+    elapsed = time.perf_counter() - start
+
+    # Again under tracemalloc, which slows it down too much to time it
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    index = build(members)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{count:,} members, {len(index.keys):,} names, {len(index.grams):,} trigrams")
+    print(f"  indexed in {elapsed:.2f}s, {held / 1048576:.1f} MB traced, {index.memory_bytes() / 1048576:.1f} MB estimated")
+
+    sample = rng.sample(members, QUERIES)
+    exact = [member.name for member in sample]
+    prefix = [member.name[:4] for member in sample]
+    substring = [member.name[2:6] for member in sample]
+    misspelt = [(typo(member.name, rng), member.id) for member in sample if len(member.name) > 4]
+
+    print("\nIndex")
+    time_queries("exact name", exact, index.search)
+    time_queries("prefix (4 chars)", prefix, index.search)
+    time_queries("substring (4 chars)", substring, index.search)
+    time_queries("misspelt", [query for query, _ in misspelt], index.search)
+
+    print("\nLinear scan")
+    time_queries("exact name", exact[:20], lambda query: linear_scan(members, query))
+
+    # Sanity check: a member is found by their own username
+    found = sum(1 for member in sample if any(member_id == member.id for member_id, _, _ in index.search(member.name, 25)))
+    print(f"\n{found}/{len(sample)} members found by their exact username in the top 25")
+    found = sum(1 for query, wanted in misspelt if any(member_id == wanted for member_id, _, _ in index.search(query, 10)))
+    print(f"{found}/{len(misspelt)} found by their username with two letters swapped in the top 10")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else MEMBERS)
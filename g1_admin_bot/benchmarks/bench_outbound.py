@@ -0,0 +1,303 @@
+"""
+Benchmark for the outbound flows against a local fake Discord REST API
+
+Run from the g1_admin_bot folder:
+    python benchmarks/bench_outbound.py [--members 50] [--bans 10] [--logs 20] [--purge 100]
+    python benchmarks/bench_outbound.py --report baseline.json
+    python benchmarks/bench_outbound.py --baseline baseline.json [--tolerance 0.25]
+
+Starts benchmarks/fake_discord.py, points discord.py at it and loads the real
+cogs into the real bot from bot.py, without a gateway connection. A synthetic
+guild is added to the bot's state and commands are invoked from synthetic
+messages, so every request goes through the outbound lanes, the rate limit
+handling of discord.py and the fake server's Discord-style limits.
+
+Scenarios: log_moderation_action posts, a mass ban (concurrent !ban
+commands: DM, ban, reply, log post each), !purge, and !broadcast with bans
+issued while it runs. For each it prints the wall time, per-command
+latency, and per route the requests, 429s and server-side latency.
+
+--report saves the numbers as JSON to keep as a baseline. --baseline
+compares a run against a saved one and exits with status 1 when a
+scenario's throughput fell, or its wall time, p95 latency or 429s grew, by
+more than --tolerance (25% by default, the fake server's latency is random).
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BOT_DIR)
+
+import discord
+
+from benchmarks.fake_discord import FakeDiscord
+
+GUILD_ID = 800_000_000_000_000_001
+CHANNEL_ID = 800_000_000_000_000_002
+LOG_CHANNEL_ID = 800_000_000_000_000_003
+OWNER_ID = 900_000_000_000_000_002
+FIRST_MEMBER_ID = 700_000_000_000_000_000
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def member_payload(user):
+    return {"user": user, "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+
+
+def guild_payload(fake, members):
+    everyone = {
+        "id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0,
+        "color": 0, "hoist": False, "managed": False, "mentionable": False,
+    }
+    channels = [
+        {"id": str(CHANNEL_ID), "type": 0, "name": "general", "position": 0, "permission_overwrites": []},
+        {"id": str(LOG_CHANNEL_ID), "type": 0, "name": "bot-logs", "position": 1, "permission_overwrites": []},
+    ]
+    member_list = [member_payload(fake.users[OWNER_ID]), member_payload(fake.bot_user)]
+    member_list.extend(member_payload(fake.users[FIRST_MEMBER_ID + i]) for i in range(members))
+    return {
+        "id": str(GUILD_ID),
+        "name": "Benchmark Guild",
+        "icon": None,
+        "owner_id": str(OWNER_ID),
+        "roles": [everyone],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "channels": channels,
+        "members": member_list,
+        "member_count": len(member_list),
+        "verification_level": 0,
+        "default_message_notifications": 0,
+        "explicit_content_filter": 0,
+        "mfa_level": 0,
+        "premium_tier": 0,
+        "preferred_locale": "en-US",
+        "nsfw_level": 0,
+    }
+
+
+class Harness:
+    """The bot, the fake server and helpers to invoke commands as the guild owner"""
+
+    def __init__(self, fake, bot, guild):
+        self.fake = fake
+        self.bot = bot
+        self.guild = guild
+        self.channel = guild.get_channel(CHANNEL_ID)
+        self.owner = guild.get_member(OWNER_ID)
+
+    def members(self, count):
+        return [self.guild.get_member(FIRST_MEMBER_ID + i) for i in range(count)]
+
+    async def invoke(self, content):
+        data = self.fake.message(CHANNEL_ID, content, author=self.fake.users[OWNER_ID])
+        data["guild_id"] = str(GUILD_ID)
+        data["member"] = {"roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+        message = discord.Message(state=self.bot._connection, channel=self.channel, data=data)
+        self.fake.channels.setdefault(CHANNEL_ID, []).append(data)
+
+        ctx = await self.bot.get_context(message)
+        start = time.perf_counter()
+        await self.bot.invoke(ctx)
+        if ctx.command_failed:
+            print(f"  {content!r} failed")
+        return time.perf_counter() - start
+
+
+def print_report(name, wall, latencies, fake, note=""):
+    """Print one scenario's numbers and return them for --report"""
+    print(f"\n{name}: {wall:.2f}s wall{note}")
+    if latencies:
+        print(f"  {len(latencies)} ops, {len(latencies) / wall:.1f}/s, "
+              f"p50 {percentile(latencies, 0.5) * 1000:.0f}ms, p95 {percentile(latencies, 0.95) * 1000:.0f}ms, "
+              f"max {max(latencies) * 1000:.0f}ms")
+    print(f"  {'route':<14} {'requests':>8} {'429s':>6} {'p50':>8} {'p95':>8}")
+    routes = {}
+    for route, requests, limited, p50, p95 in fake.report():
+        print(f"  {route:<14} {requests:>8} {limited:>6} {p50 * 1000:>6.0f}ms {p95 * 1000:>6.0f}ms")
+        routes[route] = {"requests": requests, "429s": limited, "p50": p50, "p95": p95}
+    fake.stats.clear()
+    return {
+        "name": name,
+        "wall": wall,
+        "ops": len(latencies),
+        "ops_per_second": len(latencies) / wall if wall else 0,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "max": max(latencies, default=0.0),
+        "429s": sum(route["429s"] for route in routes.values()),
+        "routes": routes,
+    }
+
+
+# Compared against --baseline: (key, label, True when higher is better)
+COMPARED = [("ops_per_second", "ops/s", True), ("wall", "wall", False), ("p95", "p95", False), ("429s", "429s", False)]
+
+
+def compare(results, baseline, tolerance):
+    """Print each scenario against the baseline, returns the regressions"""
+    regressions = []
+    print(f"\nAgainst the baseline (tolerance {tolerance:.0%})")
+    print(f"  {'scenario':<12} {'metric':<7} {'baseline':>10} {'now':>10} {'change':>8}")
+    for scenario, result in results.items():
+        before = baseline.get("scenarios", {}).get(scenario)
+        if before is None:
+            print(f"  {scenario:<12} not in the baseline")
+            continue
+        for key, label, higher_is_better in COMPARED:
+            old, new = before[key], result[key]
+            if key == "429s":
+                # Counts, a few more 429s on a handful isn't a regression
+                worse = new > old + max(1, old * tolerance)
+            elif not old:
+                worse = False
+            else:
+                worse = new < old * (1 - tolerance) if higher_is_better else new > old * (1 + tolerance)
+            change = f"{(new - old) / old:+.0%}" if old else "n/a"
+            print(f"  {scenario:<12} {label:<7} {old:>10.3f} {new:>10.3f} {change:>8}{'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append((scenario, label))
+    return regressions
+
+
+async def bench_log_actions(harness, count):
+    moderation = harness.bot.get_cog("Moderation")
+    targets = harness.members(count)
+
+    async def log(member):
+        start = time.perf_counter()
+        await moderation.log_moderation_action("Warn", member, harness.owner, "benchmark")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(log(member) for member in targets))
+    return print_report(f"log_moderation_action x{count}", time.perf_counter() - start, latencies, harness.fake)
+
+
+async def bench_mass_ban(harness, count, offset):
+    targets = harness.members(offset + count)[offset:]
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(harness.invoke(f"!ban <@{member.id}> benchmark") for member in targets))
+    return print_report(f"mass ban x{count}", time.perf_counter() - start, latencies, harness.fake)
+
+
+async def bench_purge(harness, amount):
+    harness.fake.seed_messages(CHANNEL_ID, amount * 2, harness.fake.users[FIRST_MEMBER_ID])
+    start = time.perf_counter()
+    latency = await harness.invoke(f"!purge {amount}")
+    bulk = harness.fake.stats.get("bulk_delete")
+    deleted_after = bulk.last_at - start if bulk and bulk.last_at else float("nan")
+    return print_report(f"purge {amount}", time.perf_counter() - start, [latency], harness.fake,
+                 note=f", bulk delete done after {deleted_after:.2f}s (the command then waits 5s to delete its reply)")
+
+
+async def bench_broadcast(harness, members, bans, offset):
+    # Nobody is there to click Confirm
+    async def confirm(ctx, content, timeout=60.0, **kwargs):
+        return True
+    harness.bot.interactions.confirm = confirm
+
+    start = time.perf_counter()
+    broadcast = asyncio.create_task(harness.invoke("!broadcast Hello {user}, this is a benchmark."))
+
+    # Moderation while the broadcast runs, it should not wait behind the DMs
+    await asyncio.sleep(1.0)
+    targets = harness.members(offset + bans)[offset:]
+    ban_latencies = await asyncio.gather(*(harness.invoke(f"!ban <@{member.id}> during broadcast") for member in targets))
+    broadcast_latency = await broadcast
+    wall = time.perf_counter() - start
+
+    return print_report(
+        f"broadcast to {members} members, {bans} bans during it", wall, ban_latencies, harness.fake,
+        note=f", broadcast {broadcast_latency:.2f}s, {members / broadcast_latency:.1f} DMs/s"
+    )
+
+
+async def main(args):
+    fake = FakeDiscord()
+    for user_id, name in [(OWNER_ID, "owner")] + [(FIRST_MEMBER_ID + i, f"member{i}") for i in range(args.members)]:
+        fake.users[user_id] = fake.user(user_id, name)
+    base_url = await fake.start()
+
+    # bot.py reads config.json and writes bot.log in the working directory
+    report = os.path.abspath(args.report) if args.report else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    previous_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="g1-bench-")
+    os.chdir(workdir)
+    with open("config.json", "w") as f:
+        json.dump({
+            "token": "benchmark",
+            "prefix": "!",
+            "log_channel_id": str(LOG_CHANNEL_ID),
+            "sync_app_commands": False,
+        }, f)
+
+    import bot as bot_module
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+    discord.http.Route.BASE = base_url
+
+    bot = bot_module.bot
+    results = {}
+    try:
+        async with bot:
+            await bot_module.load_extensions(bot_module.discover_extensions())
+            await bot.login("benchmark")
+            guild = bot._connection._add_guild_from_data(guild_payload(fake, args.members))
+            harness = Harness(fake, bot, guild)
+            fake.stats.clear()
+            print(f"Fake Discord at {base_url}, {args.members} members, global limit {fake.global_limit}/s")
+
+            results["log_actions"] = await bench_log_actions(harness, args.logs)
+            results["mass_ban"] = await bench_mass_ban(harness, args.bans, offset=0)
+            results["purge"] = await bench_purge(harness, args.purge)
+            results["broadcast"] = await bench_broadcast(harness, args.members, args.bans, offset=args.bans)
+    finally:
+        await bot.web.close()
+        await fake.close()
+        bot_module.log_listener.stop()
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if report:
+        with open(report, "w") as f:
+            json.dump({"args": vars(args), "scenarios": results}, f, indent=2)
+        print(f"\nReport written to {report}")
+    if baseline is not None:
+        if baseline.get("args", {}).get("members") != args.members or baseline.get("args", {}).get("bans") != args.bans:
+            print("\nThe baseline was recorded with other --members or --bans, the numbers aren't comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): " + ", ".join(f"{scenario} {label}" for scenario, label in regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=50, help="guild members, all of them get the broadcast")
+    parser.add_argument("--bans", type=int, default=10, help="bans in the mass ban and during the broadcast")
+    parser.add_argument("--logs", type=int, default=20, help="log_moderation_action calls")
+    parser.add_argument("--purge", type=int, default=100, help="messages to purge")
+    parser.add_argument("--report", metavar="PATH", help="also write the results as JSON, to keep as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a report saved with --report")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed change against the baseline, 0.25 for 25%%")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,343 @@
+"""
+A local stand-in for the Discord REST API, for benchmarks
+
+Serves the routes the cogs use (messages, DMs, bans, kicks, timeouts, roles,
+reactions, bulk delete) from memory, with Discord-style rate limits: per-route
+buckets with X-RateLimit-* headers, a global limit, and 429 responses with
+retry_after when a client goes over (unless limits=False). Each request also
+waits a simulated network latency.
+
+Point discord.py at it by setting discord.http.Route.BASE to server.base_url
+before logging in. Every request is counted per route, with its latency and
+how many were rate limited, see FakeDiscord.report().
+"""
+import asyncio
+import datetime
+import json
+import random
+import re
+import time
+
+import discord
+from aiohttp import web
+
+API_PREFIX = "/api/v10"
+GLOBAL_LIMIT = 50          # requests per second across every route
+LATENCY = (0.02, 0.06)     # seconds of simulated network latency per request
+
+# (method, path pattern, bucket name, requests per window, window in seconds).
+# The bucket is shared per major parameter (channel or guild), like Discord's.
+ROUTES = (
+    ("GET", r"/users/@me", "me", 5, 1),
+    ("GET", r"/oauth2/applications/@me", "application", 5, 1),
+    ("POST", r"/users/@me/channels", "dm_create", 10, 10),
+    ("GET", r"/channels/(?P<channel_id>\d+)/messages", "history", 5, 5),
+    ("POST", r"/channels/(?P<channel_id>\d+)/messages", "send", 5, 5),
+    ("POST", r"/channels/(?P<channel_id>\d+)/messages/bulk-delete", "bulk_delete", 1, 1),
+    ("PATCH", r"/channels/(?P<channel_id>\d+)/messages/(?P<message_id>\d+)", "edit", 5, 5),
+    ("DELETE", r"/channels/(?P<channel_id>\d+)/messages/(?P<message_id>\d+)", "delete", 5, 1),
+    ("PUT", r"/channels/(?P<channel_id>\d+)/messages/(?P<message_id>\d+)/reactions/[^/]+/@me", "reaction", 1, 0.25),
+    ("PUT", r"/guilds/(?P<guild_id>\d+)/bans/(?P<user_id>\d+)", "ban", 5, 1),
+    ("DELETE", r"/guilds/(?P<guild_id>\d+)/bans/(?P<user_id>\d+)", "unban", 5, 1),
+    ("DELETE", r"/guilds/(?P<guild_id>\d+)/members/(?P<user_id>\d+)", "kick", 5, 1),
+    ("PATCH", r"/guilds/(?P<guild_id>\d+)/members/(?P<user_id>\d+)", "member_edit", 10, 10),
+    ("PUT", r"/guilds/(?P<guild_id>\d+)/members/(?P<user_id>\d+)/roles/(?P<role_id>\d+)", "role_add", 10, 10),
+    ("DELETE", r"/guilds/(?P<guild_id>\d+)/members/(?P<user_id>\d+)/roles/(?P<role_id>\d+)", "role_remove", 10, 10),
+)
+
+
+def json_response(payload, status=200, headers=None):
+    """
+    Like web.json_response, but shaped the way discord.py expects: it only
+    parses an exact application/json, and treats a 429 without a Via header
+    as a Cloudflare ban instead of a rate limit
+    """
+    headers = dict(headers or {})
+    headers["Content-Type"] = "application/json"
+    headers["Via"] = "1.1 google"
+    return web.Response(body=json.dumps(payload).encode(), status=status, headers=headers)
+
+
+class Bucket:
+    __slots__ = ("limit", "window", "remaining", "reset_at")
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def take(self, now):
+        """Whether a request may go now, refills once the window has passed"""
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+    def headers(self, name, now):
+        return {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": f"{time.time() + self.reset_at - now:.3f}",
+            "X-RateLimit-Reset-After": f"{max(0.0, self.reset_at - now):.3f}",
+            "X-RateLimit-Bucket": name,
+        }
+
+
+class RouteStats:
+    __slots__ = ("requests", "limited", "latencies", "last_at")
+
+    def __init__(self):
+        self.requests = 0
+        self.limited = 0
+        self.latencies = []
+        self.last_at = None
+
+
+class FakeDiscord:
+    """The server and its in-memory guild, channel, message and ban data"""
+
+    def __init__(self, global_limit=GLOBAL_LIMIT, latency=LATENCY, seed=1, limits=True):
+        self.global_limit = global_limit
+        self.limits = limits
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.routes = [(method, re.compile(API_PREFIX + pattern + "$"), name, limit, window)
+                       for method, pattern, name, limit, window in ROUTES]
+        self.buckets = {}
+        self.global_bucket = Bucket(global_limit, 1.0)
+        self.stats = {}
+
+        self.bot_user = self.user(900_000_000_000_000_001, "G1 Admin", bot=True)
+        self.users = {}
+        self.channels = {}           # channel ID -> list of message payloads, oldest first
+        self.dm_channels = {}        # user ID -> DM channel ID
+        self.bans = set()
+        self.member_edits = 0
+        self._next_id = discord.utils.time_snowflake(discord.utils.utcnow())
+
+        self.runner = None
+        self.base_url = None
+
+    def next_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    @staticmethod
+    def user(user_id, name, bot=False):
+        return {
+            "id": str(user_id),
+            "username": name,
+            "discriminator": "0",
+            "global_name": name,
+            "avatar": None,
+            "bot": bot,
+        }
+
+    def message(self, channel_id, content="", embeds=None, author=None, message_id=None):
+        return {
+            "id": str(message_id or self.next_id()),
+            "channel_id": str(channel_id),
+            "author": author or self.bot_user,
+            "content": content,
+            "timestamp": discord.utils.utcnow().isoformat(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": embeds or [],
+            "pinned": False,
+            "type": 0,
+        }
+
+    def seed_messages(self, channel_id, count, author):
+        """Fill a channel with recent messages, e.g. for purge"""
+        messages = self.channels.setdefault(int(channel_id), [])
+        for _ in range(count):
+            messages.append(self.message(channel_id, "spam", author=author))
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}{API_PREFIX}"
+        return self.base_url
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def _match(self, method, path):
+        for route_method, pattern, name, limit, window in self.routes:
+            if route_method == method:
+                match = pattern.match(path)
+                if match:
+                    return name, limit, window, match.groupdict()
+        return None, None, None, None
+
+    async def handle(self, request):
+        start = time.perf_counter()
+        name, limit, window, params = self._match(request.method, request.path)
+        if name is None:
+            return json_response({"message": "404: Not Found", "code": 0}, status=404)
+
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = RouteStats()
+        stats.requests += 1
+
+        await asyncio.sleep(self.rng.uniform(*self.latency))
+        now = time.monotonic()
+
+        if self.limits and not self.global_bucket.take(now):
+            stats.limited += 1
+            retry_after = max(0.0, self.global_bucket.reset_at - now)
+            return json_response(
+                {"message": "You are being rate limited.", "retry_after": retry_after, "global": True},
+                status=429,
+                headers={"Retry-After": f"{retry_after:.3f}", "X-RateLimit-Global": "true", "X-RateLimit-Scope": "global"}
+            )
+
+        major = params.get("channel_id") or params.get("guild_id") or ""
+        bucket_key = (name, major)
+        bucket = self.buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self.buckets[bucket_key] = Bucket(limit, window)
+        if self.limits and not bucket.take(now):
+            stats.limited += 1
+            retry_after = max(0.0, bucket.reset_at - now)
+            headers = bucket.headers(name, now)
+            headers.update({"Retry-After": f"{retry_after:.3f}", "X-RateLimit-Scope": "user"})
+            return json_response(
+                {"message": "You are being rate limited.", "retry_after": retry_after, "global": False},
+                status=429,
+                headers=headers
+            )
+
+        body = None
+        if request.can_read_body:
+            raw = await request.read()
+            if request.content_type == "application/json" and raw:
+                body = json.loads(raw)
+        status, payload = getattr(self, f"route_{name}")(params, body, request)
+
+        stats.latencies.append(time.perf_counter() - start)
+        stats.last_at = time.perf_counter()
+        headers = bucket.headers(name, now)
+        if payload is None:
+            return web.Response(status=status, headers=headers)
+        return json_response(payload, status=status, headers=headers)
+
+    # Route handlers, (status, JSON payload or None)
+
+    def route_me(self, params, body, request):
+        return 200, self.bot_user
+
+    def route_application(self, params, body, request):
+        return 200, {
+            "id": self.bot_user["id"],
+            "name": self.bot_user["username"],
+            "icon": None,
+            "description": "",
+            "bot_public": True,
+            "bot_require_code_grant": False,
+            "owner": self.user(900_000_000_000_000_002, "owner"),
+            "verify_key": "0" * 64,
+            "flags": 0,
+        }
+
+    def route_dm_create(self, params, body, request):
+        user_id = int(body["recipient_id"])
+        channel_id = self.dm_channels.get(user_id)
+        if channel_id is None:
+            channel_id = self.dm_channels[user_id] = self.next_id()
+        recipient = self.users.get(user_id) or self.user(user_id, f"user{user_id}")
+        return 200, {"id": str(channel_id), "type": 1, "recipients": [recipient], "last_message_id": None}
+
+    def route_history(self, params, body, request):
+        messages = self.channels.get(int(params["channel_id"]), [])
+        limit = int(request.query.get("limit", 50))
+        before = request.query.get("before")
+        if before is not None:
+            messages = [m for m in messages if int(m["id"]) < int(before)]
+        return 200, list(reversed(messages[-limit:]))
+
+    def route_send(self, params, body, request):
+        channel_id = int(params["channel_id"])
+        body = body or {}
+        message = self.message(channel_id, body.get("content") or "", body.get("embeds"))
+        self.channels.setdefault(channel_id, []).append(message)
+        return 200, message
+
+    def route_bulk_delete(self, params, body, request):
+        channel_id = int(params["channel_id"])
+        deleted = set(body["messages"])
+        self.channels[channel_id] = [m for m in self.channels.get(channel_id, []) if m["id"] not in deleted]
+        return 204, None
+
+    def route_edit(self, params, body, request):
+        channel_id = int(params["channel_id"])
+        for message in self.channels.get(channel_id, []):
+            if message["id"] == params["message_id"]:
+                message.update({k: v for k, v in (body or {}).items() if k in ("content", "embeds")})
+                message["edited_timestamp"] = discord.utils.utcnow().isoformat()
+                return 200, message
+        return 404, {"message": "Unknown Message", "code": 10008}
+
+    def route_delete(self, params, body, request):
+        channel_id = int(params["channel_id"])
+        messages = self.channels.get(channel_id, [])
+        self.channels[channel_id] = [m for m in messages if m["id"] != params["message_id"]]
+        return 204, None
+
+    def route_reaction(self, params, body, request):
+        return 204, None
+
+    def route_ban(self, params, body, request):
+        self.bans.add(int(params["user_id"]))
+        return 204, None
+
+    def route_unban(self, params, body, request):
+        self.bans.discard(int(params["user_id"]))
+        return 204, None
+
+    def route_kick(self, params, body, request):
+        return 204, None
+
+    def route_member_edit(self, params, body, request):
+        self.member_edits += 1
+        user_id = int(params["user_id"])
+        return 200, {
+            "user": self.users.get(user_id) or self.user(user_id, f"user{user_id}"),
+            "roles": [],
+            "joined_at": datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).isoformat(),
+            "deaf": False,
+            "mute": False,
+            "flags": 0,
+            "communication_disabled_until": (body or {}).get("communication_disabled_until"),
+        }
+
+    def route_role_add(self, params, body, request):
+        return 204, None
+
+    def route_role_remove(self, params, body, request):
+        return 204, None
+
+    def report(self):
+        """(route, requests, rate limited, p50, p95) for every route that was used"""
+        rows = []
+        for name, stats in sorted(self.stats.items()):
+            latencies = sorted(stats.latencies)
+            p50 = latencies[len(latencies) // 2] if latencies else 0.0
+            p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+            rows.append((name, stats.requests, stats.limited, p50, p95))
+        return rows
@@ -0,0 +1,429 @@
+"""
+Gateway event replay, for testing inbound throughput without Discord
+
+Run from the g1_admin_bot folder:
+    python benchmarks/gateway_replay.py raid [--joins 10000] [--seconds 60]
+    python benchmarks/gateway_replay.py chat [--events 20000] [--rate 500]
+    python benchmarks/gateway_replay.py reactions [--events 20000] [--rate 1000]
+    python benchmarks/gateway_replay.py file events.jsonl [--rate 0]
+    python benchmarks/gateway_replay.py raid --write raid.jsonl
+    python benchmarks/gateway_replay.py chat --rate 0 --event-loop uvloop --json orjson --report out.json
+
+Feeds gateway dispatch payloads straight into the connection state's
+parsers, the functions the gateway calls for every frame it reads, so the
+library's state and every cog listener run as they do in production, with
+no gateway connection. REST calls the handlers make go to
+benchmarks/fake_discord.py on localhost.
+
+Files are JSONL of dispatch frames, {"op": 0, "t": "MESSAGE_CREATE", "d": {...}},
+the way discord.py passes them to on_socket_raw_receive when
+enable_debug_events is on. GUILD_CREATE frames add their guild without
+requesting its members, and guilds that are referenced without one get a
+synthetic guild. --write saves a built-in scenario in the same format.
+Frames are kept as JSON text and decoded one at a time as the gateway
+does, with the codec the bot's json_backend picks.
+
+Reports the rate events were fed at, how fast decoding and the parsers alone can go,
+handler latency per event (from dispatch to the handler returning, so
+time spent waiting for the loop counts), handlers still running once the
+drain timeout is over, and the memory growth. --report also writes the
+summary as JSON, benchmarks/bench_backends.py uses it to compare backends.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BOT_DIR)
+
+import discord
+
+from benchmarks.fake_discord import FakeDiscord
+from utils import eventloop
+from utils.memory import process_rss
+from utils.polls import EMOJI_OPTIONS
+
+GUILD_ID = 810_000_000_000_000_001
+CHANNEL_ID = 810_000_000_000_000_002
+LOG_CHANNEL_ID = 810_000_000_000_000_003
+WELCOME_CHANNEL_ID = 810_000_000_000_000_004
+POLL_MESSAGE_ID = 810_000_000_000_000_005
+FIRST_MEMBER_ID = 710_000_000_000_000_000
+FIRST_JOIN_ID = 720_000_000_000_000_000
+
+YIELD_EVERY = 100     # events fed between loop turns when there is no rate limit
+COMMAND_SHARE = 0.02  # share of chat messages that are commands
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def now_iso():
+    return discord.utils.utcnow().isoformat()
+
+
+# Synthetic payloads
+
+def user_payload(user_id):
+    return {"id": str(user_id), "username": f"user{user_id % 1_000_000}", "discriminator": "0",
+            "global_name": None, "avatar": None, "bot": False}
+
+
+def member_payload(user_id):
+    return {"user": user_payload(user_id), "roles": [], "joined_at": now_iso(),
+            "deaf": False, "mute": False, "flags": 0, "pending": False}
+
+
+def guild_payload(guild_id, members, bot_user):
+    channels = [
+        {"id": str(CHANNEL_ID), "type": 0, "name": "general", "position": 0, "permission_overwrites": []},
+        {"id": str(LOG_CHANNEL_ID), "type": 0, "name": "bot-logs", "position": 1, "permission_overwrites": []},
+        {"id": str(WELCOME_CHANNEL_ID), "type": 0, "name": "welcome", "position": 2, "permission_overwrites": []},
+    ] if guild_id == GUILD_ID else []
+    member_list = [{"user": bot_user, "roles": [], "joined_at": now_iso(), "deaf": False, "mute": False, "flags": 0}]
+    member_list.extend(member_payload(FIRST_MEMBER_ID + i) for i in range(members))
+    return {
+        "id": str(guild_id), "name": f"Replay Guild {guild_id % 1000}", "icon": None, "owner_id": str(FIRST_MEMBER_ID),
+        "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False}],
+        "emojis": [], "stickers": [], "features": [], "channels": channels, "members": member_list,
+        "member_count": len(member_list), "verification_level": 0, "default_message_notifications": 0,
+        "explicit_content_filter": 0, "mfa_level": 0, "premium_tier": 0, "preferred_locale": "en-US", "nsfw_level": 0,
+    }
+
+
+def frame(event, data):
+    return {"op": 0, "t": event, "d": data}
+
+
+def raid_frames(joins):
+    """GUILD_MEMBER_ADD for joins new accounts"""
+    for i in range(joins):
+        data = member_payload(FIRST_JOIN_ID + i)
+        data["guild_id"] = str(GUILD_ID)
+        yield frame("GUILD_MEMBER_ADD", data)
+
+
+def chat_frames(events, members, seed=1):
+    """MESSAGE_CREATE from random members, a few of them commands"""
+    rng = random.Random(seed)
+    message_id = discord.utils.time_snowflake(discord.utils.utcnow())
+    for i in range(events):
+        author_id = FIRST_MEMBER_ID + rng.randrange(members)
+        content = "!roll 2d6" if rng.random() < COMMAND_SHARE else f"message {i} " + "lorem ipsum " * rng.randrange(1, 8)
+        yield frame("MESSAGE_CREATE", {
+            "id": str(message_id + i), "channel_id": str(CHANNEL_ID), "guild_id": str(GUILD_ID),
+            "author": user_payload(author_id), "member": {k: v for k, v in member_payload(author_id).items() if k != "user"},
+            "content": content, "timestamp": now_iso(), "edited_timestamp": None, "tts": False,
+            "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+            "pinned": False, "type": 0,
+        })
+
+
+def reaction_frames(events, members, options=4, seed=1):
+    """Number reactions on a poll, i.e. votes, with some votes taken back"""
+    rng = random.Random(seed)
+    for _ in range(events):
+        user_id = FIRST_MEMBER_ID + rng.randrange(members)
+        event = "MESSAGE_REACTION_REMOVE" if rng.random() < 0.1 else "MESSAGE_REACTION_ADD"
+        data = {
+            "user_id": str(user_id), "channel_id": str(CHANNEL_ID), "message_id": str(POLL_MESSAGE_ID),
+            "guild_id": str(GUILD_ID), "emoji": {"id": None, "name": EMOJI_OPTIONS[rng.randrange(options)]},
+            "burst": False, "type": 0,
+        }
+        if event == "MESSAGE_REACTION_ADD":
+            data["member"] = {k: v for k, v in member_payload(user_id).items() if k != "user"}
+            data["member"]["user"] = user_payload(user_id)
+        yield frame(event, data)
+
+
+def read_frames(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def write_frames(path, frames):
+    count = 0
+    with open(path, "w") as f:
+        for item in frames:
+            f.write(json.dumps(item, separators=(",", ":")) + "\n")
+            count += 1
+    return count
+
+
+# Replay
+
+class ReplayStats:
+    def __init__(self):
+        self.fed = collections.Counter()
+        self.skipped = collections.Counter()
+        self.decode_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.feed_seconds = 0.0
+        self.handlers = collections.defaultdict(list)  # event name -> seconds from dispatch to done
+        self.pending = set()
+        self.stopped = False  # handlers cancelled after the drain don't count
+
+
+def instrument(bot, stats):
+    """Time every event handler the bot schedules, from dispatch until it returns"""
+    run_event = bot._run_event
+
+    def schedule_event(coro, event_name, *args, **kwargs):
+        queued = time.perf_counter()
+
+        async def timed():
+            try:
+                await run_event(coro, event_name, *args, **kwargs)
+            finally:
+                if not stats.stopped:
+                    stats.handlers[event_name].append(time.perf_counter() - queued)
+
+        task = bot.loop.create_task(timed(), name=f"discord.py: {event_name}")
+        stats.pending.add(task)
+        task.add_done_callback(stats.pending.discard)
+        return task
+
+    bot._schedule_event = schedule_event
+
+
+def add_missing_guilds(state, frames, members, bot_user):
+    """Synthetic guilds for the guild IDs the frames use without a GUILD_CREATE"""
+    created = {int(f["d"]["id"]) for f in frames if f.get("t") == "GUILD_CREATE"}
+    referenced = {int(f["d"]["guild_id"]) for f in frames if isinstance(f.get("d"), dict) and f["d"].get("guild_id")}
+    for guild_id in sorted(referenced - created - {guild.id for guild in state.guilds}):
+        state._add_guild_from_data(guild_payload(guild_id, members, bot_user))
+
+
+async def feed(state, frames, rate, stats):
+    """Decode frames and hand them to the parsers, rate per second or as fast as possible when 0"""
+    parsers = state.parsers
+    # Looked up now, bot.py swaps in the codec json_backend picks
+    from_json = discord.utils._from_json
+    start = time.perf_counter()
+    for i, raw in enumerate(frames):
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif i % YIELD_EVERY == 0:
+            await asyncio.sleep(0)
+
+        decode_start = time.perf_counter()
+        item = from_json(raw)
+        stats.decode_seconds += time.perf_counter() - decode_start
+
+        event = item.get("t")
+        if item.get("op", 0) != 0 or event is None:
+            stats.skipped[event or f"op {item.get('op')}"] += 1
+            continue
+
+        parse_start = time.perf_counter()
+        if event == "GUILD_CREATE":
+            # The real parser would ask the gateway for the members
+            state._add_guild_from_data(item["d"])
+        else:
+            parser = parsers.get(event)
+            if parser is None:
+                stats.skipped[event] += 1
+                continue
+            parser(item["d"])
+        stats.parse_seconds += time.perf_counter() - parse_start
+        stats.fed[event] += 1
+    stats.feed_seconds = time.perf_counter() - start
+
+
+def print_report(name, stats, rate, memory, still_running, fake):
+    fed = sum(stats.fed.values())
+    print(f"\n{name}: {fed} events in {stats.feed_seconds:.2f}s, "
+          f"{fed / stats.feed_seconds if stats.feed_seconds else 0:.0f}/s fed"
+          + (f" (target {rate:.0f}/s)" if rate else "")
+          + f", decoding alone {fed / stats.decode_seconds if stats.decode_seconds else 0:.0f}/s"
+          + f", parsers alone {fed / stats.parse_seconds if stats.parse_seconds else 0:.0f}/s")
+    for event, count in sorted(stats.fed.items()):
+        print(f"  {event:<26} {count:>8}")
+    for event, count in sorted(stats.skipped.items()):
+        print(f"  {event:<26} {count:>8} skipped, no parser")
+
+    print(f"\n  {'handler':<26} {'runs':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for event, latencies in sorted(stats.handlers.items()):
+        print(f"  {event:<26} {len(latencies):>8} {percentile(latencies, 0.5) * 1000:>7.1f}ms "
+              f"{percentile(latencies, 0.95) * 1000:>7.1f}ms {percentile(latencies, 0.99) * 1000:>7.1f}ms "
+              f"{max(latencies) * 1000:>7.1f}ms")
+    if still_running:
+        print(f"  {still_running} handlers still running after the drain timeout, cancelled")
+
+    print()
+    for label, before, after in memory:
+        print(f"  {label:<26} {before / 1048576:>8.1f} MB -> {after / 1048576:.1f} MB ({(after - before) / 1048576:+.1f} MB)")
+
+    if fake.stats:
+        print(f"\n  {'route':<14} {'requests':>8} {'429s':>6}")
+        for route, requests, limited, p50, p95 in fake.report():
+            print(f"  {route:<14} {requests:>8} {limited:>6}")
+
+
+def loop_name():
+    """"uvloop" or "asyncio", whichever is running this"""
+    return type(asyncio.get_running_loop()).__module__.split(".")[0]
+
+
+def write_report(path, args, stats, memory, still_running, json_backend):
+    fed = sum(stats.fed.values())
+    latencies = [seconds for runs in stats.handlers.values() for seconds in runs]
+    summary = {
+        "scenario": args.scenario,
+        "event_loop": loop_name(),
+        "json_backend": json_backend,
+        "events": fed,
+        "fed_per_second": fed / stats.feed_seconds if stats.feed_seconds else 0,
+        "decode_per_second": fed / stats.decode_seconds if stats.decode_seconds else 0,
+        "parse_per_second": fed / stats.parse_seconds if stats.parse_seconds else 0,
+        "handler_p50": percentile(latencies, 0.5),
+        "handler_p99": percentile(latencies, 0.99),
+        "still_running": still_running,
+        "memory": {label: after - before for label, before, after in memory},
+    }
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+
+async def replay(args, frames, rate):
+    fake = FakeDiscord(limits=not args.no_limits, latency=(0.0, 0.0) if args.no_limits else (0.02, 0.06))
+    base_url = await fake.start()
+
+    # bot.py reads config.json and writes bot.log in the working directory
+    report = os.path.abspath(args.report) if args.report else None
+    os.chdir(tempfile.mkdtemp(prefix="g1-replay-"))
+    config = {
+        "token": "replay",
+        "prefix": "!",
+        "log_channel_id": str(LOG_CHANNEL_ID),
+        "welcome_channel_id": str(WELCOME_CHANNEL_ID),
+        "sync_app_commands": False,
+    }
+    if args.json:
+        config["json_backend"] = args.json
+    with open("config.json", "w") as f:
+        json.dump(config, f)
+    if args.member_cache:
+        os.environ["MEMBER_CACHE"] = args.member_cache
+
+    import bot as bot_module
+    logging.getLogger().setLevel(logging.WARNING)
+    # Every 429 would be logged, a raid against the real limits makes thousands
+    logging.getLogger("discord.http").setLevel(logging.ERROR)
+    discord.http.Route.BASE = base_url
+
+    bot = bot_module.bot
+    stats = ReplayStats()
+    try:
+        async with bot:
+            await bot_module.load_extensions(bot_module.discover_extensions())
+            await bot.login("replay")
+            state = bot._connection
+            state._add_guild_from_data(guild_payload(GUILD_ID, args.members, fake.bot_user))
+            add_missing_guilds(state, frames, args.members, fake.bot_user)
+            # The gateway hands over text, decoding it is part of every event's cost
+            frames = [json.dumps(item, separators=(",", ":")) for item in frames]
+            if args.scenario == "reactions":
+                bot.get_cog("Interactive").polls.create(
+                    POLL_MESSAGE_ID, CHANNEL_ID, GUILD_ID, "Replay poll", ["A", "B", "C", "D"], FIRST_MEMBER_ID
+                )
+            instrument(bot, stats)
+            fake.stats.clear()
+
+            guild = bot.get_guild(GUILD_ID)
+            members_before = len(guild.members)
+            if args.tracemalloc:
+                tracemalloc.start()
+            rss_before = process_rss() or 0
+
+            await feed(state, frames, rate, stats)
+            rss_fed = process_rss() or 0
+            heap_fed = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+
+            pending = set(stats.pending)
+            if pending:
+                await asyncio.wait(pending, timeout=args.drain)
+            still_running = len(stats.pending)
+            stats.stopped = True
+            for task in list(stats.pending):
+                task.cancel()
+
+            memory = [("RSS after feeding", rss_before, rss_fed), ("RSS after draining", rss_before, process_rss() or 0)]
+            if args.tracemalloc:
+                current, peak = tracemalloc.get_traced_memory()
+                memory += [("Python heap after feeding", 0, heap_fed), ("Python heap peak", 0, peak)]
+                tracemalloc.stop()
+
+            print(f"Replayed into {len(state.guilds)} guild(s), members cached {members_before} -> {len(guild.members)}, "
+                  f"member cache {bot.member_cache.mode}, REST rate limits {'off' if args.no_limits else 'on'}, "
+                  f"event loop {loop_name()}, JSON {bot_module.JSON_BACKEND}")
+            print_report(args.scenario, stats, rate, memory, still_running, fake)
+            if report:
+                write_report(report, args, stats, memory, still_running, bot_module.JSON_BACKEND)
+    finally:
+        await bot.web.close()
+        await fake.close()
+        bot_module.log_listener.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scenario", choices=["raid", "chat", "reactions", "file"])
+    parser.add_argument("path", nargs="?", help="JSONL file of dispatch frames, for the file scenario")
+    parser.add_argument("--events", type=int, default=20_000, help="events for chat and reactions")
+    parser.add_argument("--joins", type=int, default=10_000, help="joins in the raid")
+    parser.add_argument("--seconds", type=float, default=60.0, help="how long the raid lasts")
+    parser.add_argument("--rate", type=float, default=None, help="events per second, 0 for as fast as possible")
+    parser.add_argument("--members", type=int, default=1000, help="members in the synthetic guild")
+    parser.add_argument("--member-cache", choices=["full", "lazy", "minimal"], help="the bot's member_cache mode")
+    parser.add_argument("--drain", type=float, default=10.0, help="seconds to wait for handlers after feeding")
+    parser.add_argument("--no-limits", action="store_true", help="no REST rate limits or latency on the fake API")
+    parser.add_argument("--tracemalloc", action="store_true", help="also measure the Python heap, slows the run down")
+    parser.add_argument("--event-loop", choices=eventloop.BACKENDS, default="auto", help="the bot's event_loop setting")
+    parser.add_argument("--json", choices=["auto", "orjson", "json"], help="the bot's json_backend setting")
+    parser.add_argument("--report", metavar="PATH", help="also write the summary as JSON")
+    parser.add_argument("--write", metavar="PATH", help="save the scenario's frames as JSONL instead of replaying")
+    args = parser.parse_args()
+
+    if args.scenario == "raid":
+        frames = list(raid_frames(args.joins))
+        rate = args.rate if args.rate is not None else args.joins / args.seconds
+    elif args.scenario == "chat":
+        frames = list(chat_frames(args.events, args.members))
+        rate = args.rate if args.rate is not None else 500
+    elif args.scenario == "reactions":
+        frames = list(reaction_frames(args.events, args.members))
+        rate = args.rate if args.rate is not None else 1000
+    else:
+        if not args.path:
+            parser.error("the file scenario needs a path")
+        frames = list(read_frames(args.path))
+        rate = args.rate or 0
+
+    if args.write:
+        print(f"Wrote {write_frames(args.write, frames)} frames to {args.write}")
+        return
+    eventloop.run(replay(args, frames, rate), args.event_loop)
+
+
+if __name__ == "__main__":
+    main()
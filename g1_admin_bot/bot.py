@@ -1,11 +1,38 @@
+import ast
 import os
 import discord
+from discord import app_commands
 from discord.ext import commands
 import asyncio
+import importlib
 import logging
-import json
+import logging.handlers
+import queue
 import sys
 from dotenv import load_dotenv
+from utils.interactions import InteractionDispatcher
+from utils.scheduler import TimerWheel
+from utils.message_cache import MessageCache
+from utils.startup import StartupTimeline
+from utils.shards import AdminBot, ShardedAdminBot, load_shard_config
+from utils.cluster import ClusterClient
+from utils.member_cache import MemberCachePolicy, cache_options
+from utils.member_index import MemberIndex
+from utils.converters import AmbiguousMember
+from utils.metrics import BotMetrics
+from utils.perf import CommandTracer
+from utils.outbound import OutboundScheduler
+from utils.web import WebClient
+from utils.errors import ErrorDigest
+from utils.help_cache import HelpCache
+from utils.reloader import CogReloader
+from utils.app_sync import AppCommandSync
+from utils.memory import MemoryAccounting
+from utils.watchdog import LoopWatchdog
+from utils import eventloop, fastjson, outbound
+
+# Startup phases are timed from here and printed as a waterfall once the bot is ready
+startup = StartupTimeline()
 
 # Load environment variables from .env file if it exists
 load_dotenv()
@@ -13,15 +40,18 @@ load_dotenv()
 # Bot author information
 BOT_AUTHOR = "Made By Ilyes Abbas"
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Configure logging, records are written to the file and stdout by a background thread
+log_queue = queue.SimpleQueue()
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [logging.FileHandler("bot.log"), logging.StreamHandler(sys.stdout)]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+# The queue handler only merges args and tracebacks into the message, the listener's handlers do the formatting
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
 logger = logging.getLogger("g1_admin")
 
 # Load configuration
@@ -30,7 +60,7 @@ def load_config():
         # First check for config file
         if os.path.exists('config.json'):
             with open('config.json', 'r') as f:
-                config = json.load(f)
+                config = fastjson.load(f)
                 
             # Check for token in environment first (env var overrides config file)
             if os.getenv("BOT_TOKEN"):
@@ -48,7 +78,7 @@ def load_config():
                 "bot_author": BOT_AUTHOR
             }
             with open('config.json', 'w') as f:
-                json.dump(config, f, indent=4)
+                fastjson.dump(config, f, indent=4)
             logger.warning("Config file created. Please fill in your bot token and other settings.")
             return config
     except Exception as e:
@@ -62,21 +92,166 @@ def load_config():
             "bot_author": BOT_AUTHOR
         }
 
+startup.begin("config load")
 config = load_config()
+startup.end("config load")
+
+# orjson for gateway payloads and the bot's files, and uvloop, when installed and not turned off
+JSON_BACKEND = fastjson.use(os.getenv("JSON_BACKEND") or config.get("json_backend", "auto"))
+fastjson.patch_discord()
+EVENT_LOOP = eventloop.resolve(os.getenv("EVENT_LOOP") or config.get("event_loop", "auto"))
+logger.info(f"Event loop: {EVENT_LOOP}, JSON: {JSON_BACKEND}")
+
+# Cogs live next to this file, whatever the working directory is
+COGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cogs')
+
+# Cogs that others rely on while initialising (Settings publishes bot._config), loaded before the rest
+CORE_EXTENSIONS = ["settings"]
+
+# Non-critical cogs can wait until the bot is connected
+DEFERRED_EXTENSIONS = config.get("deferred_cogs", [])
 
 # Define bot intents
 intents = discord.Intents.default()
 intents.members = True  # For welcome messages and member tracking
 intents.message_content = True  # For command handling
 
-# Initialize bot with specified prefix and intents
-bot = commands.Bot(command_prefix=config.get("prefix", "!"), intents=intents)
+# Which members stay in memory: full, lazy or minimal (see utils/member_cache.py)
+MEMBER_CACHE_MODE = os.getenv("MEMBER_CACHE") or config.get("member_cache", "full")
+
+# Initialize bot with specified prefix and intents, sharded when configured
+sharded, shard_count, shard_ids = load_shard_config(config)
+if sharded:
+    bot = ShardedAdminBot(
+        command_prefix=config.get("prefix", "!"),
+        intents=intents,
+        shard_count=shard_count,
+        shard_ids=shard_ids,
+        **cache_options(MEMBER_CACHE_MODE)
+    )
+    logger.info(f"Sharded mode: shard count {shard_count or 'auto'}, shards {shard_ids or 'all'}")
+else:
+    bot = AdminBot(command_prefix=config.get("prefix", "!"), intents=intents, **cache_options(MEMBER_CACHE_MODE))
 bot.author = BOT_AUTHOR
 
+# Shared confirmation/interaction dispatcher used by the cogs
+bot.interactions = InteractionDispatcher(bot)
+
+# One timer wheel drives every periodic update (countdowns etc.) instead of a loop per task
+bot.timers = TimerWheel()
+
+# Recently seen messages, so quoting doesn't need an API call
+bot.message_cache = MessageCache(
+    bot,
+    max_entries=int(config.get("message_cache_size", 50000)),
+    max_bytes=int(config.get("message_cache_mb", 32)) * 1024 * 1024
+)
+
+# Broadcasts and other mass actions get full member lists through this
+bot.member_cache = MemberCachePolicy(
+    bot,
+    MEMBER_CACHE_MODE,
+    keep_role_ids=config.get("member_cache_role_ids", []),
+    ttl=int(config.get("member_cache_ttl", 3600))
+)
+if MEMBER_CACHE_MODE != "full":
+    logger.info(f"Member cache mode: {MEMBER_CACHE_MODE}")
+
+# Cached members' names, indexed per guild for the member converter and !whois
+bot.member_index = MemberIndex(bot)
+
+# All Discord API requests go through priority lanes: moderation, replies, log channel, bulk
+bot.outbound = OutboundScheduler(bot, capacity=int(config.get("outbound_concurrency", 8)))
+bot.outbound.install()
+
+# Prometheus metrics, served on metrics_port when it is set
+bot.metrics = BotMetrics(bot)
+bot.metrics.registry.add_collector(lambda: bot.metrics.queue_depth.set(log_queue.qsize(), "logging"))
+
+# One pooled HTTP session for downloads (avatars, attachments), with size caps and a small URL cache
+bot.web = WebClient(
+    max_connections=int(config.get("web_max_connections", 20)),
+    timeout=float(config.get("web_timeout", 30))
+)
+
+async def send_to_log_channel(embed):
+    if not config.get("log_channel_id"):
+        return
+    try:
+        log_channel = bot.get_channel(int(config.get("log_channel_id")))
+        if log_channel:
+            with outbound.lane(outbound.LOG, log_channel.guild.id):
+                await log_channel.send(embed=embed)
+    except Exception as e:
+        logger.error(f"Failed to log error to channel: {e}")
+
+# Command errors are fingerprinted, repeats are posted to the log channel as a digest per window
+bot.error_digest = ErrorDigest(bot, send_to_log_channel, window=int(config.get("error_digest_window", 300)))
+
+# !reload swaps cogs in place, cogs pick up their previous instance's state from it
+bot.reloader = CogReloader(bot)
+
+# Slash commands are only synced when they changed, and by one worker per cluster
+bot.app_sync = AppCommandSync(
+    bot,
+    config.get("app_command_hash_file", "app_commands.json"),
+    config.get("app_command_guilds", []),
+    enabled=config.get("sync_app_commands", True) and os.getenv("CLUSTER_ID", "0") == "0"
+)
+
+# Every command is timed through checks, conversion, body and HTTP, !perf shows the results
+bot.perf = CommandTracer(bot)
+
+# Approximate sizes of what each cog and the library keep in memory, !mem and metrics show them.
+# tracemalloc can also be started with PYTHONTRACEMALLOC=1, which catches allocations made at import
+bot.memory = MemoryAccounting(
+    bot,
+    interval=int(config.get("memory_report_interval", 300)),
+    trace_frames=int(config.get("tracemalloc_frames", 1))
+)
+if config.get("tracemalloc"):
+    bot.memory.start_tracing()
+
+# A thread that notices when something blocks the event loop and records where, !lag shows the worst offenders
+bot.watchdog = LoopWatchdog(threshold=float(config.get("loop_stall_threshold", 0.25)))
+bot.watchdog.on_stall.append(bot.metrics.observe_stall)
+
+# Set by launcher.py when this process is one worker of a cluster, cogs register their cross-shard queries on it
+CLUSTER_SOCKET = os.getenv("CLUSTER_SOCKET")
+bot.cluster = ClusterClient(CLUSTER_SOCKET, os.getenv("CLUSTER_ID", "0")) if CLUSTER_SOCKET else None
+
+# Command timing hooks, the check_once runs before any other check
+@bot.check_once
+async def start_command_timing(ctx):
+    bot.perf.begin(ctx)
+    return True
+
+@bot.before_invoke
+async def command_body_started(ctx):
+    bot.perf.body_started(ctx)
+
+@bot.after_invoke
+async def command_finished(ctx):
+    bot.perf.finish(ctx)
+
 # Bot events
+@bot.event
+async def on_connect():
+    # READY has arrived, the library now chunks guild members before on_ready
+    if startup.end("gateway connect"):
+        startup.begin("member chunking")
+
 @bot.event
 async def on_ready():
     logger.info(f'{bot.user.name} has connected to Discord!')
+    
+    # Only the first READY after startup, not reconnects
+    if startup.end("member chunking"):
+        if DEFERRED_EXTENSIONS:
+            asyncio.create_task(load_deferred_extensions())
+        else:
+            startup.log_report()
+            
     await bot.change_presence(activity=discord.Game(name=f"{config.get('prefix', '!')}help | {BOT_AUTHOR}"))
     
     # Log to log channel if configured
@@ -102,24 +277,46 @@ async def on_command_error(ctx, error):
         await ctx.send(f"Missing required argument. Please check `{config.get('prefix', '!')}help {ctx.command.name}`")
     elif isinstance(error, commands.MissingPermissions):
         await ctx.send("You don't have permission to use this command.")
+    elif isinstance(error, commands.CommandOnCooldown):
+        await ctx.send(f"Slow down, you can use this command again in {error.retry_after:.0f}s.")
+    elif isinstance(error, AmbiguousMember):
+        # Not a failure, the member has to say which one they meant
+        if not ctx.command.has_error_handler():
+            await ctx.send(str(error), allowed_mentions=discord.AllowedMentions.none())
     else:
-        logger.error(f"Command error: {error}")
-        await ctx.send(f"An error occurred: {error}")
+        # Repeats of the same error are counted and go out in a digest, not one post each
+        stats, first = bot.error_digest.record(ctx, error)
+        if first:
+            logger.error(f"Command error: {error}")
+        else:
+            logger.debug(f"Command error {stats.key} repeated ({stats.total} total): {error}")
+        
+        if bot.error_digest.should_reply(stats.key, ctx.author.id):
+            await ctx.send(f"An error occurred: {error}")
         
         # Log to log channel if configured
-        if config.get("log_channel_id"):
-            try:
-                log_channel = bot.get_channel(int(config.get("log_channel_id")))
-                if log_channel:
-                    error_embed = discord.Embed(
-                        title=f"⚠️ Error: Command `{ctx.command.name}` failed",
-                        description=f"```{error}```",
-                        color=discord.Color.red()
-                    )
-                    error_embed.set_footer(text=BOT_AUTHOR)
-                    await log_channel.send(embed=error_embed)
-            except Exception as e:
-                logger.error(f"Failed to log error to channel: {e}")
+        if first:
+            error_embed = discord.Embed(
+                title=f"⚠️ Error: Command `{ctx.command.name}` failed",
+                description=f"```{error}```",
+                color=discord.Color.red()
+            )
+            error_embed.set_footer(text=f"{BOT_AUTHOR} | {stats.key}")
+            await send_to_log_channel(error_embed)
+
+# Errors from the slash-only commands, hybrid commands report through on_command_error
+@bot.tree.error
+async def on_app_command_error(interaction, error):
+    if isinstance(error, app_commands.MissingPermissions):
+        message = "You don't have permission to use this command."
+    else:
+        logger.error(f"Slash command error: {error}")
+        message = f"An error occurred: {error}"
+    
+    if interaction.response.is_done():
+        await interaction.followup.send(message, ephemeral=True)
+    else:
+        await interaction.response.send_message(message, ephemeral=True)
 
 # Modify help command to include author info
 class CustomHelpCommand(commands.DefaultHelpCommand):
@@ -127,9 +324,15 @@ class CustomHelpCommand(commands.DefaultHelpCommand):
         ctx = self.context
         destination = ctx.author if self.dm_help else ctx
         
+        # Running every command's checks is the slow part, members with the same permissions share the result
+        key = await bot.help_cache.key(ctx)
+        embed = await bot.help_cache.get(key, lambda: self.render_bot_help(mapping))
+        await destination.send(embed=embed)
+        
+    async def render_bot_help(self, mapping):
         embed = discord.Embed(
             title="G1 Admin Bot Help",
-            description="Here are all available commands:",
+            description=f"Here are all available commands:\nType `{self.context.clean_prefix}help <command>` for details.",
             color=discord.Color.blue()
         )
         
@@ -141,7 +344,7 @@ class CustomHelpCommand(commands.DefaultHelpCommand):
                 embed.add_field(name=name, value=value, inline=False)
                 
         embed.set_footer(text=BOT_AUTHOR)
-        await destination.send(embed=embed)
+        return embed
         
     async def send_command_help(self, command):
         embed = discord.Embed(
@@ -159,33 +362,126 @@ class CustomHelpCommand(commands.DefaultHelpCommand):
         destination = self.get_destination()
         await destination.send(embed=embed)
 
-# Set custom help command
+# Set custom help command, its embeds are cached per permission tier
+bot.help_cache = HelpCache(bot)
 bot.help_command = CustomHelpCommand()
 
 # Load all cogs
-async def load_extensions():
-    for filename in os.listdir('./cogs'):
-        if filename.endswith('.py'):
-            try:
-                await bot.load_extension(f'cogs.{filename[:-3]}')
-                logger.info(f'Loaded extension: {filename[:-3]}')
-            except Exception as e:
-                logger.error(f'Failed to load extension {filename}: {e}')
+def discover_extensions():
+    return sorted(filename[:-3] for filename in os.listdir(COGS_DIR) if filename.endswith('.py'))
+
+def cog_dependencies(name):
+    """The modules a cog imports at the top of its file, read from the source without running it"""
+    with open(os.path.join(COGS_DIR, f'{name}.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules.append(node.module)
+    return [module for module in modules if module not in sys.modules and not module.startswith('cogs.')]
+
+def import_dependencies(name):
+    for module in cog_dependencies(name):
+        try:
+            importlib.import_module(module)
+        except Exception:
+            # load_extension reports it with the cog's name
+            pass
+
+async def load_extension_timed(name):
+    module = f'cogs.{name}'
+    start = startup.now()
+    try:
+        # Import the cog's dependencies in a worker thread so they load side by side,
+        # load_extension then runs the cog module, once, and its setup()
+        await asyncio.to_thread(import_dependencies, name)
+        dependencies = startup.now()
+        await bot.load_extension(module)
+        bot.perf.instrument()
+        done = startup.now()
+        imported = bot.extension_imported.pop(module, startup.origin + dependencies) - startup.origin
+        
+        startup.span(f"  import {name}", start, imported)
+        startup.span(f"  setup {name}", imported, done)
+        logger.info(f'Loaded extension: {name} (import {(imported - start) * 1000:.0f}ms, '
+                    f'{(dependencies - start) * 1000:.0f}ms of it dependencies, setup {(done - imported) * 1000:.0f}ms)')
+    except Exception as e:
+        logger.error(f'Failed to load extension {name}: {e}')
+
+async def load_extensions(names):
+    core = [name for name in names if name in CORE_EXTENSIONS]
+    independent = [name for name in names if name not in CORE_EXTENSIONS]
+    
+    for name in core:
+        await load_extension_timed(name)
+    await asyncio.gather(*(load_extension_timed(name) for name in independent))
+
+async def load_deferred_extensions():
+    startup.begin("deferred cogs")
+    await load_extensions([name for name in discover_extensions() if name in DEFERRED_EXTENSIONS])
+    startup.end("deferred cogs")
+    startup.log_report()
+    await sync_app_commands()
+
+async def sync_app_commands():
+    try:
+        await bot.app_sync.sync()
+    except Exception as e:
+        logger.error(f"Application command sync failed: {e}")
 
 async def main():
     async with bot:
-        await load_extensions()
-        await bot.start(config["token"])
+        startup.begin("cog loading")
+        await load_extensions([name for name in discover_extensions() if name not in DEFERRED_EXTENSIONS])
+        startup.end("cog loading")
+        
+        if bot.cluster:
+            try:
+                await bot.cluster.connect()
+            except OSError as e:
+                logger.error(f"Could not reach the cluster launcher at {CLUSTER_SOCKET}: {e}")
+        
+        startup.begin("login")
+        await bot.login(config["token"])
+        startup.end("login")
+        
+        # With deferred cogs the tree is only complete once they're loaded too
+        if not DEFERRED_EXTENSIONS:
+            asyncio.create_task(sync_app_commands())
+        
+        bot.metrics.start()
+        bot.watchdog.start(asyncio.get_running_loop())
+        metrics_runner = None
+        metrics_port = os.getenv("METRICS_PORT") or config.get("metrics_port")
+        if metrics_port:
+            # Cluster workers each take the next port up
+            metrics_port = int(metrics_port) + int(os.getenv("CLUSTER_ID", "0"))
+            metrics_runner = await bot.metrics.serve(config.get("metrics_host", "127.0.0.1"), metrics_port)
+        
+        startup.begin("gateway connect")
+        try:
+            await bot.connect()
+        finally:
+            bot.metrics.stop()
+            bot.watchdog.stop()
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+            await bot.web.close()
 
 # Run the bot
 if __name__ == "__main__":
     if not config.get("token"):
         logger.error("Bot token not found in config.json or environment variables. Please add your token and restart the bot.")
+        log_listener.stop()
         sys.exit(1)
     
     try:
-        asyncio.run(main())
+        eventloop.run(main(), EVENT_LOOP)
     except KeyboardInterrupt:
         logger.info("Bot shutdown initiated by user")
     except Exception as e:
-        logger.error(f"Fatal error: {e}") 
\ No newline at end of file
+        logger.error(f"Fatal error: {e}")
+    finally:
+        log_listener.stop() 
\ No newline at end of file
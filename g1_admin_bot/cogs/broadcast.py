@@ -1,13 +1,42 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 import logging
 import asyncio
+import time
+from utils import outbound
+from utils.converters import MemberLookup
+from utils.memory import deep_sizeof
 
 logger = logging.getLogger("g1_admin.broadcast")
 
 class Broadcast(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Guild ID -> progress of the broadcast running there, reported across the cluster.
+        # Broadcasts keep running through a !reload, so the new instance shares the dict
+        state = self.bot.reloader.state_for(self.qualified_name)
+        self.active = state["active"] if state else {}
+        self.bot.metrics.registry.add_collector(self.collect_metrics)
+        self.bot.memory.add_reporter(self.qualified_name, self.memory_sizes)
+        
+    def export_state(self):
+        return {"active": self.active}
+        
+    def cog_unload(self):
+        self.bot.metrics.registry.remove_collector(self.collect_metrics)
+        self.bot.memory.remove_reporter(self.qualified_name)
+        
+    def collect_metrics(self):
+        remaining = sum(b["total"] - b["sent"] - b["failed"] for b in self.active.values())
+        self.bot.metrics.queue_depth.set(remaining, "broadcast")
+        
+    def memory_sizes(self):
+        return {"broadcasts": deep_sizeof(self.active, shared=[self.bot])}
+        
+    def broadcast_status(self):
+        """Progress of every running broadcast in this process"""
+        return list(self.active.values())
         
     async def cog_check(self, ctx):
         """Check if user has admin permissions for all commands in this cog"""
@@ -32,7 +61,8 @@ class Broadcast(commands.Cog):
             
         return is_admin
     
-    @commands.command(name="broadcast")
+    @commands.hybrid_command(name="broadcast")
+    @app_commands.default_permissions(administrator=True)
     async def broadcast_message(self, ctx, *, message=None):
         """
         Broadcast a message to all members of the server
@@ -49,104 +79,129 @@ class Broadcast(commands.Cog):
             await ctx.send("Please provide a message to broadcast.")
             return
             
-        # Confirmation message
-        confirm_msg = await ctx.send(f"Are you sure you want to send this message to all members?\n"
-                                    f"```{message}```\n"
-                                    f"Variables like {{user}} will be replaced with the member's mention.\n"
-                                    f"React with ✅ to confirm or ❌ to cancel.")
-        
-        # Add reaction options
-        await confirm_msg.add_reaction("✅")
-        await confirm_msg.add_reaction("❌")
-        
-        def check(reaction, user):
-            return user == ctx.author and str(reaction.emoji) in ["✅", "❌"] and reaction.message.id == confirm_msg.id
+        # Confirmation prompt with buttons
+        confirmed = await self.bot.interactions.confirm(
+            ctx,
+            f"Are you sure you want to send this message to all members?\n"
+            f"```{message}```\n"
+            f"Variables like {{user}} will be replaced with the member's mention.",
+            timeout=60.0
+        )
+        
+        if confirmed is None:
+            await ctx.send("Broadcast cancelled - you didn't respond in time.")
+            return
+            
+        if not confirmed:
+            await ctx.send("Broadcast cancelled.")
+            return
             
+        # Start broadcasting
+        status_message = await ctx.send("Broadcasting message... 0% complete")
+        
+        # Downloads the member list first if the cache doesn't hold all of it
+        members = await self.bot.member_cache.acquire(ctx.guild)
+        success_count = 0
+        fail_count = 0
+        progress_key = ("broadcast", status_message.id)
         try:
-            reaction, user = await self.bot.wait_for('reaction_add', timeout=60.0, check=check)
+            status = {
+                "guild": ctx.guild.name,
+                "guild_id": ctx.guild.id,
+                "started_by": str(ctx.author),
+                "started_at": time.time(),
+                "sent": 0,
+                "failed": 0,
+                "total": sum(1 for member in members if not member.bot)
+            }
+            self.active[ctx.guild.id] = status
             
-            if str(reaction.emoji) == "❌":
-                await ctx.send("Broadcast cancelled.")
-                return
-                
-            if str(reaction.emoji) == "✅":
-                # Start broadcasting
-                status_message = await ctx.send("Broadcasting message... 0% complete")
-                
-                members = ctx.guild.members
-                success_count = 0
-                fail_count = 0
-                
-                # Log to bot's log channel if configured
-                log_channel_id = getattr(self.bot, "log_channel_id", None)
-                log_channel = None
-                if log_channel_id:
-                    log_channel = self.bot.get_channel(int(log_channel_id))
-                    if log_channel:
-                        log_embed = discord.Embed(
-                            title="📣 Broadcast Initiated",
-                            description=f"Broadcast initiated by {ctx.author.mention}\nMessage: ```{message}```",
-                            color=discord.Color.blue()
-                        )
-                        log_embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
+            # Log to bot's log channel if configured
+            log_channel_id = getattr(self.bot, "log_channel_id", None)
+            log_channel = None
+            if log_channel_id:
+                log_channel = self.bot.get_channel(int(log_channel_id))
+                if log_channel:
+                    log_embed = discord.Embed(
+                        title="📣 Broadcast Initiated",
+                        description=f"Broadcast initiated by {ctx.author.mention}\nMessage: ```{message}```",
+                        color=discord.Color.blue()
+                    )
+                    log_embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
+                    with outbound.lane(outbound.LOG, ctx.guild.id):
                         await log_channel.send(embed=log_embed)
-                
-                # Send DMs with progress updates
-                for i, member in enumerate(members):
-                    if member.bot:
-                        continue
-                        
-                    try:
-                        # Format message with member variables
-                        formatted_message = message.replace("{user}", member.mention)
-                        formatted_message = formatted_message.replace("{username}", member.display_name)
-                        formatted_message = formatted_message.replace("{server}", ctx.guild.name)
-                        
-                        # Create embed for DM
-                        embed = discord.Embed(
-                            title=f"Announcement from {ctx.guild.name}",
-                            description=formatted_message,
-                            color=discord.Color.blue()
-                        )
-                        embed.set_footer(text=f"Sent by {ctx.author} | {getattr(self.bot, 'author', 'G1 Admin')}")
-                        if ctx.guild.icon:
-                            embed.set_thumbnail(url=ctx.guild.icon.url)
-                        
+            
+            # Send DMs with progress updates
+            for i, member in enumerate(members):
+                if member.bot:
+                    continue
+                    
+                try:
+                    # Format message with member variables
+                    formatted_message = message.replace("{user}", member.mention)
+                    formatted_message = formatted_message.replace("{username}", member.display_name)
+                    formatted_message = formatted_message.replace("{server}", ctx.guild.name)
+                    
+                    # Create embed for DM
+                    embed = discord.Embed(
+                        title=f"Announcement from {ctx.guild.name}",
+                        description=formatted_message,
+                        color=discord.Color.blue()
+                    )
+                    embed.set_footer(text=f"Sent by {ctx.author} | {getattr(self.bot, 'author', 'G1 Admin')}")
+                    if ctx.guild.icon:
+                        embed.set_thumbnail(url=ctx.guild.icon.url)
+                    
+                    # Bulk lane, so moderation and replies go first while this runs
+                    with outbound.lane(outbound.BULK, ctx.guild.id):
                         await member.send(embed=embed)
-                        success_count += 1
-                    except Exception as e:
-                        logger.error(f"Failed to send DM to {member}: {e}")
-                        fail_count += 1
-                        
-                    # Update progress every 5 members or at the end
-                    if (i + 1) % 5 == 0 or i == len(members) - 1:
-                        progress = int((i + 1) / len(members) * 100)
-                        await status_message.edit(content=f"Broadcasting message... {progress}% complete")
-                        await asyncio.sleep(0.5)  # Rate limiting prevention
-                
-                # Final report
-                result_embed = discord.Embed(
-                    title="📣 Broadcast Complete",
-                    description=f"Message sent to {success_count} members. Failed: {fail_count}.",
-                    color=discord.Color.green()
-                )
-                result_embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
-                await ctx.send(embed=result_embed)
-                
-                if log_channel:
-                    complete_embed = discord.Embed(
-                        title="✅ Broadcast Complete",
-                        description=f"Sent to {success_count} members. Failed: {fail_count}.",
-                        color=discord.Color.green()
+                    success_count += 1
+                    status["sent"] = success_count
+                    self.bot.metrics.broadcast_messages.inc("sent")
+                except Exception as e:
+                    logger.error(f"Failed to send DM to {member}: {e}")
+                    fail_count += 1
+                    status["failed"] = fail_count
+                    self.bot.metrics.broadcast_messages.inc("failed")
+                    
+                # Update progress every 5 members or at the end
+                if (i + 1) % 5 == 0 or i == len(members) - 1:
+                    progress = int((i + 1) / len(members) * 100)
+                    # Progress edits are merged, or dropped while more important requests wait
+                    self.bot.outbound.update(
+                        progress_key,
+                        lambda content=f"Broadcasting message... {progress}% complete": status_message.edit(content=content),
+                        final=(i == len(members) - 1),
+                        guild_id=ctx.guild.id
                     )
-                    complete_embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
-                    await log_channel.send(embed=complete_embed)
+                    await asyncio.sleep(0.5)  # Rate limiting prevention
+        finally:
+            self.active.pop(ctx.guild.id, None)
+            self.bot.member_cache.release(ctx.guild)
+            await self.bot.outbound.flush(progress_key)
         
-        except asyncio.TimeoutError:
-            await ctx.send("Broadcast cancelled - you didn't respond in time.")
+        # Final report
+        result_embed = discord.Embed(
+            title="📣 Broadcast Complete",
+            description=f"Message sent to {success_count} members. Failed: {fail_count}.",
+            color=discord.Color.green()
+        )
+        result_embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
+        await ctx.send(embed=result_embed)
+        
+        if log_channel:
+            complete_embed = discord.Embed(
+                title="✅ Broadcast Complete",
+                description=f"Sent to {success_count} members. Failed: {fail_count}.",
+                color=discord.Color.green()
+            )
+            complete_embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
+            with outbound.lane(outbound.LOG, ctx.guild.id):
+                await log_channel.send(embed=complete_embed)
     
-    @commands.command(name="dmuser")
-    async def dm_user(self, ctx, user: discord.Member, *, message=None):
+    @commands.hybrid_command(name="dmuser")
+    @app_commands.default_permissions(administrator=True)
+    async def dm_user(self, ctx, user: MemberLookup, *, message=None):
         """
         Send a direct message to a specific user
         
@@ -0,0 +1,391 @@
+import discord
+from discord.ext import commands
+import logging
+import os
+import time
+from utils.cluster import summarise_stats
+from utils.shards import format_shard_ids
+from utils.perf import PHASES, format_seconds
+from utils.memory import format_bytes, short_path
+
+logger = logging.getLogger("g1_admin.diagnostics")
+
+class Diagnostics(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        
+        # Answer other workers' cross-shard queries when running under launcher.py
+        if getattr(bot, "cluster", None):
+            bot.cluster.register("stats", self.cluster_stats)
+            
+    def cog_unload(self):
+        if getattr(self.bot, "cluster", None):
+            self.bot.cluster.unregister("stats")
+            
+    def cluster_stats(self, args=None):
+        """This process's share of the global stats, as sent over the cluster IPC"""
+        report = self.bot.shard_report()
+        latencies = [latency for _, latency, *_ in report if latency == latency and latency != float("inf")]
+        broadcast = self.bot.get_cog("Broadcast")
+        
+        return {
+            "shards": self.bot.local_shard_ids or [shard_id for shard_id, *_ in report],
+            "guilds": len(self.bot.guilds),
+            "members": sum(guild.member_count or 0 for guild in self.bot.guilds),
+            "latency": max(latencies) if latencies else None,
+            "events_per_second": sum(rate for _, _, rate, *_ in report),
+            "broadcasts": broadcast.broadcast_status() if broadcast else [],
+            "pid": os.getpid()
+        }
+        
+    async def cog_check(self, ctx):
+        """Check if user is the bot owner or an administrator for all commands in this cog"""
+        if ctx.guild is None:
+            return False
+            
+        is_owner = await self.bot.is_owner(ctx.author)
+        is_admin = ctx.author.guild_permissions.administrator
+        
+        if not (is_owner or is_admin):
+            await ctx.send("Only the bot owner or server administrators can use this command.")
+            
+        return is_owner or is_admin
+    
+    @commands.command(name="shards")
+    @commands.is_owner()
+    async def show_shards(self, ctx):
+        """
+        Show gateway latency, event rate and reconnects for each shard
+        
+        Usage: !shards
+        """
+        report = self.bot.shard_report()
+        
+        embed = discord.Embed(
+            title="Shard Health",
+            description=f"This server is on shard {ctx.guild.shard_id}. "
+                        f"Shard count: {self.bot.shard_count or 1}",
+            color=discord.Color.blue()
+        )
+        
+        # Embeds hold at most 25 fields
+        for shard_id, latency, rate, events, reconnects, guilds, status in report[:25]:
+            latency_text = f"{latency * 1000:.0f} ms" if latency == latency and latency != float("inf") else "n/a"
+            embed.add_field(
+                name=f"Shard {shard_id} ({status})",
+                value=f"Latency: {latency_text}\n"
+                      f"Events: {rate:.1f}/s ({events:,} total)\n"
+                      f"Reconnects: {reconnects}\n"
+                      f"Guilds: {guilds:,}",
+                inline=True
+            )
+            
+        if len(report) > 25:
+            embed.set_footer(text=f"Showing 25 of {len(report)} shards")
+            
+        await ctx.send(embed=embed)
+        
+    @commands.command(name="cluster")
+    @commands.is_owner()
+    async def show_cluster(self, ctx):
+        """
+        Show guilds, events and running broadcasts across every worker process
+        
+        Usage: !cluster
+        """
+        cluster = getattr(self.bot, "cluster", None)
+        if cluster and cluster.connected:
+            try:
+                results = await cluster.request("stats")
+            except Exception as e:
+                logger.error(f"Cluster stats query failed: {e}")
+                await ctx.send("Couldn't reach the other workers, try again in a moment.")
+                return
+        else:
+            # Not clustered, this process is the whole bot
+            results = {"0": self.cluster_stats()}
+            
+        totals = summarise_stats(results)
+        
+        embed = discord.Embed(
+            title="Cluster Overview",
+            description=f"Workers online: {totals['online']}/{totals['clusters']}\n"
+                        f"Guilds: {totals['guilds']:,}\n"
+                        f"Members: {totals['members']:,}\n"
+                        f"Events: {totals['events_per_second']:.1f}/s",
+            color=discord.Color.blue()
+        )
+        
+        # One field per worker plus the broadcasts field, embeds hold at most 25
+        workers = sorted(results.items(), key=lambda item: int(item[0]))
+        for cluster_id, stats in workers[:24]:
+            if not stats:
+                embed.add_field(name=f"Worker {cluster_id}", value="Not responding", inline=True)
+                continue
+                
+            latency = stats.get("latency")
+            latency_text = f"{latency * 1000:.0f} ms" if latency is not None else "n/a"
+            embed.add_field(
+                name=f"Worker {cluster_id}",
+                value=f"Shards: {format_shard_ids(stats.get('shards', []))}\n"
+                      f"Guilds: {stats.get('guilds', 0):,}\n"
+                      f"Latency: {latency_text}",
+                inline=True
+            )
+            
+        broadcasts = totals["broadcasts"]
+        if broadcasts:
+            lines = [
+                f"{b['guild']}: {b['sent'] + b['failed']:,}/{b['total']:,} (started by {b['started_by']})"
+                for b in broadcasts[:10]
+            ]
+            if len(broadcasts) > 10:
+                lines.append(f"… and {len(broadcasts) - 10} more")
+            embed.add_field(name="Running Broadcasts", value="\n".join(lines), inline=False)
+            
+        embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
+        await ctx.send(embed=embed)
+        
+    @commands.command(name="perf")
+    @commands.is_owner()
+    async def show_perf(self, ctx, command_name=None):
+        """
+        Show command latency percentiles over the last hour
+        
+        Usage: !perf [command]
+        Example: !perf ban
+        """
+        tracer = self.bot.perf
+        
+        if command_name is None:
+            rows = tracer.summary()
+            if not rows:
+                await ctx.send("No commands have been timed yet.")
+                return
+                
+            lines = [f"{'command':<14} {'calls':>6} {'p50':>8} {'p95':>8} {'p99':>8}"]
+            for name, count, p50, p95, p99 in rows[:20]:
+                lines.append(f"{name[:14]:<14} {count:>6} {format_seconds(p50):>8} {format_seconds(p95):>8} {format_seconds(p99):>8}")
+                
+            embed = discord.Embed(
+                title="Command Latency (last hour)",
+                description="```\n" + "\n".join(lines) + "\n```",
+                color=discord.Color.blue()
+            )
+            embed.set_footer(text=f"Slowest p95 first. Use {ctx.prefix}perf <command> for details | {getattr(self.bot, 'author', 'G1 Admin')}")
+            await ctx.send(embed=embed)
+            return
+            
+        command = self.bot.get_command(command_name)
+        stats = tracer.commands.get(command.qualified_name) if command else None
+        if stats is None:
+            await ctx.send(f"No timings recorded for `{command_name}`.")
+            return
+            
+        now = time.time()
+        lines = [f"{'phase':<11} {'p50':>8} {'p95':>8} {'p99':>8}"]
+        for phase in PHASES:
+            count, (p50, p95, p99) = stats.percentiles(phase, now)
+            lines.append(f"{phase:<11} {format_seconds(p50):>8} {format_seconds(p95):>8} {format_seconds(p99):>8}")
+            
+        embed = discord.Embed(
+            title=f"Latency: {ctx.prefix}{command.qualified_name}",
+            description=f"{stats.calls:,} calls since startup, {stats.failures:,} failed\n"
+                        "```\n" + "\n".join(lines) + "\n```",
+            color=discord.Color.blue()
+        )
+        
+        slowest = []
+        for invocation in stats.slowest():
+            p = invocation.phases
+            slowest.append(
+                f"<t:{int(invocation.when)}:R> **{format_seconds(p['total'])}** in {invocation.guild} by {invocation.author}"
+                f"{' (failed)' if invocation.failed else ''}\n"
+                f"checks {format_seconds(p['checks'])}, conversion {format_seconds(p['conversion'])}, "
+                f"body {format_seconds(p['body'])}, HTTP {format_seconds(p['http'])}"
+            )
+        if slowest:
+            embed.add_field(name=f"Slowest of the last {len(stats.recent)}", value="\n".join(slowest)[:1024], inline=False)
+            
+        embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
+        await ctx.send(embed=embed)
+        
+    @commands.command(name="lag")
+    async def show_lag(self, ctx):
+        """
+        Show how quickly the event loop responds and what blocked it
+        
+        Usage: !lag
+        """
+        watchdog = self.bot.watchdog
+        count, p50, p99, worst = watchdog.lag_percentiles()
+        
+        embed = discord.Embed(
+            title="Event Loop Lag",
+            description=f"Now: {format_seconds(watchdog.last_lag)}\n"
+                        f"Last hour: p50 {format_seconds(p50)}, p99 {format_seconds(p99)}, max {format_seconds(worst)} ({count:,} checks)\n"
+                        f"Stalls over {format_seconds(watchdog.threshold)}: {watchdog.stalls:,}",
+            color=discord.Color.red() if watchdog.stalls else discord.Color.green()
+        )
+        
+        top = watchdog.top_sites()
+        if top:
+            lines = [f"{'stalls':>6} {'total':>8} {'max':>8}  site"]
+            for site, stats in top:
+                lines.append(f"{stats.count:>6} {format_seconds(stats.total):>8} {format_seconds(stats.max):>8}  {site}")
+            embed.add_field(name="Worst Call Sites", value=("```\n" + "\n".join(lines) + "\n```")[:1024], inline=False)
+            
+            # Where the worst site was blocking the last time, innermost frames last
+            site, stats = top[0]
+            stack = [f"{frame.filename.split('/')[-1]}:{frame.lineno} {frame.name}" for frame in stats.last.stack[-6:]]
+            embed.add_field(
+                name=f"Last stall at {site} (<t:{int(stats.last.when)}:R>)",
+                value=("```\n" + "\n".join(stack) + "\n```")[:1024] if stack else "No stack captured",
+                inline=False
+            )
+            
+        embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
+        await ctx.send(embed=embed)
+        
+    @commands.group(name="mem", invoke_without_command=True)
+    @commands.is_owner()
+    async def show_memory(self, ctx):
+        """
+        Show roughly how much memory each cog, the bot's caches and the library hold
+        
+        Usage: !mem, !mem trace on [frames], !mem trace off, !mem snapshot
+        """
+        report = self.bot.memory.report()
+        rows = report["rows"]
+        accounted = sum(nbytes for _, _, nbytes in rows)
+        
+        lines = [f"{'owner':<12} {'structure':<20} {'size':>9}"]
+        for owner, structure, nbytes in rows[:20]:
+            lines.append(f"{owner[:12]:<12} {structure[:20]:<20} {format_bytes(nbytes):>9}")
+        if len(rows) > 20:
+            lines.append(f"… {len(rows) - 20} smaller ones, {format_bytes(sum(n for _, _, n in rows[20:]))}")
+            
+        rss = report["rss"]
+        description = f"Resident memory: **{format_bytes(rss) if rss is not None else 'n/a'}**, " \
+                      f"accounted for here: {format_bytes(accounted)}\n"
+        traced = report["traced"]
+        if traced is not None:
+            description += f"tracemalloc: {format_bytes(traced[0])} traced, peak {format_bytes(traced[1])}\n"
+        else:
+            description += f"tracemalloc is off, `{ctx.prefix}mem trace on` starts it\n"
+            
+        embed = discord.Embed(
+            title="Memory",
+            description=description + "```\n" + "\n".join(lines) + "\n```",
+            color=discord.Color.blue()
+        )
+        embed.set_footer(text=f"Sizes are estimates, measured in {format_seconds(report['seconds'])} | {getattr(self.bot, 'author', 'G1 Admin')}")
+        await ctx.send(embed=embed)
+        
+    @show_memory.command(name="trace")
+    @commands.is_owner()
+    async def memory_trace(self, ctx, state: str, frames: int = None):
+        """
+        Start or stop tracemalloc, more frames show more of the call stack but cost more (25 at most)
+        
+        Usage: !mem trace on [frames] or !mem trace off
+        Example: !mem trace on 1
+        """
+        state = state.lower()
+        if state == "on":
+            if self.bot.memory.start_tracing(frames):
+                await ctx.send(f"tracemalloc started, take a snapshot with `{ctx.prefix}mem snapshot`.")
+            else:
+                await ctx.send("tracemalloc is already running.")
+        elif state == "off":
+            if self.bot.memory.stop_tracing():
+                await ctx.send("tracemalloc stopped.")
+            else:
+                await ctx.send("tracemalloc isn't running.")
+        else:
+            await ctx.send(f"Usage: `{ctx.prefix}mem trace on [frames]` or `{ctx.prefix}mem trace off`")
+            
+    @show_memory.command(name="snapshot")
+    @commands.is_owner()
+    async def memory_snapshot(self, ctx):
+        """
+        Save a tracemalloc snapshot and show what grew since the previous one
+        
+        Usage: !mem snapshot
+        """
+        try:
+            async with ctx.typing():
+                path, stats, is_diff = await self.bot.memory.snapshot(limit=15)
+        except RuntimeError:
+            await ctx.send(f"tracemalloc isn't running, start it with `{ctx.prefix}mem trace on`.")
+            return
+            
+        lines = []
+        for stat in stats:
+            frame = stat.traceback[0]
+            where = f"{short_path(frame.filename)}:{frame.lineno}"
+            if is_diff:
+                lines.append(f"{where[:40]:<40} {format_bytes(stat.size_diff):>9} ({stat.count_diff:+,})")
+            else:
+                lines.append(f"{where[:40]:<40} {format_bytes(stat.size):>9} ({stat.count:,})")
+                
+        embed = discord.Embed(
+            title="Growth since the last snapshot" if is_diff else "Biggest allocations",
+            description=("```\n" + "\n".join(lines) + "\n```")[:4000] if lines else "Nothing traced yet.",
+            color=discord.Color.blue()
+        )
+        if not is_diff:
+            embed.add_field(name="Next", value=f"Take another `{ctx.prefix}mem snapshot` later to see what grew.", inline=False)
+        embed.set_footer(text=f"Saved to {path} | {getattr(self.bot, 'author', 'G1 Admin')}")
+        await ctx.send(embed=embed)
+        
+    @commands.command(name="reload")
+    @commands.is_owner()
+    async def reload_cogs(self, ctx, name=None):
+        """
+        Reload a cog without restarting the bot, its state is kept
+        
+        Usage: !reload <cog> or !reload all
+        Example: !reload interactive
+        """
+        if name is None:
+            loaded = ", ".join(extension.split(".")[-1] for extension in sorted(self.bot.extensions))
+            await ctx.send(f"Usage: `{ctx.prefix}reload <cog>` or `{ctx.prefix}reload all`\nLoaded cogs: {loaded}")
+            return
+            
+        if name.lower() == "all":
+            results = await self.bot.reloader.reload_all()
+        else:
+            extension = name if name.startswith("cogs.") else f"cogs.{name.lower()}"
+            results = [await self.bot.reloader.reload(extension)]
+            
+        lines = []
+        for result in results:
+            cog = result.extension.split(".")[-1]
+            if result.ok:
+                kept = f", state kept for {', '.join(result.handed_off)}" if result.handed_off else ""
+                lines.append(f"✅ `{cog}` reloaded in {format_seconds(result.seconds)}{kept}")
+            else:
+                outcome = "old version still running" if result.rolled_back else "not loaded"
+                lines.append(f"❌ `{cog}` failed ({outcome}): {str(result.error)[:200]}")
+                
+        # Reloaded cogs may have changed their slash commands, unchanged ones cost nothing
+        if any(result.ok for result in results):
+            try:
+                synced, _ = await self.bot.app_sync.sync()
+                if synced:
+                    lines.append(f"🔄 Slash commands synced: {', '.join(synced)}")
+            except Exception as e:
+                lines.append(f"⚠️ Slash command sync failed: {e}")
+                
+        failed = sum(1 for result in results if not result.ok)
+        embed = discord.Embed(
+            title=f"Reloaded {len(results) - failed} of {len(results)} cogs",
+            description="\n".join(lines)[:4000],
+            color=discord.Color.red() if failed else discord.Color.green()
+        )
+        embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    await bot.add_cog(Diagnostics(bot)) 
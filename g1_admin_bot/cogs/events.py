@@ -1,8 +1,9 @@
 import discord
 from discord.ext import commands
 import logging
-import json
 import random
+from utils.memory import deep_sizeof
+from utils import fastjson
 
 logger = logging.getLogger("g1_admin.events")
 
@@ -23,6 +24,13 @@ class Events(commands.Cog):
         
         # Load custom messages if available
         self.load_messages()
+        self.bot.memory.add_reporter(self.qualified_name, self.memory_sizes)
+        
+    def cog_unload(self):
+        self.bot.memory.remove_reporter(self.qualified_name)
+        
+    def memory_sizes(self):
+        return {"messages": deep_sizeof([self.welcome_messages, self.goodbye_messages])}
         
     def load_messages(self):
         """Load custom welcome and goodbye messages from config"""
@@ -63,7 +71,7 @@ class Events(commands.Cog):
             config["goodbye_channel_id"] = self.goodbye_channel_id
             
             with open('config.json', 'w') as f:
-                json.dump(config, f, indent=4)
+                fastjson.dump(config, f, indent=4)
                 
             return True
         except Exception as e:
@@ -1,22 +1,137 @@
 import discord
-from discord.ext import commands
+from discord import app_commands
+from discord.ext import commands, tasks
 import logging
 import asyncio
 import random
 import datetime
+import os
+from utils.polls import PollStore, EMOJI_OPTIONS, EMOJI_INDEX
+from utils.message_cache import parse_message_reference
+from utils import dice
+from utils.converters import Snowflake
+from utils.memory import deep_sizeof
+from utils.countdowns import CountdownManager, countdown_embed, parse_duration, format_duration, MAX_COUNTDOWN
 
 logger = logging.getLogger("g1_admin.interactive")
 
+POLL_PREFIX = "g1:poll"
+
+def split_options(options):
+    """Slash commands can't take a variable number of arguments, so options come as "a | b | c" """
+    return [option.strip() for option in options.split("|") if option.strip()]
+
 class Interactive(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.active_polls = {}
+        config = getattr(self.bot, "_config", {})
+        
+        # On !reload the previous instance hands over its live polls and countdowns
+        state = self.bot.reloader.state_for(self.qualified_name)
+        if state:
+            self.polls = state["polls"]
+            self.countdowns = state["countdowns"]
+        else:
+            self.polls = PollStore(config.get("poll_db", "polls.db"), owns_guild=self.bot.owns_guild)
+            self.countdowns = CountdownManager(self.bot, self.bot.timers, self.countdown_file(config))
+        self.resumed = bool(state)
+        
+        self.bot.interactions.add_component_handler(POLL_PREFIX, self.handle_poll_button)
+        self.flush_polls.start()
+        self.bot.metrics.registry.add_collector(self.collect_metrics)
+        self.bot.memory.add_reporter(self.qualified_name, self.memory_sizes)
+        
+    def collect_metrics(self):
+        self.bot.metrics.queue_depth.set(self.countdowns.pending_edits, "countdown_edits")
+        self.bot.metrics.queue_depth.set(self.polls.pending_votes, "poll_votes")
+        
+    def memory_sizes(self):
+        sizes = self.polls.memory_sizes()
+        sizes["countdowns"] = deep_sizeof(self.countdowns.countdowns)
+        return sizes
+        
+    def countdown_file(self, config):
+        """Each shard process keeps its own countdown file so they don't overwrite each other"""
+        path = config.get("countdown_file", "countdowns.json")
+        shard_ids = getattr(self.bot, "local_shard_ids", None)
+        if shard_ids:
+            root, ext = os.path.splitext(path)
+            path = f"{root}-shards-{shard_ids[0]}-{shard_ids[-1]}{ext}"
+        return path
+        
+    async def cog_load(self):
+        if not self.resumed:
+            asyncio.create_task(self.resume_countdowns())
+        
+    async def resume_countdowns(self):
+        await self.bot.wait_until_ready()
+        self.countdowns.resume()
+        
+    def export_state(self):
+        """Keep polls, buffered votes and running countdowns going across a !reload"""
+        return {"polls": self.polls, "countdowns": self.countdowns}
+        
+    async def cog_unload(self):
+        self.flush_polls.cancel()
+        self.bot.interactions.remove_component_handler(POLL_PREFIX)
+        self.bot.metrics.registry.remove_collector(self.collect_metrics)
+        self.bot.memory.remove_reporter(self.qualified_name)
+        # Mid-reload the state belongs to whichever instance ends up loaded, even when it's this one
+        if self.bot.reloader.is_handed_off(self.qualified_name):
+            return
+        self.countdowns.stop()
+        await asyncio.to_thread(self.polls.close_db)
+        
+    @tasks.loop(seconds=5)
+    async def flush_polls(self):
+        """Write buffered poll votes to disk in batches"""
+        pending = self.polls.take_pending_votes()
+        if pending:
+            try:
+                await asyncio.to_thread(self.polls.write_votes, pending)
+            except Exception as e:
+                logger.error(f"Error saving poll votes: {e}")
+                
+    async def handle_poll_button(self, interaction, suffix):
+        """Record a vote from a poll button, clicking your current choice again removes the vote"""
+        message_id = interaction.message.id
+        poll = self.polls.get(message_id)
+        if poll is None:
+            await interaction.response.send_message("This poll has ended.", ephemeral=True)
+            return
+            
+        option = int(suffix)
+        if poll.votes.get(interaction.user.id) == option:
+            self.polls.unvote(message_id, interaction.user.id)
+            await interaction.response.send_message("Your vote has been removed.", ephemeral=True)
+            return
+            
+        if self.polls.vote(message_id, interaction.user.id, option) is None:
+            await interaction.response.send_message("Invalid poll option.", ephemeral=True)
+            return
+            
+        await interaction.response.send_message(f"Your vote for **{poll.options[option]}** has been recorded.", ephemeral=True)
+        
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload):
+        """Count number reactions on polls as votes too"""
+        option = EMOJI_INDEX.get(str(payload.emoji))
+        if option is None or payload.user_id == self.bot.user.id:
+            return
+        self.polls.vote(payload.message_id, payload.user_id, option)
+        
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload):
+        option = EMOJI_INDEX.get(str(payload.emoji))
+        if option is None:
+            return
+        self.polls.unvote(payload.message_id, payload.user_id, option)
         
     @commands.command(name="poll")
     @commands.has_permissions(manage_messages=True)
     async def create_poll(self, ctx, question: str, *options):
         """
-        Create a poll with reactions for voting
+        Create a poll with buttons for voting
         
         Usage: !poll "Question" "Option 1" "Option 2" "Option 3"...
         Example: !poll "What's your favorite color?" "Red" "Blue" "Green"
@@ -31,13 +146,10 @@ class Interactive(commands.Cog):
             await ctx.send("You can only have up to 10 options in a poll.")
             return
             
-        # Emoji options for polls
-        emoji_options = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
-        
         # Create poll embed
         embed = discord.Embed(
             title=f"📊 Poll: {question}",
-            description="React with the corresponding emoji to vote!",
+            description="Click the corresponding button to vote!",
             color=discord.Color.blue(),
             timestamp=datetime.datetime.now()
         )
@@ -45,31 +157,49 @@ class Interactive(commands.Cog):
         # Add options to embed
         options_text = ""
         for i, option in enumerate(options):
-            options_text += f"{emoji_options[i]} {option}\n\n"
+            options_text += f"{EMOJI_OPTIONS[i]} {option}\n\n"
             
         embed.add_field(name="Options", value=options_text, inline=False)
         embed.set_footer(text=f"Poll created by {ctx.author}")
         
+        # One button per option, sent with the message instead of one add_reaction call each
+        view = discord.ui.View(timeout=None)
+        for i, option in enumerate(options):
+            view.add_item(discord.ui.Button(
+                label=option[:80],
+                emoji=EMOJI_OPTIONS[i],
+                style=discord.ButtonStyle.secondary,
+                custom_id=f"{POLL_PREFIX}:{i}",
+                row=i // 5
+            ))
+        # Clicks are routed by the interaction dispatcher, so keep the view out of the library's view store
+        view.stop()
+        
         # Send poll message
-        poll_message = await ctx.send(embed=embed)
+        poll_message = await ctx.send(embed=embed, view=view)
         
-        # Add reaction options
-        for i in range(len(options)):
-            await poll_message.add_reaction(emoji_options[i])
-            
         # Store active poll
-        self.active_polls[poll_message.id] = {
-            'question': question,
-            'options': options,
-            'created_by': ctx.author.id,
-            'created_at': datetime.datetime.now(),
-            'message_id': poll_message.id,
-            'channel_id': ctx.channel.id
-        }
+        self.polls.create(
+            poll_message.id,
+            ctx.channel.id,
+            ctx.guild.id if ctx.guild else None,
+            question,
+            options,
+            ctx.author.id
+        )
     
-    @commands.command(name="endpoll")
+    @app_commands.command(name="poll", description="Create a poll with buttons for voting")
+    @app_commands.describe(question="The question to ask", options="2 to 10 options separated by |")
+    @app_commands.default_permissions(manage_messages=True)
+    @app_commands.checks.has_permissions(manage_messages=True)
+    async def poll_slash(self, interaction, question: str, options: str):
+        ctx = await commands.Context.from_interaction(interaction)
+        await self.create_poll(ctx, question, *split_options(options))
+        
+    @commands.hybrid_command(name="endpoll")
     @commands.has_permissions(manage_messages=True)
-    async def end_poll(self, ctx, message_id: int = None):
+    @app_commands.default_permissions(manage_messages=True)
+    async def end_poll(self, ctx, message_id: Snowflake = None):
         """
         End a poll and display results
         
@@ -78,69 +208,37 @@ class Interactive(commands.Cog):
         
         If no message ID is provided, looks for the most recent poll in the channel
         """
-        # If no message ID provided, try to find most recent poll in channel
+        # If no message ID provided, use the most recent poll in the channel
         if message_id is None:
-            for poll_id, poll_data in self.active_polls.items():
-                if poll_data['channel_id'] == ctx.channel.id:
-                    message_id = poll_id
-                    break
-                    
-            if message_id is None:
+            poll = self.polls.latest_in_channel(ctx.channel.id)
+            if poll is None:
                 await ctx.send("No active polls found in this channel. Please provide a poll message ID.")
                 return
+        else:
+            poll = self.polls.get(message_id)
+            if poll is None:
+                await ctx.send("No active poll found with that message ID.")
+                return
                 
-        # Check if poll exists
-        if message_id not in self.active_polls:
-            await ctx.send("No active poll found with that message ID.")
-            return
-            
-        poll_data = self.active_polls[message_id]
-        
         # Only allow poll creator or admins to end polls
-        if not (ctx.author.id == poll_data['created_by'] or ctx.author.guild_permissions.administrator):
+        if not (ctx.author.id == poll.created_by or ctx.author.guild_permissions.administrator):
             await ctx.send("Only the poll creator or administrators can end this poll.")
             return
             
+        # Tally is already up to date, close the poll before any network calls
+        self.polls.close(poll.message_id)
+        await asyncio.to_thread(self.polls.save_closed, poll)
+        results = poll.results()
+        total_votes = poll.total_votes
+        
         try:
-            # Get poll message
-            channel = self.bot.get_channel(poll_data['channel_id'])
-            if not channel:
-                await ctx.send("Could not find the channel where the poll was created.")
-                return
-                
-            poll_message = await channel.fetch_message(message_id)
-            
-            # Emoji options for polls
-            emoji_options = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
-            
-            # Count votes
-            results = []
-            total_votes = 0
-            
-            for i, option in enumerate(poll_data['options']):
-                if i >= len(emoji_options):
-                    break
-                    
-                reaction = discord.utils.get(poll_message.reactions, emoji=emoji_options[i])
-                count = 0
-                if reaction:
-                    count = reaction.count - 1  # Subtract 1 for the bot's reaction
-                    if count < 0:
-                        count = 0
-                        
-                results.append((option, count))
-                total_votes += count
-                
             # Create results embed
             embed = discord.Embed(
-                title=f"📊 Poll Results: {poll_data['question']}",
+                title=f"📊 Poll Results: {poll.question}",
                 color=discord.Color.gold(),
                 timestamp=datetime.datetime.now()
             )
             
-            # Sort results by vote count (descending)
-            results.sort(key=lambda x: x[1], reverse=True)
-            
             # Add results to embed
             results_text = ""
             for option, count in results:
@@ -156,64 +254,66 @@ class Interactive(commands.Cog):
             # Send results
             await ctx.send(embed=embed)
             
-            # Mark poll as ended by editing original message
-            original_embed = poll_message.embeds[0]
-            original_embed.title = f"📊 Poll Ended: {poll_data['question']}"
-            original_embed.set_footer(text=f"Poll ended by {ctx.author}")
-            await poll_message.edit(embed=original_embed)
-            
-            # Remove from active polls
-            del self.active_polls[message_id]
-            
+            # Mark poll as ended and remove the buttons, without fetching the original message
+            channel = self.bot.get_channel(poll.channel_id)
+            if channel:
+                options_text = ""
+                for i, option in enumerate(poll.options):
+                    options_text += f"{EMOJI_OPTIONS[i]} {option}\n\n"
+                    
+                ended_embed = discord.Embed(
+                    title=f"📊 Poll Ended: {poll.question}",
+                    color=discord.Color.blue(),
+                    timestamp=poll.created_at
+                )
+                ended_embed.add_field(name="Options", value=options_text, inline=False)
+                ended_embed.set_footer(text=f"Poll ended by {ctx.author}")
+                await channel.get_partial_message(poll.message_id).edit(embed=ended_embed, view=None)
+                
         except discord.NotFound:
             await ctx.send("Could not find the poll message. It may have been deleted.")
-            del self.active_polls[message_id]
         except Exception as e:
             logger.error(f"Error ending poll: {e}")
             await ctx.send(f"An error occurred: {e}")
     
-    @commands.command(name="roll")
-    async def roll_dice(self, ctx, dice: str = "1d6"):
+    @commands.hybrid_command(name="roll")
+    async def roll_dice(self, ctx, *, expression: str = "1d6"):
         """
-        Roll dice using the XdY format
+        Roll dice using a dice expression
         
-        Usage: !roll [XdY]
+        Usage: !roll [expression]
         Example: !roll 2d20
+        Example: !roll 4d6kh3+2
+        Example: !roll (2d8+3)*2
         
-        Default is 1d6 (one six-sided die)
+        Supports +, -, *, / and parentheses, kh/kl (keep highest/lowest),
+        dh/dl (drop highest/lowest) and ! (exploding dice). Default is 1d6
         """
         try:
-            # Parse dice format
-            if 'd' not in dice:
-                await ctx.send("Invalid format. Use XdY format, e.g., 2d6.")
-                return
-                
-            num_dice, num_sides = map(int, dice.split('d'))
-            
-            if num_dice <= 0 or num_sides <= 0:
-                await ctx.send("Number of dice and sides must be positive numbers.")
-                return
-                
-            if num_dice > 100:
-                await ctx.send("You can roll a maximum of 100 dice at once.")
-                return
-                
-            # Roll the dice
-            results = [random.randint(1, num_sides) for _ in range(num_dice)]
-            total = sum(results)
-            
-            # Create response
-            if num_dice == 1:
-                await ctx.send(f"🎲 {ctx.author.mention} rolled a {total}")
-            else:
-                rolls_text = ', '.join(str(r) for r in results)
-                await ctx.send(f"🎲 {ctx.author.mention} rolled {num_dice}d{num_sides}: {rolls_text} = **{total}**")
-        
-        except ValueError:
-            await ctx.send("Invalid format. Use XdY format, e.g., 2d6.")
+            total, groups = dice.roll(expression)
+        except dice.DiceError as e:
+            await ctx.send(f"Invalid dice expression: {e}")
+            return
         except Exception as e:
             logger.error(f"Error in roll command: {e}")
             await ctx.send(f"An error occurred: {e}")
+            return
+            
+        # Create response
+        if len(groups) == 1 and groups[0].count == 1 and groups[0].total == total:
+            await ctx.send(f"🎲 {ctx.author.mention} rolled a {total}")
+            return
+            
+        details = "\n".join(group.describe() for group in groups)
+        response = f"🎲 {ctx.author.mention} rolled `{expression}`: **{total:,}**"
+        if details:
+            response += f"\n{details}"
+            
+        # Keep within Discord's message limit
+        if len(response) > 2000:
+            response = response[:1990] + "…"
+            
+        await ctx.send(response)
     
     @commands.command(name="choose")
     async def choose(self, ctx, *options):
@@ -237,7 +337,13 @@ class Interactive(commands.Cog):
         # Send response
         await ctx.send(f"🤔 {ctx.author.mention}, I choose... **{choice}**!")
     
-    @commands.command(name="8ball")
+    @app_commands.command(name="choose", description="Randomly choose between several options")
+    @app_commands.describe(options="The options separated by |")
+    async def choose_slash(self, interaction, options: str):
+        ctx = await commands.Context.from_interaction(interaction)
+        await self.choose(ctx, *split_options(options))
+        
+    @commands.hybrid_command(name="8ball")
     async def magic_8ball(self, ctx, *, question: str):
         """
         Ask the magic 8-ball a question
@@ -290,72 +396,76 @@ class Interactive(commands.Cog):
         
         await ctx.send(embed=embed)
     
-    @commands.command(name="countdown")
+    @commands.hybrid_command(name="countdown")
     @commands.has_permissions(manage_messages=True)
-    async def countdown(self, ctx, seconds: int = 10, *, event: str = "Countdown"):
+    @app_commands.default_permissions(manage_messages=True)
+    async def countdown(self, ctx, duration: str = "10", *, event: str = "Countdown"):
         """
         Start a countdown timer
         
-        Usage: !countdown [seconds] [event name]
+        Usage: !countdown [duration] [event name]
         Example: !countdown 30 Meeting start
+        Example: !countdown 2h30m Tournament
         
-        Default is 10 seconds
+        Duration is in seconds unless a unit is given (s, m, h, d). Default is 10 seconds
         """
-        if seconds <= 0:
-            await ctx.send("Please provide a positive number of seconds.")
+        seconds = parse_duration(duration)
+        if seconds is None:
+            await ctx.send("Invalid duration. Use seconds or a duration like 90s, 10m, 2h30m or 1d.")
             return
             
-        if seconds > 300:
-            await ctx.send("Maximum countdown time is 300 seconds (5 minutes).")
+        if seconds <= 0:
+            await ctx.send("Please provide a positive duration.")
             return
             
-        # Create initial countdown message
-        embed = discord.Embed(
-            title=f"⏳ {event}",
-            description=f"Time remaining: {seconds} seconds",
-            color=discord.Color.blue()
-        )
-        embed.set_footer(text=f"Countdown started by {ctx.author}")
-        
-        countdown_msg = await ctx.send(embed=embed)
-        
-        # Update countdown every second
-        while seconds > 0:
-            await asyncio.sleep(1)
-            seconds -= 1
+        if seconds > MAX_COUNTDOWN:
+            await ctx.send(f"Maximum countdown time is {format_duration(MAX_COUNTDOWN)}.")
+            return
             
-            # Update every 5 seconds or for the final 5 seconds
-            if seconds % 5 == 0 or seconds < 5:
-                embed.description = f"Time remaining: {seconds} seconds"
-                
-                # Change color for last 5 seconds
-                if seconds <= 5:
-                    embed.color = discord.Color.red()
-                    
-                await countdown_msg.edit(embed=embed)
-                
-        # Final message
-        embed = discord.Embed(
-            title=f"🔔 {event}",
-            description="Time's up!",
-            color=discord.Color.green()
-        )
-        embed.set_footer(text=f"Countdown started by {ctx.author}")
-        
-        await countdown_msg.edit(embed=embed)
-        await ctx.send(f"🔔 **{event}** - Time's up! {ctx.author.mention}")
+        # Create initial countdown message, the shared timer wheel takes care of updates from here
+        countdown = self.countdowns.create(ctx.channel.id, event, ctx.author, seconds)
+        countdown_msg = await ctx.send(embed=countdown_embed(countdown, seconds))
+        await self.countdowns.start(countdown, countdown_msg.id)
     
-    @commands.command(name="quote")
-    async def quote_message(self, ctx, message_id: int):
+    @commands.hybrid_command(name="quote")
+    async def quote_message(self, ctx, reference: str):
         """
-        Quote a message from the current channel
+        Quote a message by ID or link
         
-        Usage: !quote <message_id>
+        Usage: !quote <message_id or message link>
         Example: !quote 123456789012345678
+        Example: !quote https://discord.com/channels/111/222/333
+        
+        Message IDs are looked up in the current channel, links work for any channel you can read
         """
+        parsed = parse_message_reference(reference)
+        if parsed is None:
+            await ctx.send("Please provide a message ID or a message link.")
+            return
+            
+        channel_id, message_id = parsed
+        channel = ctx.channel if channel_id is None else self.bot.get_channel(channel_id)
+        if channel is None:
+            await ctx.send("I can't see the channel that message is in.")
+            return
+            
+        # Only quote from channels the requester can read themselves
+        if channel != ctx.channel:
+            guild = getattr(channel, "guild", None)
+            member = guild.get_member(ctx.author.id) if guild else None
+            if member is None and guild is not None:
+                # Not cached when the member cache isn't full
+                try:
+                    member = await guild.fetch_member(ctx.author.id)
+                except discord.HTTPException:
+                    member = None
+            if member is None or not channel.permissions_for(member).read_message_history:
+                await ctx.send("You can only quote messages from channels you can read.")
+                return
+                
         try:
-            # Try to fetch the message
-            message = await ctx.channel.fetch_message(message_id)
+            # Served from the message cache when possible, fetched otherwise
+            message = await self.bot.message_cache.fetch(channel, message_id)
             
             # Create embed
             embed = discord.Embed(
@@ -366,8 +476,8 @@ class Interactive(commands.Cog):
             
             # Add author info
             embed.set_author(
-                name=message.author.display_name,
-                icon_url=message.author.display_avatar.url
+                name=message.author_name,
+                icon_url=message.author_avatar_url
             )
             
             # Add message link
@@ -375,7 +485,7 @@ class Interactive(commands.Cog):
             
             # Add attachments if any
             if message.attachments:
-                if message.attachments[0].url.lower().endswith(('png', 'jpeg', 'jpg', 'gif', 'webp')):
+                if message.attachments[0].is_image:
                     embed.set_image(url=message.attachments[0].url)
                 else:
                     embed.add_field(name="Attachment", value=f"[View attachment]({message.attachments[0].url})", inline=False)
@@ -386,7 +496,9 @@ class Interactive(commands.Cog):
             await ctx.send(embed=embed)
             
         except discord.NotFound:
-            await ctx.send("Message not found. Make sure you're using the correct message ID.")
+            await ctx.send("Message not found. Make sure you're using the correct message ID or link.")
+        except discord.Forbidden:
+            await ctx.send("I don't have permission to read that message.")
         except Exception as e:
             logger.error(f"Error quoting message: {e}")
             await ctx.send(f"An error occurred: {e}")
@@ -1,8 +1,12 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 import logging
 import asyncio
 import datetime
+from utils import outbound
+from utils.converters import AmbiguousMember, MemberLookup, Snowflake
+from utils.member_index import match_kind
 
 logger = logging.getLogger("g1_admin.moderation")
 
@@ -10,6 +14,10 @@ class Moderation(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         
+    async def cog_before_invoke(self, ctx):
+        # Moderation requests skip the outbound queue, ahead of broadcasts and log posts
+        outbound.set_lane(outbound.MODERATION, ctx.guild.id if ctx.guild else None)
+        
     async def log_moderation_action(self, action, member, moderator, reason=None, duration=None):
         """Log moderation actions to the configured log channel"""
         # Skip if no log channel configured
@@ -40,11 +48,13 @@ class Moderation(commands.Cog):
         # Add user avatar
         embed.set_thumbnail(url=member.display_avatar.url)
         
-        await log_channel.send(embed=embed)
+        with outbound.lane(outbound.LOG, log_channel.guild.id):
+            await log_channel.send(embed=embed)
     
-    @commands.command(name="kick")
+    @commands.hybrid_command(name="kick")
     @commands.has_permissions(kick_members=True)
-    async def kick_member(self, ctx, member: discord.Member, *, reason=None):
+    @app_commands.default_permissions(kick_members=True)
+    async def kick_member(self, ctx, member: MemberLookup, *, reason=None):
         """
         Kick a member from the server
         
@@ -82,9 +92,10 @@ class Moderation(commands.Cog):
             logger.error(f"Error kicking member: {e}")
             await ctx.send(f"An error occurred: {e}")
             
-    @commands.command(name="ban")
+    @commands.hybrid_command(name="ban")
     @commands.has_permissions(ban_members=True)
-    async def ban_member(self, ctx, member: discord.Member, *, reason=None):
+    @app_commands.default_permissions(ban_members=True)
+    async def ban_member(self, ctx, member: MemberLookup, *, reason=None):
         """
         Ban a member from the server
         
@@ -122,9 +133,10 @@ class Moderation(commands.Cog):
             logger.error(f"Error banning member: {e}")
             await ctx.send(f"An error occurred: {e}")
     
-    @commands.command(name="unban")
+    @commands.hybrid_command(name="unban")
     @commands.has_permissions(ban_members=True)
-    async def unban_member(self, ctx, user_id: int, *, reason=None):
+    @app_commands.default_permissions(ban_members=True)
+    async def unban_member(self, ctx, user_id: Snowflake, *, reason=None):
         """
         Unban a user by ID
         
@@ -154,9 +166,10 @@ class Moderation(commands.Cog):
             logger.error(f"Error unbanning user: {e}")
             await ctx.send(f"An error occurred: {e}")
             
-    @commands.command(name="mute")
+    @commands.hybrid_command(name="mute")
     @commands.has_permissions(manage_roles=True)
-    async def mute_member(self, ctx, member: discord.Member, duration: str = None, *, reason=None):
+    @app_commands.default_permissions(manage_roles=True)
+    async def mute_member(self, ctx, member: MemberLookup, duration: str = None, *, reason=None):
         """
         Mute a member (timeout)
         
@@ -230,9 +243,10 @@ class Moderation(commands.Cog):
             logger.error(f"Error muting member: {e}")
             await ctx.send(f"An error occurred: {e}")
     
-    @commands.command(name="unmute")
+    @commands.hybrid_command(name="unmute")
     @commands.has_permissions(manage_roles=True)
-    async def unmute_member(self, ctx, member: discord.Member, *, reason=None):
+    @app_commands.default_permissions(manage_roles=True)
+    async def unmute_member(self, ctx, member: MemberLookup, *, reason=None):
         """
         Unmute a member (remove timeout)
         
@@ -255,9 +269,10 @@ class Moderation(commands.Cog):
             logger.error(f"Error unmuting member: {e}")
             await ctx.send(f"An error occurred: {e}")
     
-    @commands.command(name="purge", aliases=["clear"])
+    @commands.hybrid_command(name="purge", aliases=["clear"])
     @commands.has_permissions(manage_messages=True)
-    async def purge_messages(self, ctx, amount: int, user: discord.Member = None):
+    @app_commands.default_permissions(manage_messages=True)
+    async def purge_messages(self, ctx, amount: int, user: MemberLookup = None):
         """
         Purge messages from a channel
         
@@ -268,8 +283,11 @@ class Moderation(commands.Cog):
             await ctx.send("Please provide a number between 1 and 100.")
             return
             
-        # Delete the command message first
-        await ctx.message.delete()
+        # Delete the command message first, slash commands have none so the reply is kept out of the purge
+        if ctx.interaction is None:
+            await ctx.message.delete()
+        else:
+            await ctx.defer(ephemeral=True)
         
         # Define check based on user
         def check(msg):
@@ -285,10 +303,11 @@ class Moderation(commands.Cog):
             if log_channel_id:
                 log_channel = self.bot.get_channel(int(log_channel_id))
                 if log_channel:
-                    if user:
-                        await log_channel.send(f"🗑️ **{ctx.author}** purged {len(deleted)} messages from {user} in {ctx.channel.mention}")
-                    else:
-                        await log_channel.send(f"🗑️ **{ctx.author}** purged {len(deleted)} messages in {ctx.channel.mention}")
+                    with outbound.lane(outbound.LOG, log_channel.guild.id):
+                        if user:
+                            await log_channel.send(f"🗑️ **{ctx.author}** purged {len(deleted)} messages from {user} in {ctx.channel.mention}")
+                        else:
+                            await log_channel.send(f"🗑️ **{ctx.author}** purged {len(deleted)} messages in {ctx.channel.mention}")
                         
             # Auto-delete confirmation message after 5 seconds
             await asyncio.sleep(5)
@@ -299,9 +318,10 @@ class Moderation(commands.Cog):
         except discord.HTTPException as e:
             await ctx.send(f"Error deleting messages: {e}")
             
-    @commands.command(name="addrole")
+    @commands.hybrid_command(name="addrole")
     @commands.has_permissions(manage_roles=True)
-    async def add_role(self, ctx, member: discord.Member, *, role: discord.Role):
+    @app_commands.default_permissions(manage_roles=True)
+    async def add_role(self, ctx, member: MemberLookup, *, role: discord.Role):
         """
         Add a role to a member
         
@@ -329,9 +349,10 @@ class Moderation(commands.Cog):
             logger.error(f"Error adding role: {e}")
             await ctx.send(f"An error occurred: {e}")
             
-    @commands.command(name="removerole")
+    @commands.hybrid_command(name="removerole")
     @commands.has_permissions(manage_roles=True)
-    async def remove_role(self, ctx, member: discord.Member, *, role: discord.Role):
+    @app_commands.default_permissions(manage_roles=True)
+    async def remove_role(self, ctx, member: MemberLookup, *, role: discord.Role):
         """
         Remove a role from a member
         
@@ -359,9 +380,10 @@ class Moderation(commands.Cog):
             logger.error(f"Error removing role: {e}")
             await ctx.send(f"An error occurred: {e}")
     
-    @commands.command(name="warn")
+    @commands.hybrid_command(name="warn")
     @commands.has_permissions(manage_messages=True)
-    async def warn_member(self, ctx, member: discord.Member, *, reason=None):
+    @app_commands.default_permissions(manage_messages=True)
+    async def warn_member(self, ctx, member: MemberLookup, *, reason=None):
         """
         Warn a member
         
@@ -393,6 +415,44 @@ class Moderation(commands.Cog):
         # Log the warning
         await self.log_moderation_action("Warning", member, ctx.author, reason)
 
+    @commands.hybrid_command(name="whois")
+    @commands.has_permissions(manage_messages=True)
+    @app_commands.default_permissions(manage_messages=True)
+    @commands.cooldown(5, 30, commands.BucketType.user)
+    async def whois(self, ctx, *, query: str):
+        """
+        Find members by part of their name, nickname or display name
+        
+        Usage: !whois <name>
+        Example: !whois ilye
+        """
+        if ctx.guild is None:
+            await ctx.send("This command only works in a server.")
+            return
+            
+        results = self.bot.member_index.search(ctx.guild, query, limit=10)
+        if results is None:
+            await ctx.send("Still indexing this server's members, try again in a moment.")
+            return
+        if not results:
+            await ctx.send(f"No members match `{query}`.", allowed_mentions=discord.AllowedMentions.none())
+            return
+            
+        lines = []
+        for i, (member, value, name) in enumerate(results, 1):
+            nick = f" aka {member.nick}" if member.nick else ""
+            lines.append(f"**{i}.** {member.mention} `{member}`{nick} ({member.id})\n{match_kind(value)} `{name}`")
+            
+        embed = discord.Embed(
+            title=f"🔎 Members matching \"{query[:100]}\"",
+            description="\n".join(lines),
+            color=discord.Color.blue()
+        )
+        stats = self.bot.member_index.stats()
+        embed.set_footer(text=f"{stats['members']:,} members indexed, "
+                              f"{stats['average_search'] * 1000:.2f} ms per search | {getattr(self.bot, 'author', 'G1 Admin')}")
+        await ctx.send(embed=embed)
+
     @kick_member.error
     @ban_member.error
     @unban_member.error
@@ -406,6 +466,8 @@ class Moderation(commands.Cog):
             await ctx.send("You don't have the required permissions to use this command.")
         elif isinstance(error, commands.MissingRequiredArgument):
             await ctx.send(f"Missing required argument. Please check `{ctx.prefix}help {ctx.command.name}`")
+        elif isinstance(error, AmbiguousMember):
+            await ctx.send(str(error), allowed_mentions=discord.AllowedMentions.none())
         elif isinstance(error, commands.BadArgument):
             if ctx.command.name == "unban":
                 await ctx.send("Please provide a valid user ID to unban.")
@@ -1,9 +1,14 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
-import json
 import logging
-import aiohttp
 import os
+import asyncio
+
+from utils.web import DownloadError
+from utils.avatars import AvatarError, DOWNLOAD_LIMIT, prepare_avatar
+from utils.memory import deep_sizeof
+from utils import fastjson
 
 logger = logging.getLogger("g1_admin.settings")
 
@@ -13,11 +18,18 @@ class Settings(commands.Cog):
         self.config_file = 'config.json'
         # Store config in bot for easy access from other cogs
         self.bot._config = self.load_config()
+        self.bot.memory.add_reporter(self.qualified_name, self.memory_sizes)
+        
+    def cog_unload(self):
+        self.bot.memory.remove_reporter(self.qualified_name)
+        
+    def memory_sizes(self):
+        return {"config": deep_sizeof(self.bot._config)}
         
     def load_config(self):
         try:
             with open(self.config_file, 'r') as f:
-                return json.load(f)
+                return fastjson.load(f)
         except Exception as e:
             logger.error(f"Error loading config: {e}")
             return {}
@@ -25,7 +37,7 @@ class Settings(commands.Cog):
     def save_config(self):
         try:
             with open(self.config_file, 'w') as f:
-                json.dump(self.bot._config, f, indent=4)
+                fastjson.dump(self.bot._config, f, indent=4)
             return True
         except Exception as e:
             logger.error(f"Error saving config: {e}")
@@ -45,7 +57,8 @@ class Settings(commands.Cog):
             
         return is_owner or is_admin
     
-    @commands.command(name="setprefix")
+    @commands.hybrid_command(name="setprefix")
+    @app_commands.default_permissions(administrator=True)
     async def set_prefix(self, ctx, new_prefix=None):
         """
         Change the command prefix for the bot
@@ -67,6 +80,7 @@ class Settings(commands.Cog):
         if self.save_config():
             # Update bot's command prefix
             self.bot.command_prefix = new_prefix
+            self.bot.dispatch("prefix_changed", new_prefix)
             await ctx.send(f"Prefix changed to: `{new_prefix}`")
             
             # Update bot's status
@@ -74,8 +88,9 @@ class Settings(commands.Cog):
         else:
             await ctx.send("Failed to save the new prefix. See logs for details.")
     
-    @commands.command(name="setpfp")
-    async def set_profile_picture(self, ctx, url=None):
+    @commands.hybrid_command(name="setpfp")
+    @app_commands.default_permissions(administrator=True)
+    async def set_profile_picture(self, ctx, url=None, image: discord.Attachment = None):
         """
         Change the bot's profile picture
         
@@ -86,22 +101,31 @@ class Settings(commands.Cog):
         
         # Get image from attachment or URL
         image_url = url
-        if not image_url and ctx.message.attachments:
-            image_url = ctx.message.attachments[0].url
+        if not image_url and image is not None:
+            image_url = image.url
             
         if not image_url:
             await ctx.send("Please provide an image URL or attach an image.")
             return
             
+        # Downloading and resizing can take longer than a slash command may wait for its reply
+        await ctx.defer()
+        
         try:
-            # Download the image
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as resp:
-                    if resp.status != 200:
-                        await ctx.send(f"Failed to download image. Status code: {resp.status}")
-                        return
-                        
-                    image_data = await resp.read()
+            # Download the image through the shared client, it stops at the size cap
+            try:
+                download = await self.bot.web.fetch(image_url, max_bytes=DOWNLOAD_LIMIT)
+            except DownloadError as e:
+                await ctx.send(f"Failed to download image. {e}")
+                return
+            
+            # Crop, resize and recompress in a thread so decoding doesn't block the bot
+            try:
+                image_data, note = await asyncio.to_thread(prepare_avatar, download.data)
+            except AvatarError as e:
+                await ctx.send(f"Can't use that image. {e}")
+                return
+            logger.info(f"Avatar from {len(download.data)} to {len(image_data)} bytes: {note}")
                     
             # Update the bot's profile picture
             await self.bot.user.edit(avatar=image_data)
@@ -130,7 +154,8 @@ class Settings(commands.Cog):
             await ctx.send(f"An error occurred: {e}")
             logger.error(f"Profile picture update failed: {e}")
     
-    @commands.command(name="setlogchannel")
+    @commands.hybrid_command(name="setlogchannel")
+    @app_commands.default_permissions(administrator=True)
     async def set_log_channel(self, ctx, channel: discord.TextChannel = None):
         """
         Set the channel for bot logging
@@ -161,7 +186,8 @@ class Settings(commands.Cog):
         else:
             await ctx.send("Failed to save the log channel. See logs for details.")
     
-    @commands.command(name="setadminrole")
+    @commands.hybrid_command(name="setadminrole")
+    @app_commands.default_permissions(administrator=True)
     async def set_admin_role(self, ctx, role: discord.Role = None):
         """
         Add a role with admin permissions for bot commands
@@ -199,7 +225,8 @@ class Settings(commands.Cog):
         else:
             await ctx.send(f"{role.mention} is already an admin role.")
     
-    @commands.command(name="removeadminrole")
+    @commands.hybrid_command(name="removeadminrole")
+    @app_commands.default_permissions(administrator=True)
     async def remove_admin_role(self, ctx, role: discord.Role):
         """
         Remove a role from having admin permissions for bot commands
@@ -219,7 +246,8 @@ class Settings(commands.Cog):
         else:
             await ctx.send(f"{role.mention} is not an admin role.")
     
-    @commands.command(name="config")
+    @commands.hybrid_command(name="config")
+    @app_commands.default_permissions(administrator=True)
     async def show_config(self, ctx):
         """
         Show the current bot configuration
@@ -263,5 +291,35 @@ class Settings(commands.Cog):
                 
         await ctx.send(embed=embed)
 
+    @commands.hybrid_command(name="cachestats")
+    @app_commands.default_permissions(administrator=True)
+    async def cache_stats(self, ctx):
+        """
+        Show message and member cache usage
+        
+        Usage: !cachestats
+        """
+        stats = self.bot.message_cache.stats()
+        
+        embed = discord.Embed(
+            title="Message Cache",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="Entries", value=f"{stats['entries']:,} / {self.bot.message_cache.max_entries:,}", inline=True)
+        embed.add_field(name="Memory", value=f"{stats['bytes'] / 1024 / 1024:.1f} MB / {self.bot.message_cache.max_bytes / 1024 / 1024:.0f} MB", inline=True)
+        embed.add_field(name="Hit Rate", value=f"{stats['hit_rate'] * 100:.1f}% ({stats['hits']:,} hits, {stats['misses']:,} misses)", inline=False)
+        embed.add_field(name="Evictions", value=f"{stats['evictions']:,}", inline=True)
+        
+        members = self.bot.member_cache.memory_report()
+        embed.add_field(
+            name=f"Member Cache ({members['mode']})",
+            value=f"{members['cached']:,} of {members['total']:,} members cached\n"
+                  f"About {members['estimated_bytes'] / 1024 / 1024:.1f} MB ({members['bytes_per_member']:,.0f} bytes each)\n"
+                  f"On-demand chunks: {members['chunks']:,}, released: {members['released']:,}",
+            inline=False
+        )
+        
+        await ctx.send(embed=embed)
+
 async def setup(bot):
     await bot.add_cog(Settings(bot)) 
\ No newline at end of file
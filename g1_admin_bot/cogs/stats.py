@@ -0,0 +1,182 @@
+import discord
+from discord.ext import commands, tasks
+import logging
+import asyncio
+import time
+from utils.activity import ActivityStore, GUILD, CHANNEL, USER, MINUTE, HOUR
+from utils.converters import AmbiguousMember, MemberLookup
+from utils.countdowns import parse_duration, format_duration
+
+logger = logging.getLogger("g1_admin.stats")
+
+DEFAULT_RANGE = 86400
+MAX_RANGE = 365 * 86400
+SPARK = "▁▂▃▄▅▆▇█"
+ROLLUP_NAMES = {MINUTE: "per minute", HOUR: "hourly"}
+
+def sparkline(values):
+    peak = max(values)
+    if not peak:
+        return SPARK[0] * len(values)
+    return "".join(SPARK[min(len(SPARK) - 1, value * len(SPARK) // (peak + 1))] for value in values)
+
+class Stats(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        config = getattr(self.bot, "_config", {})
+        
+        # Counters for the current minute and voice sessions carry over a !reload
+        state = self.bot.reloader.state_for(self.qualified_name)
+        self.activity = state["activity"] if state else ActivityStore(config.get("activity_db", "activity.db"))
+        
+        self.flush_activity.start()
+        self.bot.metrics.registry.add_collector(self.collect_metrics)
+        self.bot.memory.add_reporter(self.qualified_name, self.activity.memory_sizes)
+        
+    def collect_metrics(self):
+        self.bot.metrics.queue_depth.set(self.activity.pending_keys, "activity_counters")
+        
+    def export_state(self):
+        return {"activity": self.activity}
+        
+    async def cog_unload(self):
+        self.flush_activity.cancel()
+        self.bot.metrics.registry.remove_collector(self.collect_metrics)
+        self.bot.memory.remove_reporter(self.qualified_name)
+        # Mid-reload the state belongs to whichever instance ends up loaded, even when it's this one
+        if self.bot.reloader.is_handed_off(self.qualified_name):
+            return
+        self.activity.accrue_voice()
+        await asyncio.to_thread(self.activity.close_db)
+        
+    @tasks.loop(seconds=10)
+    async def flush_activity(self):
+        """Write the finished minutes' counters to disk in one batch"""
+        self.activity.accrue_voice()
+        sealed = self.activity.take_sealed()
+        if sealed:
+            try:
+                await asyncio.to_thread(self.activity.write, sealed)
+            except Exception as e:
+                self.activity.requeue(sealed)
+                logger.error(f"Error saving activity counters: {e}")
+                
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Members already in voice when the bot (re)connects
+        now = time.time()
+        for guild in self.bot.guilds:
+            for channel in guild.voice_channels + guild.stage_channels:
+                for member_id in channel.voice_states:
+                    member = guild.get_member(member_id)
+                    if member is None or not member.bot:
+                        self.activity.voice_moved(guild.id, member_id, channel.id, now)
+                        
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.guild is None or message.author.bot:
+            return
+        self.activity.message(message.guild.id, message.channel.id, message.author.id)
+        
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.activity.member_joined(member.guild.id)
+        
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload):
+        self.activity.member_left(payload.guild_id)
+        
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        if member.bot or before.channel == after.channel:
+            return
+        self.activity.voice_moved(member.guild.id, member.id, after.channel.id if after.channel else None)
+        
+    def read_stats(self, sealed, guild_id, scope, target_id, since, until):
+        """Runs in a worker thread: write what's buffered, then answer from the rollups"""
+        self.activity.write(sealed)
+        totals, resolution = self.activity.totals(guild_id, scope, target_id, since, until)
+        timeline = self.activity.timeline(guild_id, scope, target_id, since, until)
+        top_channels = top_members = []
+        if scope == GUILD:
+            top_channels = self.activity.top(guild_id, CHANNEL, since, until)
+            top_members = self.activity.top(guild_id, USER, since, until)
+        return totals, resolution, timeline, top_channels, top_members
+        
+    @commands.command(name="stats")
+    @commands.has_permissions(manage_messages=True)
+    async def show_stats(self, ctx, *, query=None):
+        """
+        Show server, channel or member activity
+        
+        Usage: !stats [#channel|@user] [range]
+        Example: !stats #general 7d
+        
+        The range is a duration like 1h, 24h or 30d (default 24h).
+        """
+        if ctx.guild is None:
+            await ctx.send("This command only works in a server.")
+            return
+            
+        words = query.split() if query else []
+        seconds = DEFAULT_RANGE
+        # A bare number could be an ID, ranges need a unit
+        if words and not words[-1].isdigit() and parse_duration(words[-1]):
+            seconds = min(parse_duration(words.pop()), MAX_RANGE)
+        target = " ".join(words)
+        
+        scope, target_id, label = GUILD, ctx.guild.id, ctx.guild.name
+        if target:
+            try:
+                channel = await commands.GuildChannelConverter().convert(ctx, target)
+                scope, target_id, label = CHANNEL, channel.id, f"#{channel.name}"
+            except commands.BadArgument:
+                try:
+                    member = await MemberLookup(partial=True).convert(ctx, target)
+                except AmbiguousMember as e:
+                    await ctx.send(str(e), allowed_mentions=discord.AllowedMentions.none())
+                    return
+                except commands.BadArgument:
+                    await ctx.send(f"Couldn't find a channel or member called `{target}`.", allowed_mentions=discord.AllowedMentions.none())
+                    return
+                scope, target_id, label = USER, member.id, member.display_name
+                
+        until = time.time()
+        since = until - seconds
+        # Include the counters of the current minute
+        self.activity.accrue_voice()
+        sealed = self.activity.take_all()
+        try:
+            totals, resolution, timeline, top_channels, top_members = await asyncio.to_thread(
+                self.read_stats, sealed, ctx.guild.id, scope, target_id, since, until
+            )
+        except Exception as e:
+            self.activity.requeue(sealed)
+            logger.error(f"Error reading activity stats: {e}")
+            await ctx.send("Couldn't read the activity stats, try again in a moment.")
+            return
+            
+        embed = discord.Embed(
+            title=f"📊 Activity: {label}",
+            description=f"Last {format_duration(seconds)}",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="Messages", value=f"{totals['messages']:,}", inline=True)
+        embed.add_field(name="Voice", value=format_duration(totals["voice_seconds"]) if totals["voice_seconds"] else "None", inline=True)
+        if scope == GUILD:
+            embed.add_field(name="Joins / Leaves", value=f"{totals['joins']:,} / {totals['leaves']:,}", inline=True)
+        embed.add_field(
+            name="Messages Over Time",
+            value=f"`{sparkline(timeline)}`\n<t:{int(since)}:R> to now, peak {max(timeline):,}",
+            inline=False
+        )
+        if top_channels:
+            embed.add_field(name="Top Channels", value="\n".join(f"<#{channel_id}>: {count:,}" for channel_id, count in top_channels), inline=True)
+        if top_members:
+            embed.add_field(name="Top Members", value="\n".join(f"<@{user_id}>: {count:,}" for user_id, count in top_members), inline=True)
+            
+        embed.set_footer(text=f"From {ROLLUP_NAMES.get(resolution, 'daily')} rollups | {getattr(self.bot, 'author', 'G1 Admin')}")
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    await bot.add_cog(Stats(bot))
\ No newline at end of file
@@ -0,0 +1,290 @@
+"""
+Cluster launcher: runs the bot as several worker processes, each owning a range of shards
+
+    python g1_admin_bot/launcher.py
+
+Workers are ordinary bot.py processes started with SHARD_COUNT/SHARD_IDS set, so
+each one only connects its own shards. They talk to each other through a Unix
+socket served here (total guild count, broadcast status, global stats) and a
+worker that crashes is restarted on its own without touching the others.
+
+Settings come from config.json or the environment (environment wins):
+    cluster_workers / CLUSTER_WORKERS   worker processes, defaults to the CPU count
+    shard_count / SHARD_COUNT           total shards, asked from Discord when unset
+    cluster_socket / CLUSTER_SOCKET     IPC socket path, defaults to cluster.sock
+
+To try it locally without Discord, run fake workers that only speak the IPC protocol:
+    python g1_admin_bot/launcher.py --fake --workers 3 --shards 12 --crash-after 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import time
+
+from utils.cluster import ClusterClient, ClusterServer, summarise_stats
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("g1_admin.launcher")
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+IDENTIFY_INTERVAL = 5.0    # Discord allows one identify per 5 seconds per bucket
+RESTART_DELAY = 1.0        # first restart delay, doubled on every crash in a row
+MAX_RESTART_DELAY = 60.0
+STABLE_AFTER = 300.0       # a worker up this long has its restart delay reset
+STOP_TIMEOUT = 15.0        # grace period before killing workers on shutdown
+REPORT_INTERVAL = 300.0
+
+
+def load_settings():
+    config = {}
+    if os.path.exists("config.json"):
+        with open("config.json", "r") as f:
+            config = json.load(f)
+
+    return {
+        "token": os.getenv("BOT_TOKEN") or config.get("token", ""),
+        "workers": os.getenv("CLUSTER_WORKERS") or config.get("cluster_workers"),
+        "shard_count": os.getenv("SHARD_COUNT") or config.get("shard_count"),
+        "socket": os.getenv("CLUSTER_SOCKET") or config.get("cluster_socket", "cluster.sock"),
+    }
+
+
+async def recommended_shard_count(token):
+    """The shard count Discord recommends for this bot"""
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"}
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data["shards"]
+
+
+def shard_ranges(shard_count, workers):
+    """Split shards 0..shard_count-1 into contiguous (first, last) ranges, one per worker"""
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    first = 0
+    for i in range(workers):
+        last = first + size + (1 if i < extra else 0) - 1
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+class Worker:
+    """One worker process and its restart history"""
+
+    def __init__(self, cluster_id, first, last):
+        self.cluster_id = str(cluster_id)
+        self.first = first
+        self.last = last
+        self.process = None
+        self.restarts = 0
+
+    @property
+    def shards(self):
+        return f"{self.first}-{self.last}"
+
+    def env(self, shard_count, socket_path):
+        env = dict(os.environ)
+        env.update({
+            "SHARD_COUNT": str(shard_count),
+            "SHARD_IDS": self.shards,
+            "CLUSTER_ID": self.cluster_id,
+            "CLUSTER_SOCKET": os.path.abspath(socket_path),
+        })
+        return env
+
+
+class Launcher:
+    def __init__(self, command, shard_count, workers, socket_path, stagger=IDENTIFY_INTERVAL,
+                 report_interval=REPORT_INTERVAL, extra_env=None):
+        self.command = command
+        self.shard_count = shard_count
+        self.socket_path = socket_path
+        self.stagger = stagger
+        self.report_interval = report_interval
+        self.extra_env = extra_env or {}
+        self.workers = [
+            Worker(i, first, last) for i, (first, last) in enumerate(shard_ranges(shard_count, workers))
+        ]
+        self.server = ClusterServer(socket_path)
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        await self.server.start()
+        tasks = []
+        try:
+            for worker in self.workers:
+                tasks.append(asyncio.create_task(self.supervise(worker)))
+                # Workers start one after another so their shards don't all identify at once
+                if await self._sleep(self.stagger * (worker.last - worker.first + 1)):
+                    break
+            tasks.append(asyncio.create_task(self.report()))
+
+            await self.stopping.wait()
+        finally:
+            self.stopping.set()
+            await self.stop_workers()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.close()
+
+    async def _sleep(self, seconds):
+        """Sleep unless shutting down, returns True if shutdown started"""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def supervise(self, worker):
+        delay = RESTART_DELAY
+        while not self.stopping.is_set():
+            env = worker.env(self.shard_count, self.socket_path)
+            env.update(self.extra_env)
+            worker.process = await asyncio.create_subprocess_exec(*self.command, env=env)
+            started = time.monotonic()
+            logger.info(f"Cluster {worker.cluster_id} started (shards {worker.shards}, pid {worker.process.pid})")
+
+            code = await worker.process.wait()
+            if self.stopping.is_set():
+                break
+
+            if time.monotonic() - started > STABLE_AFTER:
+                delay = RESTART_DELAY
+            worker.restarts += 1
+            logger.warning(f"Cluster {worker.cluster_id} (shards {worker.shards}) exited with code {code}, "
+                           f"restarting in {delay:.0f}s (restart #{worker.restarts})")
+            if await self._sleep(delay):
+                break
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+
+    async def stop_workers(self):
+        running = [w.process for w in self.workers if w.process is not None and w.process.returncode is None]
+        for process in running:
+            process.terminate()
+        if not running:
+            return
+
+        await asyncio.wait([asyncio.create_task(p.wait()) for p in running], timeout=STOP_TIMEOUT)
+        for process in running:
+            if process.returncode is None:
+                logger.warning(f"Worker pid {process.pid} didn't stop in time, killing it")
+                process.kill()
+        await asyncio.gather(*(p.wait() for p in running), return_exceptions=True)
+
+    async def report(self):
+        while not await self._sleep(self.report_interval):
+            results = await self.server.query("stats")
+            totals = summarise_stats(results)
+            restarts = sum(w.restarts for w in self.workers)
+            logger.info(f"Cluster: {totals['online']}/{len(self.workers)} workers online, "
+                        f"{totals['guilds']:,} guilds, {totals['members']:,} members, "
+                        f"{totals['events_per_second']:.1f} events/s, "
+                        f"{len(totals['broadcasts'])} broadcasts running, {restarts} restarts")
+
+    def stop(self):
+        logger.info("Shutting down the cluster")
+        self.stopping.set()
+
+
+async def run_fake_worker(crash_after):
+    """
+    Stand-in for bot.py that only speaks the IPC protocol
+
+    Answers "stats" with made up numbers for its shards, asks the cluster for the
+    totals now and then, and crashes after crash_after seconds if set.
+    """
+    cluster_id = os.environ["CLUSTER_ID"]
+    first, last = (int(n) for n in os.environ["SHARD_IDS"].split("-"))
+    shards = list(range(first, last + 1))
+    log = logging.getLogger(f"g1_admin.fake.{cluster_id}")
+
+    client = ClusterClient(os.environ["CLUSTER_SOCKET"], cluster_id)
+    client.register("stats", lambda args: {
+        "shards": shards,
+        "guilds": sum(100 + shard * 7 for shard in shards),
+        "members": sum((100 + shard * 7) * 250 for shard in shards),
+        "latency": random.uniform(0.03, 0.12),
+        "events_per_second": random.uniform(50, 150) * len(shards),
+        "broadcasts": [],
+        "pid": os.getpid(),
+    })
+    await client.connect()
+
+    started = time.monotonic()
+    while client.connected:
+        await asyncio.sleep(2.0)
+        if crash_after and time.monotonic() - started > crash_after * random.uniform(0.5, 1.5):
+            log.error("Simulated crash")
+            os._exit(1)
+
+        try:
+            totals = summarise_stats(await client.request("stats"))
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            log.warning(f"Cluster query failed: {e}")
+            continue
+        log.info(f"Shards {first}-{last} see {totals['guilds']:,} guilds across {totals['online']} workers")
+
+
+async def main(args):
+    settings = load_settings()
+    socket_path = args.socket or settings["socket"]
+    workers = int(args.workers or settings["workers"] or os.cpu_count() or 1)
+
+    if args.fake:
+        shard_count = int(args.shards or settings["shard_count"] or workers * 4)
+        command = [sys.executable, os.path.abspath(__file__), "--fake-worker"]
+        extra_env = {"FAKE_CRASH_AFTER": str(args.crash_after or 0)}
+        launcher = Launcher(command, shard_count, workers, socket_path, stagger=0,
+                            report_interval=5.0, extra_env=extra_env)
+    else:
+        if not settings["token"]:
+            logger.error("Bot token not found in config.json or environment variables.")
+            return 1
+        shard_count = args.shards or settings["shard_count"]
+        if not shard_count:
+            shard_count = await recommended_shard_count(settings["token"])
+            logger.info(f"Discord recommends {shard_count} shards")
+        launcher = Launcher([sys.executable, BOT_SCRIPT], int(shard_count), workers, socket_path)
+
+    logger.info(f"Starting {len(launcher.workers)} workers for {launcher.shard_count} shards")
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, launcher.stop)
+
+    await launcher.run()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the bot as a cluster of worker processes")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--shards", type=int, help="total shard count")
+    parser.add_argument("--socket", help="path of the IPC socket")
+    parser.add_argument("--fake", action="store_true", help="run fake workers instead of connecting to Discord")
+    parser.add_argument("--crash-after", type=float, help="fake workers crash after about this many seconds")
+    parser.add_argument("--fake-worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fake_worker:
+        asyncio.run(run_fake_worker(float(os.getenv("FAKE_CRASH_AFTER", "0"))))
+    else:
+        sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,276 @@
+import array
+import logging
+import sqlite3
+import threading
+import time
+
+from utils.memory import deep_sizeof, sampled_sizeof_all
+
+logger = logging.getLogger("g1_admin.activity")
+
+# Counters kept per bucket, in this order in every in-memory array and row
+KINDS = ("messages", "voice_seconds", "joins", "leaves")
+MESSAGES, VOICE_SECONDS, JOINS, LEAVES = range(len(KINDS))
+
+# What a counter belongs to. Joins and leaves only exist for the guild
+GUILD, CHANNEL, USER = range(3)
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+# Bucket width -> seconds its rows are kept, None for forever
+RETENTION = {MINUTE: 2 * DAY, HOUR: 90 * DAY, DAY: None}
+# Users have too many rows to keep per minute
+RESOLUTIONS = {GUILD: (MINUTE, HOUR, DAY), CHANNEL: (MINUTE, HOUR, DAY), USER: (HOUR, DAY)}
+
+MAX_PENDING_KEYS = 20000  # counters held for the current minute before they are sealed early
+MAX_SEALED = 60           # sealed batches kept while writes fail, the oldest are dropped
+PRUNE_INTERVAL = HOUR
+
+ZERO = array.array("Q", [0] * len(KINDS))
+
+
+def resolution_for(scope, seconds):
+    """The finest bucket width that covers a range in at most 200 buckets"""
+    for resolution in RESOLUTIONS[scope]:
+        if seconds <= resolution * 200:
+            return resolution
+    return DAY
+
+
+class ActivityStore:
+    """
+    Activity counters per guild, channel and user, rolled up by minute, hour and day in SQLite
+
+    Events only bump a counter in memory: an array of len(KINDS) per
+    (guild, scope, target) for the current minute. When the minute is over,
+    or more than MAX_PENDING_KEYS targets were active in it, the batch is
+    sealed, and write() adds the sealed batches to the minute, hour and day
+    rows on disk in one transaction. Memory is the targets active in the last minute or so,
+    however many events there were, and raw events are never stored.
+
+    Rows older than their resolution's RETENTION are pruned, queries pick
+    the finest resolution that covers the range with at most ~200 buckets.
+    """
+
+    def __init__(self, path="activity.db"):
+        self.path = path
+        # (guild_id, scope, target_id) -> counts for the current minute
+        self._pending = {}
+        self._minute = 0
+        self._minute_end = 0
+        # (minute, pending) waiting to be written
+        self._sealed = []
+        # (guild_id, user_id) -> [channel_id, seconds counted up to]
+        self._voice = {}
+        self._lock = threading.Lock()
+        self._pruned_at = 0
+
+        self.events = 0
+        self.rows_written = 0
+        self.dropped = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS activity (
+                guild_id INTEGER NOT NULL,
+                scope INTEGER NOT NULL,
+                target_id INTEGER NOT NULL,
+                resolution INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                messages INTEGER NOT NULL DEFAULT 0,
+                voice_seconds INTEGER NOT NULL DEFAULT 0,
+                joins INTEGER NOT NULL DEFAULT 0,
+                leaves INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, scope, resolution, bucket, target_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS activity_by_target ON activity (guild_id, scope, target_id, resolution, bucket);
+            CREATE INDEX IF NOT EXISTS activity_expiry ON activity (resolution, bucket);
+        """)
+        self._db.commit()
+
+    # Counting, on the event loop
+
+    def _counts(self, guild_id, scope, target_id, now):
+        if now >= self._minute_end or len(self._pending) >= MAX_PENDING_KEYS:
+            self._seal(now)
+        key = (guild_id, scope, target_id)
+        counts = self._pending.get(key)
+        if counts is None:
+            counts = self._pending[key] = array.array("Q", ZERO)
+        return counts
+
+    def _seal(self, now):
+        if self._pending:
+            self._sealed.append((self._minute, self._pending))
+            self._pending = {}
+            if len(self._sealed) > MAX_SEALED:
+                _, lost = self._sealed.pop(0)
+                self.dropped += len(lost)
+                logger.warning(f"Activity writes are falling behind, dropped a batch of {len(lost)} counters")
+        self._minute = int(now) // MINUTE * MINUTE
+        self._minute_end = self._minute + MINUTE
+
+    def message(self, guild_id, channel_id, user_id, now=None):
+        now = time.time() if now is None else now
+        self._counts(guild_id, GUILD, guild_id, now)[MESSAGES] += 1
+        self._counts(guild_id, CHANNEL, channel_id, now)[MESSAGES] += 1
+        self._counts(guild_id, USER, user_id, now)[MESSAGES] += 1
+        self.events += 1
+
+    def member_joined(self, guild_id, now=None):
+        self._counts(guild_id, GUILD, guild_id, time.time() if now is None else now)[JOINS] += 1
+        self.events += 1
+
+    def member_left(self, guild_id, now=None):
+        self._counts(guild_id, GUILD, guild_id, time.time() if now is None else now)[LEAVES] += 1
+        self.events += 1
+
+    def voice_moved(self, guild_id, user_id, channel_id, now=None):
+        """A member joined, left (channel_id None) or switched voice channels"""
+        now = time.time() if now is None else now
+        self._accrue_one((guild_id, user_id), now)
+        if channel_id is None:
+            self._voice.pop((guild_id, user_id), None)
+        else:
+            self._voice[(guild_id, user_id)] = [channel_id, now]
+        self.events += 1
+
+    def _accrue_one(self, key, now):
+        session = self._voice.get(key)
+        if session is None:
+            return
+        channel_id, since = session
+        seconds = int(now - since)
+        if seconds <= 0:
+            return
+        guild_id, user_id = key
+        self._counts(guild_id, GUILD, guild_id, now)[VOICE_SECONDS] += seconds
+        self._counts(guild_id, CHANNEL, channel_id, now)[VOICE_SECONDS] += seconds
+        self._counts(guild_id, USER, user_id, now)[VOICE_SECONDS] += seconds
+        session[1] = since + seconds
+
+    def accrue_voice(self, now=None):
+        """Count the time members have been in voice so far, so long calls show up as they happen"""
+        now = time.time() if now is None else now
+        for key in list(self._voice):
+            self._accrue_one(key, now)
+
+    def take_sealed(self, now=None):
+        """Hand over the finished batches (call from the event loop), the current minute once it's over"""
+        now = time.time() if now is None else now
+        if now >= self._minute_end:
+            self._seal(now)
+        sealed, self._sealed = self._sealed, []
+        return sealed
+
+    def take_all(self):
+        """Every batch including the current minute's, before a query or on shutdown"""
+        if self._pending:
+            self._sealed.append((self._minute, self._pending))
+            self._pending = {}
+        sealed, self._sealed = self._sealed, []
+        return sealed
+
+    def requeue(self, sealed):
+        """Put batches back after a failed write, they go out with the next one"""
+        self._sealed[:0] = sealed
+        while len(self._sealed) > MAX_SEALED:
+            _, lost = self._sealed.pop(0)
+            self.dropped += len(lost)
+
+    @property
+    def pending_keys(self):
+        return len(self._pending) + sum(len(pending) for _, pending in self._sealed)
+
+    def memory_sizes(self):
+        return {
+            "activity_pending": sampled_sizeof_all([self._pending] + [pending for _, pending in self._sealed]),
+            "voice_sessions": deep_sizeof(self._voice),
+        }
+
+    # Disk, safe to call from a worker thread
+
+    def write(self, sealed):
+        """Add sealed batches to the minute, hour and day rows, returns the rows written"""
+        if not sealed:
+            return 0
+        rows = []
+        for minute, pending in sealed:
+            for (guild_id, scope, target_id), counts in pending.items():
+                for resolution in RESOLUTIONS[scope]:
+                    rows.append((guild_id, scope, target_id, resolution, minute // resolution * resolution, *counts))
+
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO activity (guild_id, scope, target_id, resolution, bucket, "
+                "messages, voice_seconds, joins, leaves) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (guild_id, scope, resolution, bucket, target_id) DO UPDATE SET "
+                "messages = messages + excluded.messages, voice_seconds = voice_seconds + excluded.voice_seconds, "
+                "joins = joins + excluded.joins, leaves = leaves + excluded.leaves",
+                rows
+            )
+            self._db.commit()
+
+            now = time.time()
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                self._prune(now)
+                self._pruned_at = now
+
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def _prune(self, now):
+        removed = 0
+        for resolution, keep in RETENTION.items():
+            if keep is not None:
+                removed += self._db.execute(
+                    "DELETE FROM activity WHERE resolution = ? AND bucket < ?", (resolution, int(now - keep))
+                ).rowcount
+        self._db.commit()
+        if removed:
+            logger.info(f"Pruned {removed:,} expired activity rows")
+
+    def totals(self, guild_id, scope, target_id, since, until):
+        """{kind: total} over [since, until), and the resolution it was read at"""
+        resolution = resolution_for(scope, until - since)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT SUM(messages), SUM(voice_seconds), SUM(joins), SUM(leaves) FROM activity INDEXED BY activity_by_target "
+                "WHERE guild_id = ? AND scope = ? AND target_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?",
+                (guild_id, scope, target_id, resolution, int(since) // resolution * resolution, int(until))
+            ).fetchone()
+        return {kind: value or 0 for kind, value in zip(KINDS, row)}, resolution
+
+    def timeline(self, guild_id, scope, target_id, since, until, kind="messages", points=24):
+        """Totals of one kind in points equal slices of [since, until), oldest first"""
+        resolution = resolution_for(scope, until - since)
+        start = int(since) // resolution * resolution
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT bucket, {KINDS[KINDS.index(kind)]} FROM activity INDEXED BY activity_by_target "
+                "WHERE guild_id = ? AND scope = ? AND target_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?",
+                (guild_id, scope, target_id, resolution, start, int(until))
+            ).fetchall()
+        width = (until - start) / points
+        values = [0] * points
+        for bucket, value in rows:
+            values[min(points - 1, int((bucket - start) / width))] += value
+        return values
+
+    def top(self, guild_id, scope, since, until, kind="messages", limit=5):
+        """[(target_id, total)] with the highest totals of one kind over [since, until)"""
+        resolution = resolution_for(scope, until - since)
+        column = KINDS[KINDS.index(kind)]
+        with self._lock:
+            return self._db.execute(
+                f"SELECT target_id, SUM({column}) AS total FROM activity "
+                "WHERE guild_id = ? AND scope = ? AND resolution = ? AND bucket >= ? AND bucket < ? "
+                "GROUP BY target_id HAVING total > 0 ORDER BY total DESC LIMIT ?",
+                (guild_id, scope, resolution, int(since) // resolution * resolution, int(until), limit)
+            ).fetchall()
+
+    def close_db(self):
+        self.write(self.take_all())
+        with self._lock:
+            self._db.close()
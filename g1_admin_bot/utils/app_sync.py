@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+import discord
+
+from utils import fastjson
+
+logger = logging.getLogger("g1_admin.app_sync")
+
+HASH_FILE = "app_commands.json"
+
+
+def command_schema(tree, guild=None):
+    """The payload Discord would get for a scope's commands, sorted so it hashes the same every time"""
+    payload = []
+    for command in tree.get_commands(guild=guild):
+        try:
+            data = command.to_dict(tree)
+        except TypeError:
+            # discord.py before 2.4 takes no tree argument
+            data = command.to_dict()
+        payload.append(data)
+    payload.sort(key=lambda data: (data.get("type", 1), data["name"]))
+    return payload
+
+
+def schema_hash(schema):
+    # Always the standard library, so switching json_backend doesn't change every hash
+    encoded = json.dumps(schema, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class AppCommandSync:
+    """
+    Syncs the slash command tree only when its schema has changed
+
+    Discord rate limits command syncs heavily, so the hash of each scope's
+    commands (global, and each guild synced separately) is stored in a local
+    file after a successful sync. On startup a scope is only synced again
+    when its hash differs.
+
+    Guilds listed in guild_ids get a copy of the global commands, which
+    update instantly there, handy while testing. They are synced instead of
+    the global scope, Discord would show both copies in those guilds
+    otherwise. Guilds that had a copy and are no longer listed have it
+    removed on the next sync, so the global commands show there once again.
+    Only one process should sync, so cluster workers other than 0 are disabled.
+    """
+
+    def __init__(self, bot, path=HASH_FILE, guild_ids=(), enabled=True):
+        self.bot = bot
+        self.path = path
+        self.enabled = enabled
+        self.guild_ids = [int(guild_id) for guild_id in guild_ids]
+        self.synced = []
+        self.skipped = []
+
+    def _load_hashes(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return fastjson.load(f)
+        except Exception as e:
+            logger.error(f"Error loading command hashes, syncing everything: {e}")
+            return {}
+
+    def _save_hashes(self, hashes):
+        with open(self.path, 'w') as f:
+            fastjson.dump(hashes, f, indent=4)
+
+    def scopes(self):
+        """The configured guilds, with a copy of the global commands, or None for the global scope"""
+        if not self.guild_ids:
+            return [None]
+        scopes = []
+        for guild_id in self.guild_ids:
+            guild = discord.Object(id=guild_id)
+            self.bot.tree.copy_global_to(guild=guild)
+            scopes.append(guild)
+        return scopes
+
+    async def _clear_stale_guilds(self, hashes, application_id):
+        """Remove the command copies of guilds that are no longer in guild_ids"""
+        prefix = f"{application_id}:"
+        for key in list(hashes):
+            scope = key[len(prefix):] if key.startswith(prefix) else None
+            if scope is None or scope == "global" or int(scope) in self.guild_ids:
+                continue
+            guild = discord.Object(id=int(scope))
+            self.bot.tree.clear_commands(guild=guild)
+            try:
+                await self.bot.tree.sync(guild=guild)
+            except discord.HTTPException as e:
+                logger.error(f"Removing the application commands of guild {scope} failed: {e}")
+                continue
+            del hashes[key]
+            self.synced.append(f"{scope} (cleared)")
+
+    async def sync(self, force=False):
+        """Sync the scopes whose schema changed, returns (synced, skipped) scope names"""
+        if not self.enabled:
+            return [], []
+        hashes = await asyncio.to_thread(self._load_hashes)
+        application_id = self.bot.application_id
+        self.synced, self.skipped = [], []
+        await self._clear_stale_guilds(hashes, application_id)
+
+        for guild in self.scopes():
+            scope = "global" if guild is None else str(guild.id)
+            # Keyed by application too, so a test bot's token doesn't share the file's hashes
+            key = f"{application_id}:{scope}"
+            digest = schema_hash(command_schema(self.bot.tree, guild))
+
+            if not force and hashes.get(key) == digest:
+                self.skipped.append(scope)
+                continue
+
+            try:
+                await self.bot.tree.sync(guild=guild)
+            except discord.HTTPException as e:
+                logger.error(f"Syncing {scope} application commands failed: {e}")
+                continue
+            hashes[key] = digest
+            self.synced.append(scope)
+
+        if self.synced:
+            await asyncio.to_thread(self._save_hashes, hashes)
+            logger.info(f"Synced application commands: {', '.join(self.synced)}")
+        if self.skipped:
+            logger.info(f"Application commands unchanged, not synced: {', '.join(self.skipped)}")
+        return self.synced, self.skipped
@@ -0,0 +1,155 @@
+import io
+import logging
+
+try:
+    from PIL import Image, ImageSequence
+except ImportError:
+    Image = None
+
+logger = logging.getLogger("g1_admin.avatars")
+
+UPLOAD_LIMIT = 10 * 1024 * 1024     # Discord refuses larger avatars
+DOWNLOAD_LIMIT = 25 * 1024 * 1024   # accepted before processing, it's usually much smaller after
+AVATAR_SIZE = 1024                  # Discord shows avatars at 1024px at most
+MIN_SIZE = 128                      # smallest we shrink to before giving up on animation
+MAX_PIXELS = 40_000_000             # larger images are refused before decoding
+MAX_FRAMES = 500
+MAX_TOTAL_PIXELS = 100_000_000      # all frames together, refused before decoding, and the budget for the encoded frames
+FORMATS = ("PNG", "JPEG", "GIF", "WEBP")
+
+
+class AvatarError(ValueError):
+    """The image can't be used as an avatar, the message is fit to show users"""
+
+
+def _square(frame, size):
+    """Center crop to a square, then shrink to size if it's larger"""
+    width, height = frame.size
+    side = min(width, height)
+    if width != height:
+        left = (width - side) // 2
+        top = (height - side) // 2
+        frame = frame.crop((left, top, left + side, top + side))
+    if side > size:
+        frame = frame.resize((size, size), Image.LANCZOS, reducing_gap=3.0)
+    return frame
+
+
+def _encode_static(image, size, max_bytes):
+    frame = image.convert("RGBA") if image.mode not in ("RGB", "RGBA") else image
+    frame = _square(frame, size)
+
+    # optimize=True takes four times as long for about 10% smaller files
+    buffer = io.BytesIO()
+    frame.save(buffer, "PNG")
+    if buffer.tell() <= max_bytes:
+        return buffer.getvalue(), "PNG"
+
+    # Photos compress far better as JPEG, the transparency is lost
+    buffer = io.BytesIO()
+    frame.convert("RGB").save(buffer, "JPEG", quality=90, optimize=True)
+    if buffer.tell() <= max_bytes:
+        return buffer.getvalue(), "JPEG"
+    raise AvatarError("The image is still too large after compressing it.")
+
+
+def _encode_animated(image, size, max_bytes, frame_count):
+    transparent = "transparency" in image.info
+    # Pillow keeps every encoded frame until the file is written, about a byte per pixel
+    while size >= MIN_SIZE and frame_count * size * size > MAX_TOTAL_PIXELS:
+        size //= 2
+    while size >= MIN_SIZE:
+        image.seek(0)
+        first = _square(image.convert("RGBA" if transparent else "RGB"), size)
+        durations = [image.info.get("duration", 100)]
+
+        options = {}
+        if transparent:
+            # Each frame has to be cleared before the next to keep the transparency
+            options["disposal"] = 2
+            palette = None
+        else:
+            # One shared palette keeps unchanged pixels identical from frame to frame,
+            # so only what changed is stored, per frame palettes made files 10x larger
+            palette = first = first.quantize(256)
+
+        def rest():
+            # One frame converted at a time. Pillow reads durations[i] after taking frame i
+            for index in range(1, frame_count):
+                image.seek(index)
+                durations.append(image.info.get("duration", 100))
+                frame = _square(image.convert("RGBA" if transparent else "RGB"), size)
+                yield frame if palette is None else frame.quantize(palette=palette, dither=Image.Dither.NONE)
+
+        buffer = io.BytesIO()
+        first.save(
+            buffer,
+            "GIF",
+            save_all=True,
+            append_images=rest(),
+            duration=durations,
+            loop=image.info.get("loop", 0),
+            **options
+        )
+        if buffer.tell() <= max_bytes:
+            return buffer.getvalue(), first.width
+        size //= 2
+    return None, None
+
+
+def prepare_avatar(data, max_bytes=UPLOAD_LIMIT, size=AVATAR_SIZE):
+    """
+    Turn downloaded image bytes into an avatar Discord will accept
+
+    Blocking, run it with asyncio.to_thread. The image is cropped to a square
+    and shrunk to size, and recompressed when it's over max_bytes. Animated
+    GIFs stay animated if they fit at some size, otherwise the first frame is
+    used. Images that are already small and square are returned unchanged.
+    Returns (bytes, note) where note describes what was done, or raises AvatarError.
+
+    Without Pillow images can't be processed, so they're only size checked.
+    """
+    if Image is None:
+        if len(data) > max_bytes:
+            raise AvatarError(f"The image is larger than {max_bytes // 1024 // 1024} MB.")
+        return data, "uploaded as is"
+
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        raise AvatarError("That doesn't look like an image.")
+
+    # Opening only reads the header, refuse huge images before decoding any pixels
+    width, height = image.size
+    if image.format not in FORMATS:
+        raise AvatarError("Only PNG, JPEG, GIF and WEBP images are supported.")
+    if width * height > MAX_PIXELS:
+        raise AvatarError(f"The image is too large ({width}x{height}).")
+
+    frames = getattr(image, "n_frames", 1)
+    if frames > MAX_FRAMES:
+        raise AvatarError(f"The animation has too many frames ({frames}).")
+    if frames * width * height > MAX_TOTAL_PIXELS:
+        raise AvatarError(f"The animation is too large ({frames} frames of {width}x{height}).")
+
+    if (width == height and width <= size and len(data) <= max_bytes
+            and image.format in ("PNG", "JPEG", "GIF")):
+        return data, "uploaded as is"
+
+    try:
+        if frames > 1 and image.format == "GIF":
+            result, side = _encode_animated(image, size, max_bytes, frames)
+            if result is not None:
+                return result, f"animated, {frames} frames at {side}x{side}"
+            image.seek(0)
+            result, fmt = _encode_static(image, size, max_bytes)
+            return result, f"animation too large, first frame used as {fmt}"
+
+        result, fmt = _encode_static(image, size, max_bytes)
+        side = min(width, height, size)
+        return result, f"{fmt} at {side}x{side}"
+    except AvatarError:
+        raise
+    except Exception as e:
+        logger.warning(f"Avatar processing failed: {e}")
+        raise AvatarError("The image could not be processed.")
@@ -0,0 +1,248 @@
+import asyncio
+import itertools
+import logging
+import os
+
+from utils import fastjson
+
+logger = logging.getLogger("g1_admin.cluster")
+
+# Messages are single JSON objects, one per line
+MAX_MESSAGE_SIZE = 4 * 1024 * 1024
+
+
+async def send_message(writer, message):
+    writer.write(fastjson.dumps(message).encode() + b"\n")
+    await writer.drain()
+
+
+async def read_message(reader):
+    """The next message, or None once the other side has gone away"""
+    try:
+        line = await reader.readline()
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        return None
+    if not line:
+        return None
+    return fastjson.loads(line)
+
+
+def summarise_stats(results):
+    """
+    Add up the "stats" answers of every worker
+
+    results is {cluster_id: stats or None}, each stats dict as built by the
+    Diagnostics cog (or the fake worker): guilds, members, events_per_second, broadcasts.
+    """
+    online = [stats for stats in results.values() if stats]
+    return {
+        "clusters": len(results),
+        "online": len(online),
+        "guilds": sum(stats.get("guilds", 0) for stats in online),
+        "members": sum(stats.get("members", 0) for stats in online),
+        "events_per_second": sum(stats.get("events_per_second", 0.0) for stats in online),
+        "broadcasts": [b for stats in online for b in stats.get("broadcasts", [])],
+    }
+
+
+class ClusterServer:
+    """
+    The launcher's side of the IPC socket
+
+    Workers say hello with their cluster ID, then either answer queries or ask
+    for one. A worker's request is fanned out to every connected worker (itself
+    included) and the replies come back keyed by cluster ID.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.workers = {}
+        self._nonces = itertools.count(1)
+        # (nonce, cluster_id) -> future waiting for that worker's reply
+        self._waiting = {}
+        self._server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=MAX_MESSAGE_SIZE)
+        logger.info(f"Cluster IPC listening on {self.path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for writer in self.workers.values():
+            writer.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader, writer):
+        hello = await read_message(reader)
+        if not hello or hello.get("op") != "hello":
+            writer.close()
+            return
+
+        cluster_id = str(hello["cluster_id"])
+        self.workers[cluster_id] = writer
+        logger.info(f"Cluster {cluster_id} connected")
+
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+
+                op = message.get("op")
+                if op == "reply":
+                    future = self._waiting.get((message["nonce"], cluster_id))
+                    if future is not None and not future.done():
+                        future.set_result(message.get("data"))
+                elif op == "request":
+                    asyncio.create_task(self._answer(writer, message))
+        finally:
+            if self.workers.get(cluster_id) is writer:
+                del self.workers[cluster_id]
+            # Nobody is going to answer for this worker any more
+            for (nonce, waiting_id), future in list(self._waiting.items()):
+                if waiting_id == cluster_id and not future.done():
+                    future.set_result(None)
+            writer.close()
+            logger.info(f"Cluster {cluster_id} disconnected")
+
+    async def _answer(self, writer, message):
+        data = await self.query(message["query"], message.get("args"), message.get("timeout", 5.0))
+        try:
+            await send_message(writer, {"op": "response", "id": message["id"], "data": data})
+        except ConnectionError:
+            pass
+
+    async def query(self, name, args=None, timeout=5.0):
+        """
+        Ask every worker and collect the answers
+
+        Returns {cluster_id: data}, with None for workers that failed or timed out.
+        """
+        nonce = next(self._nonces)
+        loop = asyncio.get_running_loop()
+        futures = {}
+
+        for cluster_id, writer in list(self.workers.items()):
+            future = loop.create_future()
+            self._waiting[(nonce, cluster_id)] = future
+            futures[cluster_id] = future
+            try:
+                await send_message(writer, {"op": "query", "nonce": nonce, "query": name, "args": args})
+            except ConnectionError:
+                future.set_result(None)
+
+        try:
+            if futures:
+                await asyncio.wait(futures.values(), timeout=timeout)
+        finally:
+            for cluster_id in futures:
+                self._waiting.pop((nonce, cluster_id), None)
+
+        return {
+            cluster_id: future.result() if future.done() else None
+            for cluster_id, future in futures.items()
+        }
+
+
+class ClusterClient:
+    """
+    A worker's side of the IPC socket
+
+    Register handlers for the queries this worker can answer, then use
+    request() to ask the whole cluster, e.g. for the total guild count.
+    """
+
+    def __init__(self, path, cluster_id):
+        self.path = path
+        self.cluster_id = str(cluster_id)
+        self.handlers = {}
+        self._ids = itertools.count(1)
+        self._requests = {}
+        self._writer = None
+        self._task = None
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    def register(self, name, handler):
+        """handler(args) returns JSON-serialisable data, it may be a coroutine function"""
+        self.handlers[name] = handler
+
+    def unregister(self, name):
+        self.handlers.pop(name, None)
+
+    async def connect(self):
+        reader, self._writer = await asyncio.open_unix_connection(self.path, limit=MAX_MESSAGE_SIZE)
+        await send_message(self._writer, {"op": "hello", "cluster_id": self.cluster_id, "pid": os.getpid()})
+        self._task = asyncio.create_task(self._read_loop(reader))
+        logger.info(f"Joined cluster as {self.cluster_id}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _read_loop(self, reader):
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+
+                op = message.get("op")
+                if op == "query":
+                    asyncio.create_task(self._reply(message))
+                elif op == "response":
+                    future = self._requests.pop(message["id"], None)
+                    if future is not None and not future.done():
+                        future.set_result(message.get("data"))
+        finally:
+            self._writer = None
+            for future in self._requests.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Lost connection to the cluster launcher"))
+            self._requests.clear()
+            logger.warning("Disconnected from the cluster launcher")
+
+    async def _reply(self, message):
+        handler = self.handlers.get(message["query"])
+        data = None
+        if handler is not None:
+            try:
+                data = handler(message.get("args"))
+                if asyncio.iscoroutine(data):
+                    data = await data
+            except Exception as e:
+                logger.error(f"Cluster query {message['query']} failed: {e}")
+                data = None
+
+        writer = self._writer
+        if writer is not None:
+            try:
+                await send_message(writer, {"op": "reply", "nonce": message["nonce"], "data": data})
+            except ConnectionError:
+                pass
+
+    async def request(self, name, args=None, timeout=5.0):
+        """Ask every worker in the cluster, returns {cluster_id: data}"""
+        if self._writer is None:
+            raise ConnectionError("Not connected to the cluster launcher")
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._requests[request_id] = future
+        await send_message(self._writer, {
+            "op": "request", "id": request_id, "query": name, "args": args, "timeout": timeout
+        })
+        try:
+            return await asyncio.wait_for(future, timeout=timeout + 1.0)
+        finally:
+            self._requests.pop(request_id, None)
@@ -0,0 +1,97 @@
+import re
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from utils.member_index import EXACT, SUBSTRING
+
+SNOWFLAKE_PATTERN = re.compile(r"<?[@#&!]*(\d{15,20})>?")
+SUGGESTIONS = 5   # members listed when a name matches several
+
+
+class Snowflake(commands.Converter):
+    """
+    A Discord ID, also accepted as a mention
+
+    Slash command integer options stop at 2^53, which IDs outgrow, so
+    hybrid commands take IDs through this converter as a string option.
+    """
+
+    async def convert(self, ctx, argument):
+        match = SNOWFLAKE_PATTERN.fullmatch(argument.strip())
+        if match is None:
+            raise commands.BadArgument(f"`{argument}` is not a valid ID.")
+        return int(match.group(1))
+
+
+class AmbiguousMember(commands.BadArgument):
+    """A name that matched several members, or only partly or nearly matched some"""
+
+    def __init__(self, argument, matches):
+        self.argument = argument
+        self.matches = matches
+        if len(matches) > 1 and matches[0][1] >= EXACT:
+            intro = f"`{argument}` matches more than one member, use a mention or an ID:"
+        else:
+            intro = f"No member is called exactly `{argument}`, use a mention or an ID. Did you mean:"
+        lines = [f"{member.mention} `{member}` ({member.id})" for member, _, _ in matches[:SUGGESTIONS]]
+        super().__init__("\n".join([intro] + lines))
+
+
+class MemberLookup(commands.MemberConverter, app_commands.Transformer):
+    """
+    A member by mention, ID or name, names looked up in bot.member_index
+
+    The library's converter scans every cached member for a name and only
+    takes exact matches. This one finds a unique exact name in the index.
+    In a guild that isn't chunked (lazy or minimal member cache) the index
+    only has the members seen so far, so the library's converter asks
+    Discord for the exact name before anything partial is considered.
+
+    With partial=True, for commands that only look a member up, the only
+    name starting with or containing what was typed is taken as well. By
+    default, as the result may get kicked or banned, partial matches,
+    several matches and misspellings raise AmbiguousMember listing them
+    rather than picking one. Mentions, IDs, and guilds that aren't indexed
+    yet go to the library's converter.
+
+    As a slash command option it is the usual member picker.
+    """
+
+    def __init__(self, partial=False):
+        super().__init__()
+        self.partial = partial
+
+    async def convert(self, ctx, argument):
+        index = getattr(ctx.bot, "member_index", None)
+        if ctx.guild is None or index is None or SNOWFLAKE_PATTERN.fullmatch(argument.strip()):
+            return await super().convert(ctx, argument)
+
+        # Usernames used to have a #1234 discriminator
+        matches = index.search(ctx.guild, re.sub(r"#\d{4}$", "", argument.strip()), limit=SUGGESTIONS + 1)
+        if not matches:
+            # Not indexed yet, or not cached (lazy member cache), the library can ask Discord
+            return await super().convert(ctx, argument)
+
+        exact = [match for match in matches if match[1] >= EXACT]
+        if len(exact) == 1:
+            return exact[0][0]
+        if not exact and not ctx.guild.chunked:
+            # The member it's meant to be may just not be cached
+            try:
+                return await super().convert(ctx, argument)
+            except commands.MemberNotFound:
+                pass
+        if self.partial and not exact and len(matches) == 1 and matches[0][1] >= SUBSTRING:
+            return matches[0][0]
+        raise AmbiguousMember(argument, exact or matches)
+
+    @property
+    def type(self):
+        return discord.AppCommandOptionType.user
+
+    async def transform(self, interaction, value):
+        if not isinstance(value, discord.Member):
+            raise app_commands.TransformerError(value, self.type, self)
+        return value
@@ -0,0 +1,253 @@
+import discord
+import logging
+import asyncio
+import os
+import re
+import time
+from utils import fastjson, outbound
+from utils.scheduler import ChannelRateLimiter
+
+logger = logging.getLogger("g1_admin.countdowns")
+
+MAX_COUNTDOWN = 30 * 86400  # 30 days
+
+DURATION_PATTERN = re.compile(r"(\d+)\s*([smhd])", re.IGNORECASE)
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(text):
+    """
+    Parse durations like 90, 45s, 10m, 2h30m or 1d12h into seconds
+
+    A bare number is taken as seconds. Returns None if the text is not a duration.
+    """
+    text = text.strip().lower()
+    if text.isdigit():
+        return int(text)
+
+    parts = DURATION_PATTERN.findall(text)
+    if not parts or DURATION_PATTERN.sub("", text).strip():
+        return None
+
+    return sum(int(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def format_duration(seconds):
+    """Human readable remaining time, e.g. 1d 2h 5m or 42 seconds"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} seconds"
+
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+
+    parts = []
+    if days:
+        parts.append(f"{days}d")
+    if hours:
+        parts.append(f"{hours}h")
+    if minutes:
+        parts.append(f"{minutes}m")
+    if secs and not days:
+        parts.append(f"{secs}s")
+    return " ".join(parts)
+
+
+def update_interval(remaining):
+    """How often to refresh a countdown message, less often the further away it ends"""
+    if remaining <= 10:
+        return 1
+    if remaining <= 60:
+        return 5
+    if remaining <= 600:
+        return 30
+    if remaining <= 3600:
+        return 60
+    if remaining <= 86400:
+        return 600
+    return 3600
+
+
+class Countdown:
+    __slots__ = ("message_id", "channel_id", "event", "author_id", "author_name", "ends_at")
+
+    def __init__(self, message_id, channel_id, event, author_id, author_name, ends_at):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.event = event
+        self.author_id = author_id
+        self.author_name = author_name
+        self.ends_at = ends_at
+
+    def remaining(self):
+        return max(0, int(round(self.ends_at - time.time())))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def countdown_embed(countdown, remaining):
+    if remaining <= 0:
+        embed = discord.Embed(
+            title=f"🔔 {countdown.event}",
+            description="Time's up!",
+            color=discord.Color.green()
+        )
+    else:
+        # The relative timestamp keeps ticking in the client between our edits
+        embed = discord.Embed(
+            title=f"⏳ {countdown.event}",
+            description=f"Time remaining: {format_duration(remaining)}\nEnds <t:{int(countdown.ends_at)}:R>",
+            color=discord.Color.red() if remaining <= 5 else discord.Color.blue()
+        )
+    embed.set_footer(text=f"Countdown started by {countdown.author_name}")
+    return embed
+
+
+class CountdownManager:
+    """
+    Drives every countdown from the bot's shared timer wheel
+
+    Each countdown only schedules its next refresh, due refreshes are queued
+    per message (a newer state replaces an unsent one) and sent once per tick
+    within a per-channel edit budget. Countdowns are saved to a JSON file and
+    picked up again after a restart.
+    """
+
+    def __init__(self, bot, wheel, path="countdowns.json"):
+        self.bot = bot
+        self.wheel = wheel
+        self.path = path
+        self.countdowns = {}
+        # message_id -> countdown waiting for an edit, finished ones go first
+        self._pending = {}
+        self._finished = {}
+        self._limiter = ChannelRateLimiter()
+        self._load()
+        self.wheel.add_tick_handler(self.flush_edits)
+
+    @property
+    def pending_edits(self):
+        """Edits waiting for their channel's budget, finished countdowns included"""
+        return len(self._pending) + len(self._finished)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                for data in fastjson.load(f):
+                    countdown = Countdown(**data)
+                    self.countdowns[countdown.message_id] = countdown
+        except Exception as e:
+            logger.error(f"Error loading countdowns: {e}")
+
+    def _save_sync(self, data):
+        with open(self.path, 'w') as f:
+            fastjson.dump(data, f, indent=4)
+
+    async def save(self):
+        data = [c.to_dict() for c in self.countdowns.values()]
+        try:
+            await asyncio.to_thread(self._save_sync, data)
+        except Exception as e:
+            logger.error(f"Error saving countdowns: {e}")
+
+    def resume(self):
+        """Schedule countdowns restored from disk, ones that ended while offline finish on the next tick"""
+        for countdown in self.countdowns.values():
+            self._schedule_next(countdown)
+        if self.countdowns:
+            logger.info(f"Resumed {len(self.countdowns)} countdowns")
+
+    def create(self, channel_id, event, author, seconds):
+        """A countdown that is not running yet, so its first embed can be sent before start()"""
+        return Countdown(None, channel_id, event, author.id, str(author), time.time() + seconds)
+
+    async def start(self, countdown, message_id):
+        countdown.message_id = message_id
+        self.countdowns[message_id] = countdown
+        self._schedule_next(countdown)
+        await self.save()
+        return countdown
+
+    async def cancel(self, message_id):
+        countdown = self.countdowns.pop(message_id, None)
+        if countdown is None:
+            return None
+        self.wheel.cancel(("countdown", message_id))
+        self._pending.pop(message_id, None)
+        await self.save()
+        return countdown
+
+    def _schedule_next(self, countdown):
+        remaining = countdown.remaining()
+        if remaining <= 0:
+            self._due(countdown)
+            return
+
+        # Land refreshes on round values (e.g. :00 of each minute) and always on zero
+        interval = update_interval(remaining)
+        delay = remaining % interval or interval
+        self.wheel.schedule(("countdown", countdown.message_id), delay, lambda: self._due(countdown))
+
+    def _due(self, countdown):
+        if countdown.message_id not in self.countdowns:
+            return
+
+        if countdown.remaining() <= 0:
+            del self.countdowns[countdown.message_id]
+            self._pending.pop(countdown.message_id, None)
+            self._finished[countdown.message_id] = countdown
+        else:
+            self._pending[countdown.message_id] = countdown
+            self._schedule_next(countdown)
+
+    async def flush_edits(self):
+        """Send queued countdown edits, leaving the rest for the next tick when a channel is out of budget"""
+        if not self._pending and not self._finished:
+            return
+
+        if self._finished:
+            finished, self._finished = self._finished, {}
+            for countdown in finished.values():
+                await self._finish(countdown)
+            await self.save()
+
+        # Refreshes are bulk traffic, the end-of-countdown pings above are replies
+        with outbound.lane(outbound.BULK):
+            for message_id, countdown in list(self._pending.items()):
+                if message_id not in self._pending or not self._limiter.try_acquire(countdown.channel_id):
+                    continue
+                del self._pending[message_id]
+                await self._edit(countdown, countdown_embed(countdown, countdown.remaining()))
+
+        self._limiter.prune()
+
+    async def _edit(self, countdown, embed):
+        channel = self.bot.get_channel(countdown.channel_id)
+        if channel is None:
+            return False
+        try:
+            await channel.get_partial_message(countdown.message_id).edit(embed=embed)
+            return True
+        except discord.NotFound:
+            # Message was deleted, stop updating it
+            await self.cancel(countdown.message_id)
+        except discord.HTTPException as e:
+            logger.error(f"Error updating countdown {countdown.message_id}: {e}")
+        return False
+
+    async def _finish(self, countdown):
+        if await self._edit(countdown, countdown_embed(countdown, 0)):
+            channel = self.bot.get_channel(countdown.channel_id)
+            try:
+                await channel.send(f"🔔 **{countdown.event}** - Time's up! <@{countdown.author_id}>")
+            except discord.HTTPException as e:
+                logger.error(f"Error announcing countdown end: {e}")
+
+    def stop(self):
+        self.wheel.remove_tick_handler(self.flush_edits)
+        for message_id in self.countdowns:
+            self.wheel.cancel(("countdown", message_id))
@@ -0,0 +1,371 @@
+import functools
+import math
+import random
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAX_DICE = 1_000_000          # dice in a single group
+MAX_SIDES = 1_000_000
+MAX_TOTAL_DICE = 10_000_000   # dice across the whole expression
+MAX_EXPLOSIONS = 100          # re-roll rounds for exploding dice
+LOOP_THRESHOLD = 1000         # above this many dice, roll from aggregate face counts
+FACE_COUNT_MAX_SIDES = 1000   # largest die the face count fast path handles
+SHOWN_ROLLS = 20              # rolls listed per group before truncating
+
+TOKEN_PATTERN = re.compile(r"\s*(?:(\d+)|(kh|kl|dh|dl|k|d|!|%|[-+*/()]))", re.IGNORECASE)
+
+
+class DiceError(ValueError):
+    """Raised for invalid or too expensive dice expressions"""
+
+
+class RollGroup:
+    """What a single NdM term rolled, for display"""
+
+    __slots__ = ("label", "rolls", "dropped", "count", "total")
+
+    def __init__(self, label, rolls, dropped, count, total):
+        self.label = label
+        # Individual rolls are only kept for small pools, None when summed in aggregate
+        self.rolls = rolls
+        self.dropped = dropped
+        self.count = count
+        self.total = total
+
+    def describe(self, limit=SHOWN_ROLLS):
+        if self.rolls is None:
+            return f"{self.label} ({self.count:,} dice) = {self.total:,}"
+
+        shown = [str(r) for r in self.rolls[:limit]]
+        dropped = self.dropped or []
+        shown += [f"~~{r}~~" for r in dropped[:max(0, limit - len(shown))]]
+        hidden = len(self.rolls) + len(dropped) - len(shown)
+        if hidden > 0:
+            shown.append(f"… +{hidden:,} more")
+        return f"{self.label} [{', '.join(shown)}]"
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise DiceError(f"Unexpected character `{text[pos]}`")
+        number, symbol = match.groups()
+        tokens.append(int(number) if number is not None else symbol.lower())
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent parser producing a small tuple AST
+
+    expr   := term (('+' | '-') term)*
+    term   := unary (('*' | '/') unary)*
+    unary  := '-' unary | atom
+    atom   := NUMBER | dice | '(' expr ')'
+    dice   := [NUMBER] 'd' (NUMBER | '%') ('kh' N | 'kl' N | 'k' N | 'dh' N | 'dl' N | '!')*
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect_number(self, after):
+        token = self.take()
+        if not isinstance(token, int):
+            raise DiceError(f"Expected a number after `{after}`")
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise DiceError("Empty expression")
+        node = self.expr()
+        if self.peek() is not None:
+            raise DiceError(f"Unexpected `{self.peek()}`")
+        return node
+
+    def expr(self):
+        node = self.term()
+        while self.peek() in ("+", "-"):
+            node = ("bin", self.take(), node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while self.peek() in ("*", "/"):
+            node = ("bin", self.take(), node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek() == "-":
+            self.take()
+            return ("neg", self.unary())
+        return self.atom()
+
+    def atom(self):
+        token = self.peek()
+        if token == "(":
+            self.take()
+            node = self.expr()
+            if self.take() != ")":
+                raise DiceError("Missing closing parenthesis")
+            return node
+
+        if isinstance(token, int):
+            self.take()
+            if self.peek() == "d":
+                return self.dice(token)
+            return ("num", token)
+
+        if token == "d":
+            return self.dice(1)
+
+        raise DiceError("Expected a number, dice or `(`" if token is None else f"Unexpected `{token}`")
+
+    def dice(self, count):
+        self.take()  # 'd'
+        if self.peek() == "%":
+            self.take()
+            sides = 100
+        else:
+            sides = self.expect_number("d")
+
+        keep = None  # (mode, n) with mode "kh", "kl", "dh" or "dl"
+        explode = False
+        while self.peek() in ("kh", "kl", "k", "dh", "dl", "!"):
+            modifier = self.take()
+            if modifier == "!":
+                explode = True
+                continue
+            n = self.expect_number(modifier)
+            keep = ("kh" if modifier == "k" else modifier, n)
+
+        return ("dice", count, sides, keep, explode)
+
+
+def _kept(keep, rolled):
+    """
+    (mode, n) to keep out of the rolled dice, mode "kh" or "kl"
+
+    Dropping is keeping the other end, worked out from the dice actually
+    rolled since exploding dice make the pool larger than the count.
+    """
+    mode, n = keep
+    if mode == "dh":
+        return "kl", max(0, rolled - n)
+    if mode == "dl":
+        return "kh", max(0, rolled - n)
+    return mode, n
+
+
+def _format_label(count, sides, keep, explode):
+    label = f"{count}d{sides}"
+    if explode:
+        label += "!"
+    if keep:
+        label += f"{keep[0]}{keep[1]}"
+    return label
+
+
+def _binomial(rng, n, p):
+    """Sample Binomial(n, p), exactly for small means and via the normal approximation for large ones"""
+    if n <= 0 or p <= 0:
+        return 0
+    if p >= 1:
+        return n
+
+    binomialvariate = getattr(rng, "binomialvariate", None)
+    if binomialvariate is not None:
+        return binomialvariate(n, p)
+
+    if n < 64:
+        return sum(1 for _ in range(n) if rng.random() < p)
+
+    if p > 0.5:
+        # Count the failures instead, so the cases below only see p <= 0.5
+        return n - _binomial(rng, n, 1 - p)
+
+    mean = n * p
+    if mean < 10:
+        # Inversion with the pmf recurrence, expected cost is about the mean
+        q = 1 - p
+        ratio = p / q
+        prob = q ** n
+        u = rng.random()
+        value = 0
+        while u > prob and value < n:
+            u -= prob
+            value += 1
+            prob *= ratio * (n - value + 1) / value
+        return value
+
+    value = int(round(rng.gauss(mean, math.sqrt(mean * (1 - p)))))
+    return min(n, max(0, value))
+
+
+def face_counts(rng, count, sides):
+    """
+    How many of count dice landed on each face, as a list indexed by face - 1
+
+    Samples the multinomial directly (vectorised with numpy when installed, otherwise
+    as a chain of binomials) so the cost depends on the number of sides, not of dice.
+    """
+    if numpy is not None:
+        generator = numpy.random.default_rng(rng.getrandbits(64))
+        return generator.multinomial(count, [1.0 / sides] * sides).tolist()
+
+    counts = []
+    remaining = count
+    for face in range(sides - 1):
+        drawn = _binomial(rng, remaining, 1.0 / (sides - face))
+        counts.append(drawn)
+        remaining -= drawn
+    counts.append(remaining)
+    return counts
+
+
+def _sum_uniform(rng, count, sides):
+    """Sum of count dice with many sides, sampled from its normal approximation"""
+    mean = count * (sides + 1) / 2
+    std = math.sqrt(count * (sides * sides - 1) / 12)
+    return min(count * sides, max(count, int(round(rng.gauss(mean, std)))))
+
+
+def _roll_small(rng, count, sides, keep, explode, label):
+    rolls = [rng.randint(1, sides) for _ in range(count)]
+    if explode and sides > 1:
+        extra = sum(1 for r in rolls if r == sides)
+        rounds = 0
+        while extra and rounds < MAX_EXPLOSIONS:
+            more = [rng.randint(1, sides) for _ in range(extra)]
+            rolls.extend(more)
+            extra = sum(1 for r in more if r == sides)
+            rounds += 1
+
+    dropped = None
+    if keep:
+        mode, n = _kept(keep, len(rolls))
+        ordered = sorted(rolls, reverse=(mode == "kh"))
+        rolls, dropped = ordered[:n], ordered[n:]
+
+    total = sum(rolls)
+    return total, RollGroup(label, rolls, dropped, len(rolls) + len(dropped or ()), total)
+
+
+def _roll_large(rng, count, sides, keep, explode, label):
+    if sides > FACE_COUNT_MAX_SIDES:
+        # Only plain sums get here, the compiler rejects keep/explode on huge pools of big dice
+        total = _sum_uniform(rng, count, sides)
+        return total, RollGroup(label, None, None, count, total)
+
+    counts = face_counts(rng, count, sides)
+    if explode and sides > 1:
+        extra = counts[-1]
+        rounds = 0
+        while extra and rounds < MAX_EXPLOSIONS:
+            more = face_counts(rng, extra, sides)
+            counts = [a + b for a, b in zip(counts, more)]
+            extra = more[-1]
+            rounds += 1
+
+    rolled = sum(counts)
+    if keep:
+        mode, n = _kept(keep, rolled)
+        faces = range(sides, 0, -1) if mode == "kh" else range(1, sides + 1)
+        total = 0
+        for face in faces:
+            if n <= 0:
+                break
+            taken = min(n, counts[face - 1])
+            total += taken * face
+            n -= taken
+    else:
+        total = sum(face * c for face, c in enumerate(counts, 1))
+
+    return total, RollGroup(label, None, None, rolled, total)
+
+
+def _compile(node, budget):
+    """Turn an AST node into a function of (rng, groups) returning an int"""
+    kind = node[0]
+
+    if kind == "num":
+        value = node[1]
+        return lambda rng, groups: value
+
+    if kind == "neg":
+        inner = _compile(node[1], budget)
+        return lambda rng, groups: -inner(rng, groups)
+
+    if kind == "bin":
+        op, left, right = node[1], _compile(node[2], budget), _compile(node[3], budget)
+        if op == "+":
+            return lambda rng, groups: left(rng, groups) + right(rng, groups)
+        if op == "-":
+            return lambda rng, groups: left(rng, groups) - right(rng, groups)
+        if op == "*":
+            return lambda rng, groups: left(rng, groups) * right(rng, groups)
+
+        def divide(rng, groups):
+            divisor = right(rng, groups)
+            if divisor == 0:
+                raise DiceError("Division by zero")
+            return left(rng, groups) // divisor
+        return divide
+
+    _, count, sides, keep, explode = node
+    if count <= 0 or sides <= 0:
+        raise DiceError("Number of dice and sides must be positive numbers.")
+    if count > MAX_DICE:
+        raise DiceError(f"You can roll at most {MAX_DICE:,} dice in one group.")
+    if sides > MAX_SIDES:
+        raise DiceError(f"Dice can have at most {MAX_SIDES:,} sides.")
+    if count > LOOP_THRESHOLD and sides > FACE_COUNT_MAX_SIDES and (keep or explode):
+        raise DiceError(f"Keep and explode work on up to {LOOP_THRESHOLD:,} dice with more than {FACE_COUNT_MAX_SIDES:,} sides.")
+
+    budget[0] += count
+    if budget[0] > MAX_TOTAL_DICE:
+        raise DiceError(f"That expression rolls more than {MAX_TOTAL_DICE:,} dice.")
+
+    label = _format_label(count, sides, keep, explode)
+    roll = _roll_large if count > LOOP_THRESHOLD else _roll_small
+
+    def roll_dice(rng, groups):
+        total, group = roll(rng, count, sides, keep, explode, label)
+        groups.append(group)
+        return total
+    return roll_dice
+
+
+@functools.lru_cache(maxsize=512)
+def compile_expression(text):
+    """Parse and compile a dice expression, cached so repeated rolls skip parsing"""
+    ast = _Parser(_tokenize(text)).parse()
+    return _compile(ast, [0])
+
+
+def roll(text, rng=random):
+    """
+    Roll a dice expression such as 4d6kh3+2, 10d10! or (2d8+3)*2
+
+    Returns (total, groups) where groups describe each NdM term. Raises DiceError.
+    """
+    evaluate = compile_expression(text.replace(" ", "").lower())
+    groups = []
+    return evaluate(rng, groups), groups
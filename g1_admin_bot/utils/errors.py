@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+
+import discord
+
+logger = logging.getLogger("g1_admin.errors")
+
+DIGEST_TIMER = "error-digest"
+WINDOW = 300             # seconds between digests of repeated errors
+REPLY_COOLDOWN = 60      # seconds before the same user is told about the same error again
+DIGEST_LINES = 15        # errors listed in one digest, the rest are summed up
+MAX_FINGERPRINTS = 1000
+
+# Applied in order, so IDs, addresses and quoted values don't make every error unique
+NORMALISERS = (
+    (re.compile(r"0x[0-9a-fA-F]+"), "0x?"),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "'?'"),
+    (re.compile(r"\d+"), "N"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+def normalise_message(message):
+    for pattern, replacement in NORMALISERS:
+        message = pattern.sub(replacement, message)
+    return message.strip()[:200]
+
+
+def fingerprint(error, command_name):
+    """(key, exception type name, normalised message), the key is a short hash of all three"""
+    original = getattr(error, "original", error)
+    type_name = type(original).__name__
+    message = normalise_message(str(original))
+    key = hashlib.sha1(f"{type_name}|{command_name}|{message}".encode()).hexdigest()[:8]
+    return key, type_name, message
+
+
+class ErrorStats:
+    __slots__ = ("key", "type_name", "command", "message", "count", "total", "first_seen", "last_seen")
+
+    def __init__(self, key, type_name, command, now):
+        self.key = key
+        self.type_name = type_name
+        self.command = command
+        self.message = ""
+        self.count = 0          # repeats since the last post to the log channel
+        self.total = 0
+        self.first_seen = now
+        self.last_seen = now
+
+
+class ErrorDigest:
+    """
+    Collapses storms of the same command error
+
+    Errors are fingerprinted by exception type, command and normalised message.
+    The first of a kind is posted to the log channel right away, repeats are
+    only counted and posted together in one digest per window. Users are only
+    told about the same error once per cooldown. send(embed) is the coroutine
+    that posts to the log channel.
+    """
+
+    def __init__(self, bot, send, window=WINDOW, reply_cooldown=REPLY_COOLDOWN):
+        self.bot = bot
+        self.send = send
+        self.window = window
+        self.reply_cooldown = reply_cooldown
+        self._errors = {}
+        # (fingerprint, user ID) -> when they were last replied to
+        self._replied = {}
+        self._digest_scheduled = False
+        self.suppressed_replies = 0
+
+    def record(self, ctx, error):
+        """Count an error, returns (stats, first) where first means it should be reported now"""
+        command = ctx.command.qualified_name if ctx.command else "unknown"
+        key, type_name, message = fingerprint(error, command)
+        now = time.monotonic()
+
+        stats = self._errors.get(key)
+        first = stats is None or (not stats.count and now - stats.last_seen >= self.window)
+        if stats is None:
+            if len(self._errors) >= MAX_FINGERPRINTS:
+                self._forget(now)
+            stats = self._errors[key] = ErrorStats(key, type_name, command, now)
+
+        stats.message = str(getattr(error, "original", error))
+        stats.total += 1
+        stats.last_seen = now
+        if not first:
+            stats.count += 1
+            self._schedule_digest()
+        return stats, first
+
+    def should_reply(self, key, user_id):
+        now = time.monotonic()
+        last = self._replied.get((key, user_id))
+        if last is not None and now - last < self.reply_cooldown:
+            self.suppressed_replies += 1
+            return False
+        self._replied[(key, user_id)] = now
+        return True
+
+    def _schedule_digest(self):
+        if not self._digest_scheduled:
+            self._digest_scheduled = True
+            self.bot.timers.schedule(DIGEST_TIMER, self.window, self._digest_due)
+
+    def _digest_due(self):
+        self._digest_scheduled = False
+        asyncio.get_running_loop().create_task(self.flush())
+
+    def _forget(self, now):
+        """Drop fingerprints that have been quiet for a window and reply times past their cooldown"""
+        for key, stats in list(self._errors.items()):
+            if not stats.count and now - stats.last_seen >= self.window:
+                del self._errors[key]
+        for reply_key, at in list(self._replied.items()):
+            if now - at >= self.reply_cooldown:
+                del self._replied[reply_key]
+
+    async def flush(self):
+        """Post a digest of the errors repeated since the last one"""
+        pending = sorted((s for s in self._errors.values() if s.count), key=lambda s: s.count, reverse=True)
+        if pending:
+            embed = self.digest_embed(pending)
+            for stats in pending:
+                stats.count = 0
+            try:
+                await self.send(embed)
+            except Exception as e:
+                logger.error(f"Failed to post error digest: {e}")
+        self._forget(time.monotonic())
+
+    def digest_embed(self, pending):
+        minutes = max(1, round(self.window / 60))
+        lines = []
+        for stats in pending[:DIGEST_LINES]:
+            lines.append(
+                f"`{stats.type_name}` in `{stats.command}` ×{stats.count} in last {minutes} min (`{stats.key}`)\n"
+                f"> {discord.utils.escape_markdown(stats.message[:120])}"
+            )
+        rest = pending[DIGEST_LINES:]
+        if rest:
+            lines.append(f"...and {len(rest)} more errors ×{sum(s.count for s in rest)}")
+
+        embed = discord.Embed(
+            title=f"⚠️ Error digest: {sum(s.count for s in pending)} repeated errors",
+            description="\n".join(lines)[:4000],
+            color=discord.Color.red()
+        )
+        embed.set_footer(text=getattr(self.bot, "author", "G1 Admin"))
+        return embed
+
+    def stats(self):
+        return {
+            "fingerprints": len(self._errors),
+            "pending": sum(s.count for s in self._errors.values()),
+            "suppressed_replies": self.suppressed_replies,
+        }
@@ -0,0 +1,38 @@
+import asyncio
+import logging
+import sys
+
+logger = logging.getLogger("g1_admin.eventloop")
+
+BACKENDS = ("auto", "uvloop", "asyncio")
+
+
+def resolve(name="auto"):
+    """
+    The event loop that will run, "uvloop" or "asyncio"
+
+    "auto" is uvloop when it's installed. It isn't available on Windows, so
+    asking for it there (or without it installed) falls back to asyncio's own.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"event_loop must be one of {', '.join(BACKENDS)}")
+    if name == "asyncio":
+        return "asyncio"
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        if name == "uvloop":
+            logger.warning("uvloop is not installed (pip install uvloop), using the asyncio event loop")
+        return "asyncio"
+    return "uvloop"
+
+
+def run(main, name="auto"):
+    """asyncio.run(main) on the chosen event loop"""
+    if resolve(name) == "uvloop":
+        import uvloop
+        if sys.version_info >= (3, 11):
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+                return runner.run(main)
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(main)
@@ -0,0 +1,74 @@
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger("g1_admin.fastjson")
+
+BACKENDS = ("auto", "orjson", "json")
+
+backend = "orjson" if orjson is not None else "json"
+
+
+def use(name="auto"):
+    """
+    Pick the codec for the bot's own files and messages, returns the one in use
+
+    "auto" is orjson when it's installed, otherwise the standard library.
+    """
+    global backend
+    if name not in BACKENDS:
+        raise ValueError(f"json_backend must be one of {', '.join(BACKENDS)}")
+    if name == "orjson" and orjson is None:
+        logger.warning("orjson is not installed (pip install orjson), using the standard json module")
+        name = "json"
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+    backend = name
+    return backend
+
+
+def patch_discord():
+    """
+    Make discord.py decode gateway payloads and REST responses with the same codec
+
+    The library already uses orjson when it's installed, this is what lets
+    json_backend "json" turn it off, e.g. to compare the two.
+    """
+    from discord import utils
+
+    if backend == "orjson":
+        utils._from_json = orjson.loads
+        utils._to_json = lambda obj: orjson.dumps(obj).decode("utf-8")
+    else:
+        utils._from_json = json.loads
+        utils._to_json = lambda obj: json.dumps(obj, separators=(",", ":"), ensure_ascii=True)
+
+
+def dumps(obj, indent=None):
+    """JSON text, compact unless indent is given (orjson only indents by 2)"""
+    if backend == "orjson":
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    if indent:
+        return json.dumps(obj, indent=indent)
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def loads(data):
+    if backend == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump(obj, f, indent=None):
+    f.write(dumps(obj, indent))
+
+
+def load(f):
+    return loads(f.read())
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+logger = logging.getLogger("g1_admin.help")
+
+MAX_ENTRIES = 256
+
+
+class HelpCache:
+    """
+    Rendered !help embeds, one per permission tier and prefix
+
+    Which commands !help lists only depends on what the command checks look
+    at: whether the author is the owner, their permissions in the channel,
+    administrator and the configured admin roles. Members who match on all of
+    those share a tier, so after the first !help of a tier the rest cost a
+    dict lookup. The cache is cleared when cogs are added or removed and when
+    the prefix changes.
+    """
+
+    def __init__(self, bot, max_entries=MAX_ENTRIES):
+        self.bot = bot
+        self.max_entries = max_entries
+        # key -> embed, or the task still rendering it so concurrent requests share it
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        bot.add_listener(self.on_cogs_changed, "on_cogs_changed")
+        bot.add_listener(self.on_prefix_changed, "on_prefix_changed")
+
+    async def key(self, ctx):
+        is_owner = await self.bot.is_owner(ctx.author)
+        if ctx.guild is None:
+            return (ctx.clean_prefix, is_owner, None)
+
+        admin_role_ids = getattr(self.bot, "_config", {}).get("admin_role_ids", [])
+        has_admin_role = bool(admin_role_ids) and any(str(role.id) in admin_role_ids for role in ctx.author.roles)
+        return (
+            ctx.clean_prefix,
+            is_owner,
+            ctx.permissions.value,
+            ctx.author.guild_permissions.administrator,
+            has_admin_role
+        )
+
+    async def get(self, key, render):
+        """The cached embed for key, render() makes it on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None and not isinstance(entry, asyncio.Task):
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        if entry is None:
+            if len(self._entries) >= self.max_entries:
+                self.clear()
+            entry = self._entries[key] = asyncio.ensure_future(render())
+
+        try:
+            embed = await asyncio.shield(entry)
+        except Exception:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            raise
+        if self._entries.get(key) is entry:
+            self._entries[key] = embed
+        return embed
+
+    def clear(self):
+        self._entries.clear()
+
+    async def on_cogs_changed(self):
+        self.clear()
+
+    async def on_prefix_changed(self, prefix):
+        self.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
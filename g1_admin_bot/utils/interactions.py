@@ -0,0 +1,171 @@
+import discord
+import logging
+import asyncio
+
+logger = logging.getLogger("g1_admin.interactions")
+
+CONFIRM_ID = "g1:confirm"
+CANCEL_ID = "g1:cancel"
+
+
+class InteractionDispatcher:
+    """
+    Resolves pending confirmations, reactions and button clicks
+
+    Waiters are indexed by message ID and then user ID, so an incoming raw
+    reaction or component interaction is matched with two dict lookups instead
+    of running every pending wait_for check against every event.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        # message_id -> {user_id or None: [(future, accepted_keys), ...]}
+        self._waiters = {}
+        # custom_id prefix -> coroutine callback(interaction, suffix) for long-lived components
+        self._handlers = {}
+
+        bot.add_listener(self.on_raw_reaction_add)
+        bot.add_listener(self.on_interaction)
+
+    def pending_count(self):
+        """Number of waiters currently registered"""
+        return sum(len(waiters) for users in self._waiters.values() for waiters in users.values())
+
+    def add_component_handler(self, prefix, callback):
+        """
+        Route every button whose custom_id looks like "<prefix>:<suffix>" to callback
+
+        Used for long-lived components such as poll buttons, which outlive any single wait.
+        """
+        self._handlers[prefix] = callback
+
+    def remove_component_handler(self, prefix):
+        self._handlers.pop(prefix, None)
+
+    def _register(self, message_id, user_id, accepted):
+        future = asyncio.get_running_loop().create_future()
+        users = self._waiters.setdefault(message_id, {})
+        users.setdefault(user_id, []).append((future, accepted))
+        return future
+
+    def _unregister(self, message_id, user_id, future):
+        users = self._waiters.get(message_id)
+        if not users:
+            return
+
+        waiters = users.get(user_id)
+        if waiters:
+            users[user_id] = [w for w in waiters if w[0] is not future]
+            if not users[user_id]:
+                del users[user_id]
+
+        if not users:
+            del self._waiters[message_id]
+
+    def _resolve(self, message_id, user_id, key, value):
+        """Resolve the first matching waiter for this user (or any user), returns True if one was found"""
+        users = self._waiters.get(message_id)
+        if not users:
+            return False
+
+        for candidate in (user_id, None):
+            for future, accepted in users.get(candidate, ()):
+                if future.done():
+                    continue
+                if accepted is None or key in accepted:
+                    future.set_result(value)
+                    return True
+
+        return False
+
+    async def _wait(self, message_id, user_id, accepted, timeout):
+        future = self._register(message_id, user_id, accepted)
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            self._unregister(message_id, user_id, future)
+
+    async def wait_for_reaction(self, message_id, user_id=None, emojis=None, timeout=60.0):
+        """
+        Wait for a reaction on a message
+
+        Returns the raw reaction payload. Raises asyncio.TimeoutError if nobody reacts in time.
+        """
+        accepted = set(emojis) if emojis else None
+        return await self._wait(message_id, user_id, accepted, timeout)
+
+    async def wait_for_component(self, message_id, user_id=None, custom_ids=None, timeout=60.0):
+        """
+        Wait for a button click on a message
+
+        Returns the interaction, which the caller must respond to.
+        Raises asyncio.TimeoutError if nobody clicks in time.
+        """
+        accepted = set(custom_ids) if custom_ids else None
+        return await self._wait(message_id, user_id, accepted, timeout)
+
+    async def confirm(self, ctx, content, timeout=60.0, confirm_label="Confirm", cancel_label="Cancel"):
+        """
+        Ask the command author to confirm an action with buttons
+
+        Returns True if confirmed, False if cancelled and None on timeout.
+        """
+        view = discord.ui.View(timeout=None)
+        view.add_item(discord.ui.Button(label=confirm_label, style=discord.ButtonStyle.green, custom_id=CONFIRM_ID))
+        view.add_item(discord.ui.Button(label=cancel_label, style=discord.ButtonStyle.red, custom_id=CANCEL_ID))
+        # A stopped view is still rendered but is not added to the library's view
+        # store, so clicks are only routed through this dispatcher
+        view.stop()
+
+        prompt = await ctx.send(content, view=view)
+
+        try:
+            interaction = await self.wait_for_component(
+                prompt.id, ctx.author.id, custom_ids=(CONFIRM_ID, CANCEL_ID), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            try:
+                await prompt.edit(view=None)
+            except discord.HTTPException:
+                pass
+            return None
+
+        # Remove the buttons in the same call that acknowledges the click
+        try:
+            await interaction.response.edit_message(view=None)
+        except discord.HTTPException as e:
+            logger.error(f"Failed to acknowledge confirmation: {e}")
+
+        return interaction.data.get("custom_id") == CONFIRM_ID
+
+    async def on_raw_reaction_add(self, payload):
+        if payload.message_id not in self._waiters:
+            return
+
+        self._resolve(payload.message_id, payload.user_id, str(payload.emoji), payload)
+
+    async def on_interaction(self, interaction):
+        if interaction.type != discord.InteractionType.component or interaction.message is None:
+            return
+
+        message_id = interaction.message.id
+        custom_id = (interaction.data or {}).get("custom_id") or ""
+
+        if message_id not in self._waiters:
+            prefix, _, suffix = custom_id.rpartition(":")
+            handler = self._handlers.get(prefix)
+            if handler is not None:
+                try:
+                    await handler(interaction, suffix)
+                except Exception as e:
+                    logger.error(f"Component handler {prefix} failed: {e}")
+            return
+
+        if self._resolve(message_id, interaction.user.id, custom_id, interaction):
+            return
+
+        # Someone else clicked a prompt that isn't theirs
+        try:
+            await interaction.response.send_message("This prompt isn't for you.", ephemeral=True)
+        except discord.HTTPException:
+            pass
@@ -0,0 +1,236 @@
+import asyncio
+import itertools
+import logging
+import sys
+import time
+
+from utils.memory import deep_sizeof
+
+logger = logging.getLogger("g1_admin.member_cache")
+
+# full:    every member of every guild, chunked at startup (the library default)
+# lazy:    members the bot has seen through events, whole guilds chunked on demand
+#          for a broadcast or other mass action and released afterwards
+# minimal: like lazy, but members not seen for member_cache_ttl seconds are dropped
+#          unless they hold one of member_cache_role_ids
+MODES = ("full", "lazy", "minimal")
+
+PRUNE_TIMER = "member-cache-prune"
+SIZE_SAMPLE = 200  # members sized to estimate the bytes per cached member
+RELEASE_BATCH = 5000   # members checked between yields to the event loop when releasing
+
+
+def cache_options(mode):
+    """Client keyword arguments for a member cache mode"""
+    if mode not in MODES:
+        raise ValueError(f"member_cache must be one of {', '.join(MODES)}, not {mode!r}")
+    return {"chunk_guilds_at_startup": mode == "full"}
+
+
+class MemberCachePolicy:
+    """
+    Keeps the library's member cache to what the chosen mode allows
+
+    Code that needs a guild's whole member list calls acquire(guild) and then
+    release(guild) when done, the list is downloaded once however many mass
+    actions overlap and dropped again after the last one.
+    """
+
+    def __init__(self, bot, mode="full", keep_role_ids=(), ttl=3600, prune_interval=300):
+        cache_options(mode)
+        self.bot = bot
+        self.mode = mode
+        self.keep_role_ids = {int(role_id) for role_id in keep_role_ids}
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+
+        # guild_id -> number of running mass actions that need the full list
+        self._holds = {}
+        # guild_id -> member IDs cached before an on-demand chunk, None when the
+        # guild was already chunked and nothing is dropped on release (lazy mode)
+        self._before = {}
+        self._chunk_locks = {}
+        self._release_tasks = {}
+        # guild_id -> {member_id: last seen, monotonic seconds} (minimal mode)
+        self._last_seen = {}
+
+        self.chunks = 0
+        self.released = 0
+
+        if mode == "minimal":
+            bot.add_listener(self.on_ready)
+            bot.add_listener(self.on_message)
+            bot.add_listener(self.on_member_join)
+            bot.add_listener(self.on_member_update)
+            bot.add_listener(self.on_voice_state_update)
+            bot.add_listener(self.on_raw_reaction_add)
+
+    def touch(self, guild_id, member_id):
+        if guild_id is None:
+            return
+        seen = self._last_seen.get(guild_id)
+        if seen is None:
+            seen = self._last_seen[guild_id] = {}
+        seen[member_id] = time.monotonic()
+
+    async def on_ready(self):
+        self.bot.timers.schedule(PRUNE_TIMER, self.prune_interval, self.prune)
+
+    async def on_message(self, message):
+        if message.guild is not None:
+            self.touch(message.guild.id, message.author.id)
+
+    async def on_member_join(self, member):
+        self.touch(member.guild.id, member.id)
+
+    async def on_member_update(self, before, after):
+        self.touch(after.guild.id, after.id)
+
+    async def on_voice_state_update(self, member, before, after):
+        self.touch(member.guild.id, member.id)
+
+    async def on_raw_reaction_add(self, payload):
+        self.touch(payload.guild_id, payload.user_id)
+
+    async def acquire(self, guild):
+        """Make sure the guild's whole member list is cached, returns it"""
+        self._holds[guild.id] = self._holds.get(guild.id, 0) + 1
+        if self.mode == "lazy" and guild.id not in self._before:
+            # Small guilds arrive with all their members, those are all members the bot has seen
+            self._before[guild.id] = None if guild.chunked else set(guild._members)
+
+        try:
+            if not guild.chunked:
+                lock = self._chunk_locks.setdefault(guild.id, asyncio.Lock())
+                async with lock:
+                    if not guild.chunked:
+                        start = time.perf_counter()
+                        await guild.chunk(cache=True)
+                        self.chunks += 1
+                        logger.info(f"Chunked {guild.name} on demand: {guild.member_count:,} members "
+                                    f"in {time.perf_counter() - start:.1f}s")
+        except BaseException:
+            self.release(guild)
+            raise
+
+        return guild.members
+
+    def release(self, guild):
+        """Done with the full member list, drops it once nothing else holds it"""
+        holds = self._holds.get(guild.id, 0) - 1
+        if holds > 0:
+            self._holds[guild.id] = holds
+            return
+        self._holds.pop(guild.id, None)
+        self._chunk_locks.pop(guild.id, None)
+
+        before = self._before.pop(guild.id, None)
+        if self.mode == "full":
+            return
+
+        now = time.monotonic()
+        if self.mode == "lazy":
+            if before is None:
+                # Nothing was downloaded for the hold, so there's nothing to drop
+                return
+            keep = before
+            retained = lambda member: member.id in keep or self._retained(member, now)
+        else:
+            retained = lambda member: self._retained(member, now)
+        self._release_tasks[guild.id] = asyncio.create_task(self._release(guild, retained))
+
+    async def _release(self, guild, retained):
+        # Hundreds of thousands of members, so drop them in batches between other events
+        # IDs rather than members, so each batch is freed as it goes instead of all at the end
+        removed = 0
+        member_ids = list(guild._members)
+        try:
+            for start in range(0, len(member_ids), RELEASE_BATCH):
+                if guild.id in self._holds:
+                    # Someone needs the full list again
+                    break
+                batch = [guild._members.get(member_id) for member_id in member_ids[start:start + RELEASE_BATCH]]
+                removed += self._drop(guild, retained, [member for member in batch if member is not None])
+                del batch
+                await asyncio.sleep(0)
+        finally:
+            self._release_tasks.pop(guild.id, None)
+
+        if removed:
+            logger.info(f"Released {removed:,} members of {guild.name}, {len(guild._members):,} still cached")
+
+    def _retained(self, member, now):
+        if self.bot.user is not None and member.id == self.bot.user.id:
+            return True
+        if any(member.get_role(role_id) is not None for role_id in self.keep_role_ids):
+            return True
+        if self.mode == "minimal":
+            seen = self._last_seen.get(member.guild.id)
+            return seen is not None and now - seen.get(member.id, -self.ttl) < self.ttl
+        return False
+
+    def _drop(self, guild, keep, members=None):
+        # The library has no public way to evict members, _members is its cache
+        if members is None:
+            members = guild._members.values()
+        stale = [member for member in members if not keep(member)]
+        for member in stale:
+            guild._remove_member(member)
+        self.released += len(stale)
+        return len(stale)
+
+    def prune(self):
+        """Timer callback for minimal mode: drop members not seen within the TTL"""
+        try:
+            now = time.monotonic()
+            removed = 0
+            for guild in self.bot.guilds:
+                if guild.id in self._holds or guild.id in self._release_tasks:
+                    continue
+                removed += self._drop(guild, lambda member: self._retained(member, now))
+
+            for guild_id, seen in list(self._last_seen.items()):
+                stale = [member_id for member_id, at in seen.items() if now - at >= self.ttl]
+                for member_id in stale:
+                    del seen[member_id]
+                if not seen:
+                    del self._last_seen[guild_id]
+
+            if removed:
+                logger.info(f"Pruned {removed:,} idle members from the cache")
+        finally:
+            self.bot.timers.schedule(PRUNE_TIMER, self.prune_interval, self.prune)
+
+    def memory_report(self):
+        """Cached members and an estimate of the memory they take"""
+        guilds = list(self.bot.guilds)
+        cached = sum(len(guild._members) for guild in guilds)
+        total = sum(guild.member_count or 0 for guild in guilds)
+
+        sample = []
+        for guild in guilds:
+            sample.extend(itertools.islice(guild._members.values(), SIZE_SAMPLE - len(sample)))
+            if len(sample) >= SIZE_SAMPLE:
+                break
+
+        per_member = 0
+        if sample:
+            shared = guilds + [guild._state for guild in guilds[:1]]
+            per_member = (deep_sizeof(sample, shared=shared) - sys.getsizeof(sample)) / len(sample)
+
+        # Each cached member also costs a slot in its guild's dict
+        per_member += sum(sys.getsizeof(guild._members) for guild in guilds) / max(1, cached)
+
+        tracking = deep_sizeof(self._last_seen)
+
+        return {
+            "mode": self.mode,
+            "guilds": len(guilds),
+            "cached": cached,
+            "total": total,
+            "bytes_per_member": per_member,
+            "estimated_bytes": int(per_member * cached) + tracking,
+            "tracking_bytes": tracking,
+            "chunks": self.chunks,
+            "released": self.released,
+        }
@@ -0,0 +1,369 @@
+import array
+import asyncio
+import bisect
+import collections
+import itertools
+import logging
+import sys
+import time
+import unicodedata
+
+from utils.memory import SIZE_SAMPLE, sampled_sizeof
+
+logger = logging.getLogger("g1_admin.member_index")
+
+BUILD_BATCH = 1000      # members indexed between yields to the event loop
+PREFIX_SCAN = 50        # sorted names looked at for a prefix query
+SCAN_BUDGET = 2000      # trigram postings counted per query, the rarest trigrams first
+CANDIDATES = 30         # trigram candidates scored against the query
+MIN_SCORE = 0.15        # weaker fuzzy matches aren't returned
+
+# Scores: exact 1, prefixes from PREFIX, names containing the query from
+# SUBSTRING, near misses below FUZZY. Longer matches of the same kind score higher
+EXACT = 1.0
+PREFIX = 0.7
+SUBSTRING = 0.4
+FUZZY = 0.4
+
+
+def normalise(name):
+    """Lowercase, without accents, so "Zoë" is found by "zoe" """
+    if name.isascii():
+        return name.lower().strip()
+    name = unicodedata.normalize("NFKD", name)
+    return "".join(c for c in name if not unicodedata.combining(c)).casefold().strip()
+
+
+def trigrams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def member_keys(member):
+    """The normalised names a member is found by: username, global name and nickname"""
+    names = (member.name, member.global_name, member.nick)
+    return tuple(sorted({normalise(name) for name in names if name} - {""}))
+
+
+def score(query, query_grams, key):
+    """How well key matches query, 0 to 1"""
+    if key == query:
+        return EXACT
+    if key.startswith(query):
+        return PREFIX + (EXACT - PREFIX) * 0.9 * len(query) / len(key)
+    if query in key:
+        return SUBSTRING + (PREFIX - SUBSTRING) * 0.9 * len(query) / len(key)
+    if not query_grams:
+        return 0.0
+    key_grams = trigrams(key)
+    # Dice coefficient of the two trigram sets, tolerates typos and swapped letters
+    return FUZZY * 0.9 * 2 * len(query_grams & key_grams) / (len(query_grams) + len(key_grams))
+
+
+def match_kind(value):
+    if value >= EXACT:
+        return "exact"
+    if value >= PREFIX:
+        return "starts with"
+    if value >= SUBSTRING:
+        return "contains"
+    return "similar"
+
+
+class GuildIndex:
+    """
+    The names of one guild's members, for prefix, substring and typo-tolerant lookup
+
+    Every indexed member has a slot, a small integer, so the structures hold
+    4 byte slot numbers in arrays rather than Python ints in sets:
+
+    - keys/key_slots: every name, sorted, with its slot. A prefix query is a
+      bisect and a short scan, the same as walking a trie but without a dict
+      per character, which for 200k members would cost hundreds of MB.
+    - grams: trigram -> array of slots whose names contain it, for names
+      that contain the query, or nearly do.
+
+    Changing a member's names gives them a new slot. The old one is left
+    dead (slots[slot] is None) and skipped, everything is rebuilt without the
+    dead slots once they outnumber the live ones.
+
+    While a guild is first indexed (sort=False) names are appended unsorted
+    and sorted once by finish(), inserting 600k names in order one by one
+    would move the whole list each time.
+    """
+
+    def __init__(self, sort=True):
+        self.sort = sort
+        self._reset()
+
+    def _reset(self):
+        self.slots = []         # slot -> member ID, None once dead
+        self.slot_keys = []     # slot -> the member's keys
+        self.slot_of = {}       # member ID -> live slot
+        self.keys = []
+        self.key_slots = array.array("I")
+        self.grams = collections.defaultdict(lambda: array.array("I"))
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def add(self, member_id, keys):
+        slot = self.slot_of.get(member_id)
+        if slot is not None:
+            if self.slot_keys[slot] == keys:
+                return
+            self._kill(slot)
+
+        slot = self._append(member_id, keys)
+        for key in keys:
+            if self.sort:
+                position = bisect.bisect_left(self.keys, key)
+                self.keys.insert(position, key)
+                self.key_slots.insert(position, slot)
+            else:
+                self.keys.append(key)
+                self.key_slots.append(slot)
+
+    def _append(self, member_id, keys):
+        slot = len(self.slots)
+        self.slots.append(member_id)
+        self.slot_keys.append(keys)
+        self.slot_of[member_id] = slot
+        for gram in set().union(*(trigrams(key) for key in keys)):
+            self.grams[gram].append(slot)
+        return slot
+
+    def remove(self, member_id):
+        slot = self.slot_of.pop(member_id, None)
+        if slot is not None:
+            self._kill(slot, forget=False)
+
+    def _kill(self, slot, forget=True):
+        if forget:
+            self.slot_of.pop(self.slots[slot], None)
+        self.slots[slot] = None
+        self.slot_keys[slot] = ()
+        self.dead += 1
+        if self.dead > max(1000, len(self.slot_of)):
+            self.compact()
+
+    def compact(self):
+        """Rebuild without the dead slots, with the names sorted"""
+        live = [(member_id, keys) for member_id, keys in zip(self.slots, self.slot_keys) if member_id is not None]
+        self._reset()
+        pairs = []
+        for member_id, keys in live:
+            slot = self._append(member_id, keys)
+            pairs.extend((key, slot) for key in keys)
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.key_slots = array.array("I", (slot for _, slot in pairs))
+
+    def finish(self):
+        """Sort the names appended while the guild was first indexed"""
+        if self.dead:
+            self.compact()
+        else:
+            order = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+            self.keys = [self.keys[i] for i in order]
+            self.key_slots = array.array("I", (self.key_slots[i] for i in order))
+        self.sort = True
+
+    def search(self, query, limit=10):
+        """[(member ID, score, matched key)] best first"""
+        query = normalise(query)
+        if not query:
+            return []
+        query_grams = trigrams(query)
+        best = {}
+
+        def consider(slot):
+            member_id = self.slots[slot]
+            if member_id is None or member_id in best:
+                return
+            value, key = max((score(query, query_grams, key), key) for key in self.slot_keys[slot])
+            if value >= MIN_SCORE:
+                best[member_id] = (value, key)
+
+        position = bisect.bisect_left(self.keys, query)
+        for key, slot in zip(self.keys[position:position + PREFIX_SCAN], self.key_slots[position:position + PREFIX_SCAN]):
+            if not key.startswith(query):
+                break
+            consider(slot)
+
+        # Prefix matches always outrank the rest, so with enough of them there's no need to look further
+        if query_grams and len(best) < limit:
+            # Count shared trigrams, the rarest first, and score the members sharing the most.
+            # A name containing the query has all of its trigrams, so the rarest ones are enough
+            postings = sorted(filter(None, (self.grams.get(gram) for gram in query_grams)), key=len)
+            counts = collections.Counter()
+            scanned = 0
+            for slots in postings:
+                if counts and scanned + len(slots) > SCAN_BUDGET:
+                    break
+                counts.update(slots[:SCAN_BUDGET])
+                scanned += len(slots)
+            if counts:
+                # Near the best count, most_common sorts them all and is the slowest part
+                enough = max(counts.values()) - 1
+                near = (slot for slot, count in counts.items() if count >= enough)
+                for slot in itertools.islice(near, CANDIDATES):
+                    consider(slot)
+
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], len(item[1][1]), item[1][1]))
+        return [(member_id, value, key) for member_id, (value, key) in ranked[:limit]]
+
+    def memory_bytes(self):
+        """Approximate, sampled. Member IDs are the library's ints and not counted"""
+        total = sys.getsizeof(self.slots) + sys.getsizeof(self.slot_of) + sys.getsizeof(self.key_slots)
+        total += sampled_sizeof(self.keys)
+        # The tuples only, their strings are the ones in keys
+        sample = self.slot_keys[:SIZE_SAMPLE]
+        if sample:
+            total += sys.getsizeof(self.slot_keys) + sum(map(sys.getsizeof, sample)) * len(self.slot_keys) // len(sample)
+        total += sys.getsizeof(self.grams) + sum(sys.getsizeof(gram) + sys.getsizeof(slots) for gram, slots in self.grams.items())
+        return total
+
+
+class MemberIndex:
+    """
+    A name index per guild over the cached members, kept up to date from member events
+
+    Guilds are indexed as they become available, in batches between other
+    events, and search() answers from the index in well under a millisecond
+    instead of scanning the member list. Until a guild is indexed search()
+    returns None and callers fall back to the library's lookup.
+
+    Only cached members are indexed. With the lazy or minimal member cache
+    that is the members the bot has seen, so a miss doesn't mean the member
+    isn't in the guild.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.guilds = {}
+        self._building = {}
+        self.build_seconds = 0.0
+        self.searches = 0
+        self.search_seconds = 0.0
+
+        bot.add_listener(self.on_ready)
+        bot.add_listener(self.on_guild_available)
+        bot.add_listener(self.on_guild_join)
+        bot.add_listener(self.on_guild_remove)
+        bot.add_listener(self.on_member_join)
+        bot.add_listener(self.on_member_update)
+        bot.add_listener(self.on_user_update)
+        bot.add_listener(self.on_raw_member_remove)
+
+    async def on_ready(self):
+        for guild in self.bot.guilds:
+            self.build(guild)
+
+    async def on_guild_available(self, guild):
+        if self.bot.is_ready():
+            self.build(guild)
+
+    async def on_guild_join(self, guild):
+        self.build(guild)
+
+    async def on_guild_remove(self, guild):
+        task = self._building.pop(guild.id, None)
+        if task is not None:
+            task.cancel()
+        self.guilds.pop(guild.id, None)
+
+    async def on_member_join(self, member):
+        self.add(member)
+
+    async def on_member_update(self, before, after):
+        if before.nick != after.nick:
+            self.add(after)
+
+    async def on_user_update(self, before, after):
+        if before.name == after.name and before.global_name == after.global_name:
+            return
+        for guild in after.mutual_guilds:
+            member = guild.get_member(after.id)
+            if member is not None:
+                self.add(member)
+
+    async def on_raw_member_remove(self, payload):
+        index = self.guilds.get(payload.guild_id)
+        if index is not None:
+            index.remove(payload.user.id)
+
+    def add(self, member):
+        index = self.guilds.get(member.guild.id)
+        if index is not None:
+            index.add(member.id, member_keys(member))
+
+    def build(self, guild):
+        """Index a guild's cached members in the background, once"""
+        if guild.id in self.guilds or guild.id in self._building:
+            return
+        self._building[guild.id] = asyncio.create_task(self._build(guild))
+
+    async def _build(self, guild):
+        start = time.perf_counter()
+        index = GuildIndex(sort=False)
+        # Members joining or changing names meanwhile go straight into the index
+        self.guilds[guild.id] = index
+        try:
+            member_ids = list(guild._members)
+            for start_at in range(0, len(member_ids), BUILD_BATCH):
+                for member_id in member_ids[start_at:start_at + BUILD_BATCH]:
+                    member = guild.get_member(member_id)
+                    if member is not None:
+                        index.add(member_id, member_keys(member))
+                await asyncio.sleep(0)
+            index.finish()
+        except BaseException:
+            self.guilds.pop(guild.id, None)
+            raise
+        finally:
+            self._building.pop(guild.id, None)
+
+        elapsed = time.perf_counter() - start
+        self.build_seconds += elapsed
+        logger.info(f"Indexed {len(index):,} member names of {guild.name} in {elapsed:.2f}s")
+
+    def ready(self, guild):
+        return guild.id in self.guilds and guild.id not in self._building
+
+    def search(self, guild, query, limit=10):
+        """
+        [(member, score, matched name)] best first, None while the guild isn't indexed
+
+        See EXACT, PREFIX, SUBSTRING and FUZZY for what the scores mean.
+        """
+        if not self.ready(guild):
+            return None
+        start = time.perf_counter()
+        index = self.guilds[guild.id]
+        results = []
+        for member_id, value, key in index.search(query, limit):
+            member = guild.get_member(member_id)
+            if member is None:
+                # Dropped from the member cache since it was indexed
+                index.remove(member_id)
+                continue
+            results.append((member, value, key))
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - start
+        return results
+
+    def stats(self):
+        return {
+            "guilds": len(self.guilds),
+            "members": sum(len(index) for index in self.guilds.values()),
+            "names": sum(len(index.keys) for index in self.guilds.values()),
+            "trigrams": sum(len(index.grams) for index in self.guilds.values()),
+            "building": len(self._building),
+            "build_seconds": self.build_seconds,
+            "searches": self.searches,
+            "average_search": self.search_seconds / self.searches if self.searches else 0.0,
+        }
+
+    def memory_bytes(self):
+        return sum(index.memory_bytes() for index in self.guilds.values())
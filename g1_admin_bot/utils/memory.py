@@ -0,0 +1,302 @@
+import asyncio
+import glob
+import itertools
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+logger = logging.getLogger("g1_admin.memory")
+
+SIZE_SAMPLE = 200          # items sized to estimate a big collection
+REPORT_TIMER = "memory-report"
+TRACE_FRAMES = 1           # stack frames tracemalloc keeps per allocation, 1 is the cheapest
+MAX_TRACE_FRAMES = 25      # more makes every allocation slower and snapshots much larger
+SNAPSHOT_DIR = "memory_snapshots"
+SNAPSHOT_KEEP = 10         # snapshot files kept on disk, oldest are deleted
+
+# Allocations made by the import system and tracemalloc itself are noise in a diff
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# Not followed when sizing: code and classes are shared by everything
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+_ATOMIC = (str, bytes, int, float, bool, type(None))
+
+
+def deep_sizeof(obj, shared=()):
+    """
+    Bytes held by obj and everything it references
+
+    Objects in shared (the guild, the connection state...) and anything only
+    reachable through them are not counted, so sizing a member doesn't size the bot.
+    """
+    seen = {id(o) for o in shared}
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _OPAQUE):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+
+        if isinstance(o, _ATOMIC):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+            continue
+        if isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+            continue
+
+        attributes = getattr(o, "__dict__", None)
+        if attributes is not None:
+            stack.append(attributes)
+        for cls in type(o).__mro__:
+            slots = cls.__dict__.get("__slots__", ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            for name in slots:
+                try:
+                    stack.append(getattr(o, name))
+                except AttributeError:
+                    pass
+    return total
+
+
+def sampled_sizeof(container, shared=(), sample=SIZE_SAMPLE):
+    """
+    Approximate deep size of a big list, dict or deque
+
+    Only the first sample items (values, for a dict) are sized and the result
+    is scaled up to the whole container, so sizing a million users takes as
+    long as sizing two hundred.
+    """
+    return sampled_sizeof_all([container], shared, sample)
+
+
+def sampled_sizeof_all(containers, shared=(), sample=SIZE_SAMPLE):
+    """sampled_sizeof for several containers together, e.g. every guild's channels"""
+    containers = list(containers)
+    total = sum(sys.getsizeof(container) for container in containers)
+    count = sum(len(container) for container in containers)
+
+    head = []
+    for container in containers:
+        items = container.values() if hasattr(container, "values") else container
+        head.extend(itertools.islice(items, sample - len(head)))
+        if len(head) >= sample:
+            break
+    if not head:
+        return total
+    per_item = (deep_sizeof(head, shared=shared) - sys.getsizeof(head)) / len(head)
+    return total + int(per_item * count)
+
+
+def process_rss():
+    """Resident memory of this process in bytes, None if it can't be read"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current outside Linux, kilobytes on Linux but bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def format_bytes(nbytes):
+    for unit in ("B", "KB", "MB"):
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.2f} GB"
+
+
+def short_path(filename):
+    """The last two parts of a source path, enough to tell site-packages/discord from cogs"""
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+class MemoryAccounting:
+    """
+    Approximate memory held by the bot's own structures and the library's caches
+
+    Every owner (a cog, "bot" for shared helpers, "discord.py" for the
+    library) has a reporter, a function returning {structure: bytes}. Cogs
+    add theirs with add_reporter(self.qualified_name, ...) and remove it in
+    cog_unload. Sizes come from deep_sizeof, with big collections sampled, so
+    a report takes milliseconds. One is taken every interval seconds on the
+    timer wheel and by !mem, metrics publish the latest.
+
+    The reports are what stays on in production, tracemalloc is off unless
+    started (tracemalloc in the config, or !mem trace on). It can't sample:
+    every allocation is traced, which makes allocation-heavy code several
+    times slower even with one frame. The bot is idle most of the time so
+    that is bearable for a while, e.g. a few hours around a suspected leak.
+    Snapshots are written to snapshot_dir and compared with the previous one.
+    """
+
+    def __init__(self, bot, interval=300, snapshot_dir=SNAPSHOT_DIR, trace_frames=TRACE_FRAMES):
+        self.bot = bot
+        self.interval = interval
+        self.snapshot_dir = snapshot_dir
+        self.trace_frames = trace_frames
+        self._reporters = {}
+        self.last = None
+        # The latest snapshot, kept for the next diff
+        self._snapshot = None
+
+        self.add_reporter("discord.py", self.library_sizes)
+        self.add_reporter("bot", self.core_sizes)
+        bot.add_listener(self.on_ready)
+
+    def add_reporter(self, owner, reporter):
+        self._reporters[owner] = reporter
+
+    def remove_reporter(self, owner):
+        self._reporters.pop(owner, None)
+
+    async def on_ready(self):
+        self.bot.timers.schedule(REPORT_TIMER, self.interval, self._scheduled_report)
+
+    def _scheduled_report(self):
+        try:
+            self.report()
+        finally:
+            self.bot.timers.schedule(REPORT_TIMER, self.interval, self._scheduled_report)
+
+    def _shared(self):
+        # Everything reaches the whole bot through these, they're counted on their own
+        guilds = list(self.bot.guilds)
+        return [self.bot, self.bot._connection] + guilds + [c for guild in guilds for c in guild._channels.values()]
+
+    def library_sizes(self):
+        """The library's caches: messages, users, members, channels, roles, emojis"""
+        state = self.bot._connection
+        shared = self._shared()
+        guilds = list(self.bot.guilds)
+
+        sizes = {
+            "messages": sampled_sizeof(state._messages, shared) if state._messages is not None else 0,
+            "users": sampled_sizeof(state._users, shared),
+            "channels": sampled_sizeof_all([guild._channels for guild in guilds], shared[:2] + guilds),
+            "roles": sampled_sizeof_all([guild._roles for guild in guilds], shared),
+            "emojis": sampled_sizeof(state._emojis, shared) + sampled_sizeof(state._stickers, shared),
+        }
+        member_cache = getattr(self.bot, "member_cache", None)
+        if member_cache is not None:
+            sizes["members"] = member_cache.memory_report()["estimated_bytes"]
+        return sizes
+
+    def core_sizes(self):
+        """The shared helpers hung off the bot: caches, queues, timing data"""
+        bot = self.bot
+        shared = self._shared()
+        sizes = {}
+
+        message_cache = getattr(bot, "message_cache", None)
+        if message_cache is not None:
+            sizes["message_cache"] = message_cache.stats()["bytes"]
+        web_client = getattr(bot, "web", None)
+        if web_client is not None:
+            sizes["download_cache"] = web_client.stats()["bytes"]
+        member_index = getattr(bot, "member_index", None)
+        if member_index is not None:
+            sizes["member_index"] = member_index.memory_bytes()
+        help_cache = getattr(bot, "help_cache", None)
+        if help_cache is not None:
+            sizes["help_cache"] = deep_sizeof(help_cache._entries, shared)
+        error_digest = getattr(bot, "error_digest", None)
+        if error_digest is not None:
+            sizes["error_digest"] = deep_sizeof([error_digest._errors, error_digest._replied], shared)
+        perf = getattr(bot, "perf", None)
+        if perf is not None:
+            sizes["command_timings"] = deep_sizeof(perf.commands, shared)
+        interactions = getattr(bot, "interactions", None)
+        if interactions is not None:
+            sizes["interaction_waiters"] = deep_sizeof(interactions._waiters, shared)
+        sizes["loggers"] = deep_sizeof(logging.Logger.manager.loggerDict, shared)
+        return sizes
+
+    def report(self):
+        """Sizes from every reporter, biggest first, also kept as self.last"""
+        start = time.perf_counter()
+        rows = []
+        for owner, reporter in list(self._reporters.items()):
+            try:
+                sizes = reporter()
+            except Exception as e:
+                logger.error(f"Memory reporter for {owner} failed: {e}")
+                continue
+            rows.extend((owner, structure, int(nbytes)) for structure, nbytes in sizes.items())
+        rows.sort(key=lambda row: row[2], reverse=True)
+
+        self.last = {
+            "when": time.time(),
+            "rss": process_rss(),
+            "traced": tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None,
+            "rows": rows,
+            "seconds": time.perf_counter() - start,
+        }
+        return self.last
+
+    def start_tracing(self, frames=None):
+        """Start tracemalloc with at most MAX_TRACE_FRAMES frames, False if it was already running"""
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(max(1, min(frames or self.trace_frames, MAX_TRACE_FRAMES)))
+        logger.info(f"tracemalloc started with {tracemalloc.get_traceback_limit()} frame(s)")
+        return True
+
+    def stop_tracing(self):
+        """Stop tracemalloc and forget the last snapshot, False if it wasn't running"""
+        self._snapshot = None
+        if not tracemalloc.is_tracing():
+            return False
+        tracemalloc.stop()
+        logger.info("tracemalloc stopped")
+        return True
+
+    def _take_snapshot(self, limit):
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = os.path.join(self.snapshot_dir, f"snapshot-{os.getpid()}-{int(time.time())}.tracemalloc")
+        snapshot.dump(path)
+        for old in sorted(glob.glob(os.path.join(self.snapshot_dir, "snapshot-*.tracemalloc")), key=os.path.getmtime)[:-SNAPSHOT_KEEP]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is None:
+            return path, snapshot.statistics("lineno")[:limit], False
+        return path, snapshot.compare_to(previous, "lineno")[:limit], True
+
+    async def snapshot(self, limit=10):
+        """
+        Take a tracemalloc snapshot, write it to disk and compare it with the previous one
+
+        Runs in a thread. Returns (path, top statistics, whether they are a diff),
+        the statistics are line totals for the first snapshot and growth since the
+        previous one after that.
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        return await asyncio.to_thread(self._take_snapshot, limit)
@@ -0,0 +1,211 @@
+import logging
+import re
+import sys
+from collections import OrderedDict
+
+logger = logging.getLogger("g1_admin.message_cache")
+
+MESSAGE_LINK = re.compile(
+    r"https?://(?:(?:ptb|canary)\.)?discord(?:app)?\.com/channels/(\d+|@me)/(\d+)/(\d+)"
+)
+
+IMAGE_EXTENSIONS = ('png', 'jpeg', 'jpg', 'gif', 'webp')
+
+
+def parse_message_reference(text):
+    """
+    Parse a message link, "channel_id-message_id" or a bare message ID
+
+    Returns (channel_id, message_id) with channel_id None for a bare ID,
+    or None if the text isn't a message reference.
+    """
+    text = text.strip().strip("<>")
+    match = MESSAGE_LINK.fullmatch(text)
+    if match:
+        return int(match.group(2)), int(match.group(3))
+
+    # Format used by "Copy ID" with shift held in the desktop client
+    if "-" in text:
+        channel_id, _, message_id = text.partition("-")
+        if channel_id.isdigit() and message_id.isdigit():
+            return int(channel_id), int(message_id)
+        return None
+
+    if text.isdigit():
+        return None, int(text)
+
+    return None
+
+
+class CachedAttachment:
+    __slots__ = ("url", "filename", "content_type", "size")
+
+    def __init__(self, url, filename, content_type, size):
+        self.url = url
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+
+    @property
+    def is_image(self):
+        if self.content_type:
+            return self.content_type.startswith("image/")
+        return self.url.lower().split("?")[0].endswith(IMAGE_EXTENSIONS)
+
+
+class CachedMessage:
+    """The parts of a message needed to quote it, without holding on to the library objects"""
+
+    __slots__ = ("id", "channel_id", "guild_id", "author_id", "author_name", "author_avatar_url",
+                 "content", "created_at", "attachments", "nbytes")
+
+    def __init__(self, id, channel_id, guild_id, author_id, author_name, author_avatar_url,
+                 content, created_at, attachments):
+        self.id = id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.author_id = author_id
+        self.author_name = author_name
+        self.author_avatar_url = author_avatar_url
+        self.content = content
+        self.created_at = created_at
+        self.attachments = attachments
+        self.nbytes = self._measure()
+
+    @classmethod
+    def from_message(cls, message):
+        attachments = tuple(
+            CachedAttachment(a.url, a.filename, a.content_type, a.size) for a in message.attachments
+        )
+        return cls(
+            message.id,
+            message.channel.id,
+            message.guild.id if message.guild else None,
+            message.author.id,
+            message.author.display_name,
+            message.author.display_avatar.url,
+            message.content,
+            message.created_at,
+            attachments
+        )
+
+    @property
+    def jump_url(self):
+        guild = self.guild_id or "@me"
+        return f"https://discord.com/channels/{guild}/{self.channel_id}/{self.id}"
+
+    def _measure(self):
+        """Approximate bytes held by this record"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.content) + sys.getsizeof(self.author_name)
+        size += sys.getsizeof(self.author_avatar_url) + sys.getsizeof(self.attachments)
+        for attachment in self.attachments:
+            size += sys.getsizeof(attachment) + sys.getsizeof(attachment.url) + sys.getsizeof(attachment.filename)
+        return size
+
+
+class MessageCache:
+    """
+    Bounded LRU cache of recently seen messages
+
+    Bounded both by entry count and by the approximate bytes held, whichever
+    is hit first. Filled from on_message, kept in sync with edits and deletes.
+    """
+
+    def __init__(self, bot, max_entries=50000, max_bytes=32 * 1024 * 1024):
+        self.bot = bot
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._messages = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        bot.add_listener(self.on_message)
+        bot.add_listener(self.on_raw_message_edit)
+        bot.add_listener(self.on_raw_message_delete)
+        bot.add_listener(self.on_raw_bulk_message_delete)
+
+    def __len__(self):
+        return len(self._messages)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "entries": len(self._messages),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+    def get(self, message_id, channel_id=None):
+        """The cached message, None if it isn't cached or is in a different channel than channel_id"""
+        cached = self._messages.get(message_id)
+        if cached is None or (channel_id is not None and cached.channel_id != channel_id):
+            self.misses += 1
+            return None
+
+        self._messages.move_to_end(message_id)
+        self.hits += 1
+        return cached
+
+    def put(self, cached):
+        previous = self._messages.pop(cached.id, None)
+        if previous is not None:
+            self.nbytes -= previous.nbytes
+
+        self._messages[cached.id] = cached
+        self.nbytes += cached.nbytes
+
+        while self._messages and (len(self._messages) > self.max_entries or self.nbytes > self.max_bytes):
+            _, evicted = self._messages.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def remove(self, message_id):
+        cached = self._messages.pop(message_id, None)
+        if cached is not None:
+            self.nbytes -= cached.nbytes
+
+    async def fetch(self, channel, message_id):
+        """
+        Get a message in channel from the cache, falling back to the API (raises discord.NotFound etc.)
+
+        A cached message from another channel is a miss, so it's only ever
+        returned from the channel the caller checked permissions on.
+        """
+        cached = self.get(message_id, channel.id)
+        if cached is not None:
+            return cached
+
+        message = await channel.fetch_message(message_id)
+        cached = CachedMessage.from_message(message)
+        self.put(cached)
+        return cached
+
+    async def on_message(self, message):
+        self.put(CachedMessage.from_message(message))
+
+    async def on_raw_message_edit(self, payload):
+        cached = self._messages.get(payload.message_id)
+        if cached is None or "content" not in payload.data:
+            return
+
+        # Re-create the record so byte accounting stays right
+        self.put(CachedMessage(
+            cached.id, cached.channel_id, cached.guild_id, cached.author_id, cached.author_name,
+            cached.author_avatar_url, payload.data["content"], cached.created_at, cached.attachments
+        ))
+
+    async def on_raw_message_delete(self, payload):
+        self.remove(payload.message_id)
+
+    async def on_raw_bulk_message_delete(self, payload):
+        for message_id in payload.message_ids:
+            self.remove(message_id)
@@ -0,0 +1,405 @@
+import asyncio
+import bisect
+import logging
+import re
+import time
+
+from aiohttp import web
+
+from utils.memory import process_rss
+
+logger = logging.getLogger("g1_admin.metrics")
+
+# Seconds, from a fast cached reply up to a broadcast
+COMMAND_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+HTTP_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+STALL_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LAG_INTERVAL = 0.5  # how often the loop lag probe wakes up
+
+SNOWFLAKE = re.compile(r"\d{15,21}")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def clear(self):
+        self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, value, *labels):
+        """For counts kept elsewhere (e.g. cache hits), copied in at scrape time"""
+        self._values[labels] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=COMMAND_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            # One count per bucket plus +Inf, then sum
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics in the Prometheus text format
+
+    Things that are cheaper to read than to track (cache sizes, queue depths)
+    are filled in by collectors, functions called just before each scrape.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=COMMAND_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self):
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__qualname__', collector)} failed: {e}")
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RateLimitLogHandler(logging.Handler):
+    """
+    Counts 429 responses from the library's HTTP client log
+
+    discord.py retries rate limited requests itself and only logs them, so its
+    warning is the one place they show up. The log arguments are (method, url, ...).
+    """
+
+    def __init__(self, counter, api_prefix="/api/v"):
+        super().__init__(logging.WARNING)
+        self.counter = counter
+        self.api_prefix = api_prefix
+
+    def emit(self, record):
+        if "429" not in str(record.msg) or not isinstance(record.args, tuple) or len(record.args) < 2:
+            return
+        method, url = record.args[0], str(record.args[1])
+        path = url.split(self.api_prefix, 1)[-1]
+        path = "/" + path.split("/", 1)[1] if "/" in path else path
+        self.counter.inc(str(method), SNOWFLAKE.sub("{id}", path))
+
+
+class BotMetrics:
+    """
+    The bot's standard metrics and the hooks that feed them
+
+    Commands are timed from on_command to completion or error, gateway events are
+    counted per type, REST calls per route through a wrapper around the HTTP
+    client, and a probe task measures how late the event loop wakes up.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.registry = MetricsRegistry()
+        registry = self.registry
+
+        self.commands = registry.counter("g1_commands_total", "Commands invoked", ("command", "outcome"))
+        self.command_duration = registry.histogram(
+            "g1_command_duration_seconds", "Time from invocation to completion", ("command",), COMMAND_BUCKETS
+        )
+        self.events = registry.counter("g1_gateway_events_total", "Gateway events received", ("type",))
+        self.http_requests = registry.counter(
+            "g1_http_requests_total", "Discord API requests", ("method", "route", "status")
+        )
+        self.http_duration = registry.histogram(
+            "g1_http_request_duration_seconds", "Discord API request time, including rate limit waits",
+            ("method", "route"), HTTP_BUCKETS
+        )
+        self.http_ratelimited = registry.counter(
+            "g1_http_ratelimited_total", "Discord API responses with status 429", ("method", "route")
+        )
+        self.latency = registry.gauge("g1_gateway_latency_seconds", "Heartbeat latency", ("shard",))
+        self.guilds = registry.gauge("g1_guilds", "Guilds this process is in")
+        self.queue_depth = registry.gauge("g1_queue_depth", "Items waiting in internal queues", ("queue",))
+        self.cache_entries = registry.gauge("g1_cache_entries", "Entries held by in-memory caches", ("cache",))
+        self.cache_bytes = registry.gauge("g1_cache_bytes", "Approximate memory held by caches", ("cache",))
+        self.cache_hits = registry.counter("g1_cache_hits_total", "Cache lookups answered from memory", ("cache",))
+        self.cache_misses = registry.counter("g1_cache_misses_total", "Cache lookups that missed", ("cache",))
+        self.cache_hit_ratio = registry.gauge("g1_cache_hit_ratio", "Hits over lookups since startup", ("cache",))
+        self.broadcast_messages = registry.counter(
+            "g1_broadcast_messages_total", "Broadcast DMs by result", ("result",)
+        )
+        self.outbound_dropped = registry.counter(
+            "g1_outbound_updates_dropped_total", "Progress updates merged into a newer one or shed under load", ("reason",)
+        )
+        self.outbound_in_flight = registry.gauge("g1_outbound_in_flight", "Discord API requests in flight", ("lane",))
+        self.loop_lag = registry.gauge("g1_event_loop_lag_seconds", "How late the last loop lag probe woke up")
+        self.loop_lag_histogram = registry.histogram(
+            "g1_event_loop_lag_distribution_seconds", "How late loop lag probes wake up", (), LAG_BUCKETS
+        )
+
+        self.loop_stalls = registry.histogram(
+            "g1_event_loop_stall_seconds", "Times the loop was blocked past the watchdog threshold, by call site",
+            ("site",), STALL_BUCKETS
+        )
+        self.memory_bytes = registry.gauge(
+            "g1_memory_bytes", "Approximate memory held by each owner's structures", ("owner", "structure")
+        )
+        self.resident_memory = registry.gauge("g1_process_resident_memory_bytes", "Resident memory of this process")
+        self.traced_memory = registry.gauge("g1_tracemalloc_bytes", "Memory traced by tracemalloc while it runs", ("kind",))
+
+        self._lag_task = None
+        self._http_wrapped = False
+        registry.add_collector(self.collect)
+
+        bot.add_listener(self.on_command)
+        bot.add_listener(self.on_command_completion)
+        bot.add_listener(self.on_command_error)
+        bot.add_listener(self.on_socket_event_type)
+
+        logging.getLogger("discord.http").addHandler(RateLimitLogHandler(self.http_ratelimited))
+
+    def start(self):
+        """Hook the HTTP client and start the lag probe, needs a running loop"""
+        self.instrument_http()
+        if self._lag_task is None or self._lag_task.done():
+            self._lag_task = asyncio.create_task(self._probe_loop_lag())
+
+    def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+    async def on_command(self, ctx):
+        ctx.metrics_started = time.perf_counter()
+
+    def _finish_command(self, ctx, outcome):
+        if ctx.command is None:
+            return
+        name = ctx.command.qualified_name
+        self.commands.inc(name, outcome)
+        started = getattr(ctx, "metrics_started", None)
+        if started is not None:
+            self.command_duration.observe(time.perf_counter() - started, name)
+
+    async def on_command_completion(self, ctx):
+        self._finish_command(ctx, "ok")
+
+    async def on_command_error(self, ctx, error):
+        self._finish_command(ctx, "error")
+
+    async def on_socket_event_type(self, event_type):
+        self.events.inc(event_type)
+
+    def instrument_http(self):
+        if self._http_wrapped:
+            return
+        http = self.bot.http
+        request = http.request
+
+        async def timed_request(route, **kwargs):
+            start = time.perf_counter()
+            status = "error"
+            try:
+                result = await request(route, **kwargs)
+                status = "2xx"
+                return result
+            except Exception as e:
+                status = str(getattr(e, "status", "error"))
+                raise
+            finally:
+                # route.path is the template, e.g. /channels/{channel_id}/messages
+                path = getattr(route, "path", "unknown")
+                method = getattr(route, "method", "GET")
+                self.http_requests.inc(method, path, status)
+                self.http_duration.observe(time.perf_counter() - start, method, path)
+
+        http.request = timed_request
+        self._http_wrapped = True
+
+    async def _probe_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            lag = max(0.0, loop.time() - start - LAG_INTERVAL)
+            self.loop_lag.set(lag)
+            self.loop_lag_histogram.observe(lag)
+
+    def observe_stall(self, stall):
+        """on_stall callback for the LoopWatchdog"""
+        self.loop_stalls.observe(stall.seconds, stall.site)
+
+    def set_cache(self, cache, entries, hits=None, misses=None, nbytes=None):
+        """Publish a cache's counters, for collectors"""
+        self.cache_entries.set(entries, cache)
+        if nbytes is not None:
+            self.cache_bytes.set(nbytes, cache)
+        if hits is not None and misses is not None:
+            self.cache_hits.set(hits, cache)
+            self.cache_misses.set(misses, cache)
+            self.cache_hit_ratio.set(hits / (hits + misses) if hits + misses else 0.0, cache)
+
+    def collect(self):
+        bot = self.bot
+        self.guilds.set(len(bot.guilds))
+
+        self.latency.clear()
+        shards = getattr(bot, "shards", None)
+        if shards:
+            for shard_id, shard in shards.items():
+                if shard.latency == shard.latency and shard.latency != float("inf"):
+                    self.latency.set(shard.latency, str(shard_id))
+        elif bot.latency == bot.latency and bot.latency != float("inf"):
+            self.latency.set(bot.latency, "0")
+
+        message_cache = getattr(bot, "message_cache", None)
+        if message_cache is not None:
+            stats = message_cache.stats()
+            self.set_cache("messages", stats["entries"], stats["hits"], stats["misses"], stats["bytes"])
+
+        member_cache = getattr(bot, "member_cache", None)
+        if member_cache is not None:
+            self.set_cache("members", sum(len(guild._members) for guild in bot.guilds))
+
+        help_cache = getattr(bot, "help_cache", None)
+        if help_cache is not None:
+            stats = help_cache.stats()
+            self.set_cache("help", stats["entries"], stats["hits"], stats["misses"])
+
+        web_client = getattr(bot, "web", None)
+        if web_client is not None:
+            stats = web_client.stats()
+            self.set_cache("downloads", stats["entries"], stats["hits"], stats["misses"], stats["bytes"])
+
+        outbound = getattr(bot, "outbound", None)
+        if outbound is not None:
+            stats = outbound.stats()
+            for lane, waiting in stats["waiting"].items():
+                self.queue_depth.set(waiting, f"outbound_{lane}")
+                self.outbound_in_flight.set(stats["in_flight"][lane], lane)
+            self.outbound_dropped.set(stats["merged"], "merged")
+            self.outbound_dropped.set(stats["shed"], "shed")
+
+        error_digest = getattr(bot, "error_digest", None)
+        if error_digest is not None:
+            self.queue_depth.set(error_digest.stats()["pending"], "error_digest")
+
+        interactions = getattr(bot, "interactions", None)
+        if interactions is not None:
+            self.queue_depth.set(interactions.pending_count(), "interaction_waiters")
+
+        # Sizing takes a few milliseconds, so scrapes publish the last periodic report
+        memory = getattr(bot, "memory", None)
+        if memory is not None and memory.last is not None:
+            self.memory_bytes.clear()
+            for owner, structure, nbytes in memory.last["rows"]:
+                self.memory_bytes.set(nbytes, owner, structure)
+            self.traced_memory.clear()
+            if memory.last["traced"] is not None:
+                self.traced_memory.set(memory.last["traced"][0], "current")
+                self.traced_memory.set(memory.last["traced"][1], "peak")
+        rss = process_rss()
+        if rss is not None:
+            self.resident_memory.set(rss)
+
+    async def handle(self, request):
+        return web.Response(
+            body=self.registry.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    async def serve(self, host="127.0.0.1", port=9100):
+        """Serve /metrics over HTTP, returns the runner to clean up with"""
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Metrics available at http://{host}:{port}/metrics")
+        return runner
@@ -0,0 +1,197 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import logging
+
+logger = logging.getLogger("g1_admin.outbound")
+
+# Lanes, highest priority first
+MODERATION, REPLY, LOG, BULK = range(4)
+LANE_NAMES = ("moderation", "reply", "log", "bulk")
+
+# (lane, fairness key) for requests made by the current task, the key is usually the guild ID
+current_lane = contextvars.ContextVar("outbound_lane", default=(REPLY, None))
+
+
+def set_lane(lane, key=None):
+    """Put the rest of the current task in a lane, e.g. from a cog_before_invoke hook"""
+    current_lane.set((lane, key))
+
+
+@contextlib.contextmanager
+def lane(lane, key=None):
+    """Send the requests made inside the block in a lane"""
+    token = current_lane.set((lane, key))
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class OutboundScheduler:
+    """
+    Orders the bot's Discord API requests by lane instead of first come, first served
+
+    Every request goes through a wrapper around the HTTP client. Moderation never
+    waits. The other lanes may only start a request while fewer than their
+    ceiling are in flight, so bulk traffic always leaves room for replies and
+    log posts. Waiting requests are granted by lane, and round robin across
+    guilds within a lane, so one guild's broadcast can't starve another's.
+
+    Progress edits and similar go through update(): only the newest unsent one
+    per key is kept, and under pressure intermediate ones are dropped.
+    """
+
+    def __init__(self, bot, capacity=8):
+        self.bot = bot
+        self.capacity = capacity
+        # Most requests in flight (all lanes together) at which a lane may still start one
+        self.ceilings = (None, capacity, max(1, capacity * 3 // 4), max(1, capacity // 2))
+        self.in_flight = [0] * len(LANE_NAMES)
+        self.sent = [0] * len(LANE_NAMES)
+        # Per lane: key -> deque of waiting futures, and the round robin order of keys
+        self._waiting = [{} for _ in LANE_NAMES]
+        self._order = [collections.deque() for _ in LANE_NAMES]
+        self._waiting_count = [0] * len(LANE_NAMES)
+
+        # key -> (factory, final) for the newest unsent update, and the task sending them
+        self._updates = {}
+        self._updaters = {}
+        self.merged = 0
+        self.shed = 0
+
+        self._http_wrapped = False
+
+    def install(self):
+        """Route the HTTP client's requests through the lanes"""
+        if self._http_wrapped:
+            return
+        http = self.bot.http
+        request = http.request
+
+        async def scheduled_request(route, **kwargs):
+            lane_id, key = current_lane.get()
+            if key is None:
+                key = getattr(route, "guild_id", None) or getattr(route, "channel_id", None)
+            await self.acquire(lane_id, key)
+            try:
+                return await request(route, **kwargs)
+            finally:
+                self.release(lane_id)
+
+        http.request = scheduled_request
+        self._http_wrapped = True
+
+    def _total_in_flight(self):
+        return sum(self.in_flight)
+
+    def _queued_up_to(self, lane_id):
+        return any(self._waiting_count[i] for i in range(REPLY, lane_id + 1))
+
+    async def acquire(self, lane_id, key=None):
+        if lane_id == MODERATION or (
+            not self._queued_up_to(lane_id) and self._total_in_flight() < self.ceilings[lane_id]
+        ):
+            self.in_flight[lane_id] += 1
+            self.sent[lane_id] += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._waiting[lane_id].get(key)
+        if queue is None:
+            queue = self._waiting[lane_id][key] = collections.deque()
+            self._order[lane_id].append(key)
+        queue.append(future)
+        self._waiting_count[lane_id] += 1
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled, hand the slot on
+                self.release(lane_id)
+            raise
+
+    def release(self, lane_id):
+        self.in_flight[lane_id] -= 1
+        self._grant()
+
+    def _grant(self):
+        for lane_id in (REPLY, LOG, BULK):
+            while self._waiting_count[lane_id] and self._total_in_flight() < self.ceilings[lane_id]:
+                future = self._next_waiter(lane_id)
+                if future is None:
+                    break
+                self.in_flight[lane_id] += 1
+                self.sent[lane_id] += 1
+                future.set_result(None)
+            if self._waiting_count[lane_id]:
+                # Lower lanes have lower ceilings, they can't go either
+                return
+
+    def _next_waiter(self, lane_id):
+        order = self._order[lane_id]
+        waiting = self._waiting[lane_id]
+        while order:
+            key = order.popleft()
+            queue = waiting[key]
+            future = queue.popleft()
+            self._waiting_count[lane_id] -= 1
+            if queue:
+                order.append(key)
+            else:
+                del waiting[key]
+            if not future.cancelled():
+                return future
+        return None
+
+    def under_pressure(self):
+        """Whether anything more important than bulk traffic is waiting or running"""
+        return bool(self.in_flight[MODERATION] or self._waiting_count[REPLY] or self._waiting_count[LOG])
+
+    def update(self, key, factory, final=False, lane_id=BULK, guild_id=None):
+        """
+        Send a replaceable update, e.g. a progress edit, without waiting for it
+
+        factory() makes the request. A newer update for the same key replaces an
+        unsent one, and while under_pressure() updates that aren't final are dropped.
+        """
+        if key in self._updates:
+            self.merged += 1
+        self._updates[key] = (factory, final)
+        if key not in self._updaters:
+            self._updaters[key] = asyncio.create_task(self._send_updates(key, lane_id, guild_id))
+
+    async def _send_updates(self, key, lane_id, guild_id):
+        try:
+            while key in self._updates:
+                factory, final = self._updates.pop(key)
+                if not final and self.under_pressure():
+                    self.shed += 1
+                    continue
+                with lane(lane_id, guild_id):
+                    try:
+                        await factory()
+                    except Exception as e:
+                        logger.warning(f"Update {key} failed: {e}")
+        finally:
+            self._updaters.pop(key, None)
+
+    async def flush(self, key):
+        """Wait until the updates for key have been sent"""
+        task = self._updaters.get(key)
+        if task is not None:
+            await asyncio.shield(task)
+
+    def queue_depths(self):
+        return {name: self._waiting_count[i] for i, name in enumerate(LANE_NAMES)}
+
+    def stats(self):
+        return {
+            "in_flight": dict(zip(LANE_NAMES, self.in_flight)),
+            "waiting": self.queue_depths(),
+            "sent": dict(zip(LANE_NAMES, self.sent)),
+            "merged": self.merged,
+            "shed": self.shed,
+        }
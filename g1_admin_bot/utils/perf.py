@@ -0,0 +1,243 @@
+import collections
+import contextvars
+import logging
+import math
+import time
+
+logger = logging.getLogger("g1_admin.perf")
+
+PHASES = ("total", "checks", "conversion", "body", "http")
+
+SKETCH_MIN = 1e-6      # seconds, anything faster lands in the first bucket
+SKETCH_GAMMA = 1.02    # bucket growth factor, estimates are within about 1% of the true value
+WINDOW = 600           # seconds per sketch window
+WINDOWS = 6            # windows kept, so percentiles cover the last hour
+RECENT = 50            # invocations remembered per command for the slowest list
+
+# The timing of the command running in the current task, so HTTP calls can be charged to it
+current_timing = contextvars.ContextVar("current_timing", default=None)
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 0.01:
+        return f"{seconds * 1000:.0f}ms"
+    return f"{seconds * 1000:.1f}ms"
+
+
+class LatencySketch:
+    """
+    Log-bucketed histogram in the style of HDR Histogram
+
+    Each value is counted in the bucket [MIN * GAMMA^(k-1), MIN * GAMMA^k), so
+    memory stays bounded (about 1,100 buckets from a microsecond to an hour)
+    and any quantile is reported within about 1% of the real value.
+    """
+
+    __slots__ = ("counts", "count", "max")
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        key = 0 if seconds <= SKETCH_MIN else math.ceil(math.log(seconds / SKETCH_MIN, SKETCH_GAMMA))
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen > rank:
+                # Midpoint of the bucket, in relative terms
+                return min(self.max, SKETCH_MIN * SKETCH_GAMMA ** key * 2 / (1 + SKETCH_GAMMA))
+        return self.max
+
+
+class RollingSketch:
+    """Sketches for consecutive time windows, only the last few are kept"""
+
+    __slots__ = ("window", "windows", "_sketches")
+
+    def __init__(self, window=WINDOW, windows=WINDOWS):
+        self.window = window
+        self.windows = windows
+        self._sketches = collections.deque()
+
+    def add(self, seconds, now):
+        index = int(now // self.window)
+        if not self._sketches or self._sketches[-1][0] != index:
+            self._sketches.append((index, LatencySketch()))
+            while self._sketches[0][0] <= index - self.windows:
+                self._sketches.popleft()
+        self._sketches[-1][1].add(seconds)
+
+    def merged(self, now):
+        index = int(now // self.window)
+        result = LatencySketch()
+        for window_index, sketch in self._sketches:
+            if window_index > index - self.windows:
+                result.merge(sketch)
+        return result
+
+
+class Timing:
+    """Timestamps of one command invocation, plus the HTTP time spent inside it"""
+
+    __slots__ = ("started", "checks_done", "body_started", "finished", "http")
+
+    def __init__(self, started):
+        self.started = started
+        self.checks_done = None
+        self.body_started = None
+        self.finished = None
+        self.http = 0.0
+
+    def phases(self):
+        checks_done = self.checks_done or self.body_started
+        return {
+            "total": self.finished - self.started,
+            "checks": checks_done - self.started,
+            "conversion": self.body_started - checks_done,
+            "body": self.finished - self.body_started,
+            "http": self.http,
+        }
+
+
+class Invocation:
+    __slots__ = ("when", "guild", "author", "failed", "phases")
+
+    def __init__(self, when, guild, author, failed, phases):
+        self.when = when
+        self.guild = guild
+        self.author = author
+        self.failed = failed
+        self.phases = phases
+
+
+class CommandStats:
+    __slots__ = ("calls", "failures", "sketches", "recent")
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.sketches = {phase: RollingSketch() for phase in PHASES}
+        self.recent = collections.deque(maxlen=RECENT)
+
+    def percentiles(self, phase, now, quantiles=(0.5, 0.95, 0.99)):
+        sketch = self.sketches[phase].merged(now)
+        return sketch.count, [sketch.quantile(q) for q in quantiles]
+
+    def slowest(self, limit=5):
+        return sorted(self.recent, key=lambda i: i.phases["total"], reverse=True)[:limit]
+
+
+class CommandTracer:
+    """
+    Times every command through its phases
+
+    bot.py calls begin() from a global check_once (before any other check),
+    body_started() from the bot's before_invoke hook (after conversion) and
+    finish() from its after_invoke hook. A check appended to every command
+    marks where checks end and conversion starts, and a wrapper around the
+    HTTP client adds each request's time to the command that made it.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.commands = {}
+        self._http_wrapped = False
+
+    def instrument(self):
+        """Add the end-of-checks marker to commands that don't have it yet, safe to call repeatedly"""
+        for command in self.bot.walk_commands():
+            if self.checks_done not in command.checks:
+                command.checks.append(self.checks_done)
+        self._wrap_http()
+
+    def _wrap_http(self):
+        if self._http_wrapped:
+            return
+        http = self.bot.http
+        request = http.request
+
+        async def traced_request(route, **kwargs):
+            timing = current_timing.get()
+            if timing is None:
+                return await request(route, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await request(route, **kwargs)
+            finally:
+                timing.http += time.perf_counter() - start
+
+        http.request = traced_request
+        self._http_wrapped = True
+
+    def begin(self, ctx):
+        timing = Timing(time.perf_counter())
+        ctx.perf_timing = timing
+        current_timing.set(timing)
+
+    async def checks_done(self, ctx):
+        timing = getattr(ctx, "perf_timing", None)
+        if timing is not None:
+            timing.checks_done = time.perf_counter()
+        return True
+
+    def body_started(self, ctx):
+        timing = getattr(ctx, "perf_timing", None)
+        if timing is not None:
+            timing.body_started = time.perf_counter()
+
+    def finish(self, ctx):
+        timing = getattr(ctx, "perf_timing", None)
+        current_timing.set(None)
+        if timing is None or timing.body_started is None or ctx.command is None:
+            return
+        timing.finished = time.perf_counter()
+
+        name = ctx.command.qualified_name
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+
+        now = time.time()
+        phases = timing.phases()
+        stats.calls += 1
+        if ctx.command_failed:
+            stats.failures += 1
+        for phase, seconds in phases.items():
+            stats.sketches[phase].add(seconds, now)
+        stats.recent.append(Invocation(
+            now,
+            ctx.guild.name if ctx.guild else "DM",
+            str(ctx.author),
+            ctx.command_failed,
+            phases
+        ))
+
+    def summary(self):
+        """(command, calls in the window, p50, p95, p99) sorted by p95, slowest first"""
+        now = time.time()
+        rows = []
+        for name, stats in self.commands.items():
+            count, (p50, p95, p99) = stats.percentiles("total", now)
+            if count:
+                rows.append((name, count, p50, p95, p99))
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows
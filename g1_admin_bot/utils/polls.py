@@ -0,0 +1,249 @@
+import json
+import logging
+import sqlite3
+import threading
+import datetime
+
+from utils.memory import deep_sizeof
+
+logger = logging.getLogger("g1_admin.polls")
+
+EMOJI_OPTIONS = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
+EMOJI_INDEX = {emoji: i for i, emoji in enumerate(EMOJI_OPTIONS)}
+
+
+class Poll:
+    """A live poll with its running tally"""
+
+    __slots__ = ("message_id", "channel_id", "guild_id", "question", "options",
+                 "created_by", "created_at", "counts", "votes")
+
+    def __init__(self, message_id, channel_id, guild_id, question, options, created_by, created_at):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.question = question
+        self.options = list(options)
+        self.created_by = created_by
+        self.created_at = created_at
+        # Running tally per option and the option each user currently votes for
+        self.counts = [0] * len(self.options)
+        self.votes = {}
+
+    @property
+    def total_votes(self):
+        return len(self.votes)
+
+    def results(self):
+        """(option, count) pairs sorted by vote count, highest first"""
+        return sorted(zip(self.options, self.counts), key=lambda x: x[1], reverse=True)
+
+
+class PollStore:
+    """
+    Polls kept in memory with an SQLite copy on disk
+
+    Votes are applied to the in-memory tally as they arrive (one vote per user)
+    and written to disk in batches by flush(), so closing a poll never needs to
+    fetch the message or recount reactions.
+    """
+
+    def __init__(self, path="polls.db", owns_guild=None):
+        self.path = path
+        # Polls of guilds served by other shard processes are left to them
+        self.owns_guild = owns_guild or (lambda guild_id: True)
+        self.polls = {}
+        # channel_id -> open poll message IDs, oldest first
+        self._by_channel = {}
+        # (message_id, user_id) -> option index, or None for a removed vote
+        self._pending_votes = {}
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS polls (
+                message_id INTEGER PRIMARY KEY,
+                channel_id INTEGER NOT NULL,
+                guild_id INTEGER,
+                question TEXT NOT NULL,
+                options TEXT NOT NULL,
+                created_by INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                closed INTEGER NOT NULL DEFAULT 0,
+                results TEXT
+            );
+            CREATE TABLE IF NOT EXISTS votes (
+                message_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                option INTEGER NOT NULL,
+                PRIMARY KEY (message_id, user_id)
+            );
+        """)
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        rows = self._db.execute(
+            "SELECT message_id, channel_id, guild_id, question, options, created_by, created_at "
+            "FROM polls WHERE closed = 0 ORDER BY created_at"
+        ).fetchall()
+
+        for message_id, channel_id, guild_id, question, options, created_by, created_at in rows:
+            if not self.owns_guild(guild_id):
+                continue
+            poll = Poll(message_id, channel_id, guild_id, question, json.loads(options),
+                        created_by, datetime.datetime.fromisoformat(created_at))
+            self._index(poll)
+
+        for message_id, user_id, option in self._db.execute(
+            "SELECT v.message_id, v.user_id, v.option FROM votes v "
+            "JOIN polls p ON p.message_id = v.message_id WHERE p.closed = 0"
+        ):
+            poll = self.polls.get(message_id)
+            if poll is not None and 0 <= option < len(poll.counts):
+                poll.votes[user_id] = option
+                poll.counts[option] += 1
+
+        if self.polls:
+            logger.info(f"Restored {len(self.polls)} active polls")
+
+    def _index(self, poll):
+        self.polls[poll.message_id] = poll
+        self._by_channel.setdefault(poll.channel_id, []).append(poll.message_id)
+
+    def create(self, message_id, channel_id, guild_id, question, options, created_by):
+        poll = Poll(message_id, channel_id, guild_id, question, options, created_by, datetime.datetime.now())
+        self._index(poll)
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO polls (message_id, channel_id, guild_id, question, options, created_by, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (message_id, channel_id, guild_id, question, json.dumps(poll.options),
+                 created_by, poll.created_at.isoformat())
+            )
+            self._db.commit()
+
+        return poll
+
+    def get(self, message_id):
+        return self.polls.get(message_id)
+
+    def latest_in_channel(self, channel_id):
+        """The most recently created open poll in a channel, or None"""
+        message_ids = self._by_channel.get(channel_id)
+        if not message_ids:
+            return None
+        return self.polls.get(message_ids[-1])
+
+    def vote(self, message_id, user_id, option):
+        """
+        Record a user's vote, replacing any earlier vote in the same poll
+
+        Returns the poll, or None if the message is not an open poll or the option is invalid.
+        """
+        poll = self.polls.get(message_id)
+        if poll is None or not 0 <= option < len(poll.counts):
+            return None
+
+        previous = poll.votes.get(user_id)
+        if previous == option:
+            return poll
+        if previous is not None:
+            poll.counts[previous] -= 1
+
+        poll.votes[user_id] = option
+        poll.counts[option] += 1
+        self._pending_votes[(message_id, user_id)] = option
+        return poll
+
+    def unvote(self, message_id, user_id, option=None):
+        """Remove a user's vote (only if it matches option, when given)"""
+        poll = self.polls.get(message_id)
+        if poll is None:
+            return None
+
+        previous = poll.votes.get(user_id)
+        if previous is None or (option is not None and previous != option):
+            return poll
+
+        del poll.votes[user_id]
+        poll.counts[previous] -= 1
+        self._pending_votes[(message_id, user_id)] = None
+        return poll
+
+    def close(self, message_id):
+        """
+        Close a poll and return it with its final tally
+
+        Only updates memory, pass the poll to save_closed() to record it on disk.
+        """
+        poll = self.polls.pop(message_id, None)
+        if poll is None:
+            return None
+
+        channel_polls = self._by_channel.get(poll.channel_id)
+        if channel_polls:
+            channel_polls.remove(message_id)
+            if not channel_polls:
+                del self._by_channel[poll.channel_id]
+
+        # Final counts are kept with the poll, individual votes are no longer needed
+        for key in [k for k in self._pending_votes if k[0] == message_id]:
+            del self._pending_votes[key]
+
+        return poll
+
+    def save_closed(self, poll):
+        """Record a closed poll's final counts on disk, safe to call from a worker thread"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE polls SET closed = 1, results = ? WHERE message_id = ?",
+                (json.dumps(poll.counts), poll.message_id)
+            )
+            self._db.execute("DELETE FROM votes WHERE message_id = ?", (poll.message_id,))
+            self._db.commit()
+
+    @property
+    def pending_votes(self):
+        """Votes buffered in memory, waiting for the next flush"""
+        return len(self._pending_votes)
+
+    def memory_sizes(self):
+        """Approximate bytes held by the live polls and the votes waiting to be written"""
+        with self._lock:
+            return {
+                "polls": deep_sizeof(self.polls),
+                "pending_votes": deep_sizeof(self._pending_votes),
+            }
+
+    def take_pending_votes(self):
+        """Hand over the votes buffered since the last flush (call from the event loop)"""
+        pending, self._pending_votes = self._pending_votes, {}
+        return pending
+
+    def write_votes(self, pending):
+        """Write a batch from take_pending_votes() to disk, safe to call from a worker thread"""
+        if not pending:
+            return 0
+
+        with self._lock:
+            # Skip polls that were closed while this batch was waiting
+            upserts = [(m, u, o) for (m, u), o in pending.items() if o is not None and m in self.polls]
+            deletes = [(m, u) for (m, u), o in pending.items() if o is None]
+
+            if upserts:
+                self._db.executemany("INSERT OR REPLACE INTO votes (message_id, user_id, option) VALUES (?, ?, ?)", upserts)
+            if deletes:
+                self._db.executemany("DELETE FROM votes WHERE message_id = ? AND user_id = ?", deletes)
+            self._db.commit()
+
+        return len(pending)
+
+    def flush(self):
+        return self.write_votes(self.take_pending_votes())
+
+    def close_db(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
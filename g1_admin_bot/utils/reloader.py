@@ -0,0 +1,122 @@
+import collections
+import importlib.util
+import inspect
+import logging
+import time
+
+logger = logging.getLogger("g1_admin.reloader")
+
+HISTORY = 20
+
+
+class ReloadResult:
+    __slots__ = ("extension", "ok", "seconds", "error", "rolled_back", "handed_off", "when")
+
+    def __init__(self, extension, ok, seconds, error=None, rolled_back=False, handed_off=()):
+        self.extension = extension
+        self.ok = ok
+        self.seconds = seconds
+        self.error = error
+        self.rolled_back = rolled_back
+        self.handed_off = list(handed_off)
+        self.when = time.time()
+
+
+class CogReloader:
+    """
+    Reloads extensions in place, handing cogs' in-memory state to the new instances
+
+    A cog can define export_state(), called just before it's unloaded, and
+    pick the state up in its __init__ with bot.reloader.state_for(name). The
+    state stays available until the reload is over, so when loading the new
+    module fails and discord.py rolls back to the old one, the old cog's
+    fresh instance picks it up instead. The source is compiled before
+    anything is unloaded, so syntax errors don't even reach the rollback.
+
+    Until the reload is over the state is only borrowed: the old instance,
+    and a new one unloaded again because its setup() failed, must leave it
+    open for the instance that ends up loaded (see is_handed_off).
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._handoff = {}
+        self.history = collections.deque(maxlen=HISTORY)
+
+    def state_for(self, cog_name):
+        """State exported by the cog being reloaded, None on a normal load"""
+        return self._handoff.get(cog_name)
+
+    def is_handed_off(self, cog_name):
+        """True while the cog's state is being handed over, cog_unload must not close it then"""
+        return cog_name in self._handoff
+
+    def _cogs_of(self, extension):
+        return [cog for cog in self.bot.cogs.values()
+                if cog.__module__ == extension or cog.__module__.startswith(extension + ".")]
+
+    def check_source(self, extension):
+        """Compile the extension's source without running it, raises SyntaxError"""
+        spec = importlib.util.find_spec(extension)
+        if spec is None or spec.origin is None:
+            raise ModuleNotFoundError(f"No extension named {extension}")
+        with open(spec.origin, "rb") as f:
+            compile(f.read(), spec.origin, "exec")
+
+    async def _export(self, extension):
+        handed_off = []
+        for cog in self._cogs_of(extension):
+            export = getattr(cog, "export_state", None)
+            if export is None:
+                continue
+            state = export()
+            if inspect.isawaitable(state):
+                state = await state
+            if state is not None:
+                self._handoff[cog.qualified_name] = state
+                handed_off.append(cog.qualified_name)
+        return handed_off
+
+    async def reload(self, extension):
+        """Reload (or load, if it isn't loaded yet) one extension, returns a ReloadResult"""
+        start = time.perf_counter()
+        try:
+            self.check_source(extension)
+        except Exception as e:
+            result = ReloadResult(extension, False, time.perf_counter() - start, error=e)
+            self.history.append(result)
+            logger.error(f"Not reloading {extension}: {e}")
+            return result
+
+        if extension not in self.bot.extensions:
+            try:
+                await self.bot.load_extension(extension)
+                result = ReloadResult(extension, True, time.perf_counter() - start)
+            except Exception as e:
+                result = ReloadResult(extension, False, time.perf_counter() - start, error=e)
+        else:
+            handed_off = []
+            try:
+                handed_off = await self._export(extension)
+                await self.bot.reload_extension(extension)
+                result = ReloadResult(extension, True, time.perf_counter() - start, handed_off=handed_off)
+            except Exception as e:
+                # discord.py has put the old module back by now if it could
+                result = ReloadResult(
+                    extension, False, time.perf_counter() - start,
+                    error=e, rolled_back=extension in self.bot.extensions, handed_off=handed_off
+                )
+            finally:
+                self._handoff.clear()
+
+        self.bot.perf.instrument()
+        self.history.append(result)
+        if result.ok:
+            logger.info(f"Reloaded {extension} in {result.seconds * 1000:.0f}ms"
+                        + (f", state handed to {', '.join(result.handed_off)}" if result.handed_off else ""))
+        else:
+            logger.error(f"Reloading {extension} failed ({'rolled back' if result.rolled_back else 'not loaded'}): {result.error}")
+        return result
+
+    async def reload_all(self):
+        return [await self.reload(extension) for extension in sorted(self.bot.extensions)]
@@ -0,0 +1,138 @@
+import logging
+import asyncio
+import time
+
+logger = logging.getLogger("g1_admin.scheduler")
+
+
+class TimerWheel:
+    """
+    A hashed timer wheel driven by a single task
+
+    Timers are keyed so they can be replaced or cancelled, fire after a whole
+    number of ticks and run as plain (non-async) callbacks on the event loop.
+    Delays longer than one revolution wait extra rounds in their slot, so a
+    timer days away costs nothing until its slot comes up.
+    """
+
+    def __init__(self, slots=3600, resolution=1.0):
+        self.resolution = resolution
+        self._slots = [{} for _ in range(slots)]
+        # key -> slot index, so timers can be cancelled without scanning
+        self._where = {}
+        self._tick = 0
+        self._task = None
+        # Coroutine functions run after every tick, e.g. to flush batched edits
+        self._tick_handlers = []
+        self._running_handlers = set()
+
+    def __len__(self):
+        return len(self._where)
+
+    def schedule(self, key, delay, callback):
+        """Run callback() after delay seconds, replacing any timer with the same key"""
+        self.cancel(key)
+
+        ticks = max(1, int(round(delay / self.resolution)))
+        slot = (self._tick + ticks) % len(self._slots)
+        rounds = (ticks - 1) // len(self._slots)
+
+        self._slots[slot][key] = [rounds, callback]
+        self._where[key] = slot
+        self._ensure_running()
+
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            self._slots[slot].pop(key, None)
+
+    def add_tick_handler(self, handler):
+        self._tick_handlers.append(handler)
+
+    def remove_tick_handler(self, handler):
+        if handler in self._tick_handlers:
+            self._tick_handlers.remove(handler)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _advance(self):
+        self._tick += 1
+        bucket = self._slots[self._tick % len(self._slots)]
+        if not bucket:
+            return
+
+        due = []
+        for key, entry in bucket.items():
+            if entry[0] > 0:
+                entry[0] -= 1
+            else:
+                due.append((key, entry[1]))
+
+        for key, callback in due:
+            del bucket[key]
+            del self._where[key]
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Timer {key} failed: {e}")
+
+    async def _run(self):
+        next_tick = time.monotonic() + self.resolution
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            next_tick += self.resolution
+
+            # Catch up on ticks missed while the loop was busy
+            while next_tick <= time.monotonic():
+                self._advance()
+                next_tick += self.resolution
+            self._advance()
+
+            for handler in self._tick_handlers:
+                # A slow handler (e.g. waiting on a rate limit) must not hold up the wheel
+                if handler in self._running_handlers:
+                    continue
+                self._running_handlers.add(handler)
+                task = asyncio.get_running_loop().create_task(handler())
+                task.add_done_callback(lambda t, h=handler: self._handler_done(h, t))
+
+    def _handler_done(self, handler, task):
+        self._running_handlers.discard(handler)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Tick handler failed: {task.exception()}")
+
+
+class ChannelRateLimiter:
+    """Token bucket per channel, used to spread message edits under Discord's per-channel limits"""
+
+    def __init__(self, rate=5, per=5.0):
+        self.rate = rate
+        self.per = per
+        # channel_id -> (tokens, last refill time)
+        self._buckets = {}
+
+    def try_acquire(self, channel_id):
+        now = time.monotonic()
+        tokens, last = self._buckets.get(channel_id, (self.rate, now))
+        tokens = min(self.rate, tokens + (now - last) * self.rate / self.per)
+
+        if tokens < 1:
+            self._buckets[channel_id] = (tokens, now)
+            return False
+
+        self._buckets[channel_id] = (tokens - 1, now)
+        return True
+
+    def prune(self):
+        """Forget channels whose bucket has fully refilled"""
+        now = time.monotonic()
+        for channel_id, (tokens, last) in list(self._buckets.items()):
+            if tokens + (now - last) * self.rate / self.per >= self.rate:
+                del self._buckets[channel_id]
@@ -0,0 +1,251 @@
+import discord
+from discord.ext import commands
+import logging
+import os
+import time
+
+logger = logging.getLogger("g1_admin.shards")
+
+RATE_WINDOW = 60  # seconds of history used for event rates
+
+# Connection lifecycle events and the counter they bump
+LIFECYCLE_EVENTS = {
+    "connect": "connects",
+    "disconnect": "disconnects",
+    "resumed": "resumes",
+}
+
+# The sharded client also fires the plain events above for every shard, so only the shard_ ones count there
+SHARD_LIFECYCLE_EVENTS = {
+    "shard_connect": "connects",
+    "shard_disconnect": "disconnects",
+    "shard_resumed": "resumes",
+}
+
+
+def parse_shard_ids(value):
+    """
+    Parse shard IDs from "0-3", "0,2,4", a list, or None
+
+    Returns a sorted list of ints, or None when no IDs are given.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (list, tuple)):
+        return sorted(int(v) for v in value)
+
+    shard_ids = set()
+    for part in str(value).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            shard_ids.update(range(int(first), int(last) + 1))
+        else:
+            shard_ids.add(int(part))
+    return sorted(shard_ids)
+
+
+def format_shard_ids(shard_ids):
+    """The reverse of parse_shard_ids, e.g. [0, 1, 2, 5] -> "0-2,5" """
+    parts = []
+    for shard_id in sorted(shard_ids):
+        if parts and parts[-1][1] == shard_id - 1:
+            parts[-1][1] = shard_id
+        else:
+            parts.append([shard_id, shard_id])
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in parts)
+
+
+def load_shard_config(config):
+    """
+    Read the sharding settings, environment variables override config.json
+
+    Returns (sharded, shard_count, shard_ids). Sharding is on when "sharded" is
+    true (SHARDED=1, true, yes or on, SHARDED=0 turns a config's "sharded" off)
+    or a shard count is set. shard_count None lets Discord pick the count.
+    """
+    shard_count = os.getenv("SHARD_COUNT") or config.get("shard_count")
+    shard_ids = parse_shard_ids(os.getenv("SHARD_IDS") or config.get("shard_ids"))
+    sharded = os.getenv("SHARDED", "").strip().lower()
+    sharded = sharded in ("1", "true", "yes", "on") if sharded else bool(config.get("sharded"))
+    sharded = sharded or bool(shard_count)
+
+    shard_count = int(shard_count) if shard_count else None
+    if shard_ids is not None and shard_count is None:
+        raise ValueError("shard_ids requires shard_count to be set")
+    if shard_ids is not None and any(not 0 <= s < shard_count for s in shard_ids):
+        raise ValueError(f"shard_ids must be between 0 and {shard_count - 1}")
+
+    return sharded, shard_count, shard_ids
+
+
+def shard_id_for(guild_id, shard_count):
+    """The shard Discord routes a guild's events to"""
+    return (int(guild_id) >> 22) % (shard_count or 1)
+
+
+class ShardStats:
+    """Event counts for one shard, with per-second buckets for the recent rate"""
+
+    __slots__ = ("events", "connects", "disconnects", "resumes", "buckets", "stamps")
+
+    def __init__(self):
+        self.events = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.resumes = 0
+        self.buckets = [0] * RATE_WINDOW
+        self.stamps = [0] * RATE_WINDOW
+
+    def record(self, now):
+        self.events += 1
+        slot = now % RATE_WINDOW
+        if self.stamps[slot] != now:
+            self.stamps[slot] = now
+            self.buckets[slot] = 0
+        self.buckets[slot] += 1
+
+    def rate(self, now):
+        """Events per second over the last RATE_WINDOW seconds"""
+        return sum(b for b, s in zip(self.buckets, self.stamps) if now - s < RATE_WINDOW) / RATE_WINDOW
+
+    @property
+    def reconnects(self):
+        return max(0, self.connects - 1) + self.resumes
+
+
+class ShardHealthMixin:
+    """
+    Counts every dispatched event against the shard it came from
+
+    Events are attributed through their guild, events without one (DMs, the
+    bot's own lifecycle) count towards shard 0 as Discord routes them there.
+    """
+
+    lifecycle_events = LIFECYCLE_EVENTS
+
+    def __init__(self, *args, **kwargs):
+        self.shard_stats = {}
+        super().__init__(*args, **kwargs)
+
+    def _stats_for(self, shard_id):
+        stats = self.shard_stats.get(shard_id)
+        if stats is None:
+            stats = self.shard_stats[shard_id] = ShardStats()
+        return stats
+
+    def _event_shard(self, args):
+        if not args:
+            return 0
+
+        obj = args[0]
+        if isinstance(obj, discord.Guild):
+            return shard_id_for(obj.id, self.shard_count)
+
+        guild_id = getattr(obj, "guild_id", None)
+        if guild_id is None:
+            guild = getattr(obj, "guild", None)
+            guild_id = getattr(guild, "id", None)
+        if guild_id is None:
+            return 0
+        return shard_id_for(guild_id, self.shard_count)
+
+    def dispatch(self, event_name, /, *args, **kwargs):
+        counter = self.lifecycle_events.get(event_name)
+        if counter is not None:
+            shard_id = args[0] if args and isinstance(args[0], int) else 0
+            stats = self._stats_for(shard_id)
+            setattr(stats, counter, getattr(stats, counter) + 1)
+        else:
+            self._stats_for(self._event_shard(args)).record(int(time.monotonic()))
+
+        super().dispatch(event_name, *args, **kwargs)
+
+    @property
+    def local_shard_ids(self):
+        """Shards this process runs, None when it runs all of them"""
+        return getattr(self, "shard_ids", None)
+
+    def owns_guild(self, guild_id):
+        """Whether a guild's events arrive in this process, for keeping guild data shard-local"""
+        if guild_id is None or self.local_shard_ids is None:
+            return True
+        return shard_id_for(guild_id, self.shard_count) in self.local_shard_ids
+
+    def shard_report(self):
+        """(shard_id, latency, events/s, events, reconnects, guilds, status) for each local shard"""
+        now = int(time.monotonic())
+
+        guild_counts = {}
+        for guild in self.guilds:
+            guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+
+        shards = getattr(self, "shards", None)
+        if shards:
+            entries = [(shard_id, info.latency, info.is_closed()) for shard_id, info in sorted(shards.items())]
+        else:
+            entries = [(0, self.latency, self.is_closed())]
+
+        report = []
+        for shard_id, latency, closed in entries:
+            stats = self._stats_for(shard_id)
+            report.append((
+                shard_id,
+                latency,
+                stats.rate(now),
+                stats.events,
+                stats.reconnects,
+                guild_counts.get(shard_id, 0),
+                "closed" if closed else "online"
+            ))
+        return report
+
+
+class CogEventsMixin:
+    """
+    Dispatches cogs_changed when a cog is added or removed, e.g. to rebuild cached help
+
+    Also notes when each extension's module finished running, in
+    extension_imported (perf_counter), so startup can tell the module's own
+    import time apart from its setup().
+    """
+
+    extension_imported = None
+
+    async def _load_from_module_spec(self, spec, key):
+        if self.extension_imported is None:
+            self.extension_imported = {}
+        loader = spec.loader
+
+        def exec_module(module):
+            type(loader).exec_module(loader, module)
+            self.extension_imported[key] = time.perf_counter()
+
+        # The library runs the module and then awaits setup() in one call
+        loader.exec_module = exec_module
+        try:
+            await super()._load_from_module_spec(spec, key)
+        finally:
+            del loader.exec_module
+
+    async def add_cog(self, cog, /, **kwargs):
+        await super().add_cog(cog, **kwargs)
+        self.dispatch("cogs_changed")
+
+    async def remove_cog(self, name, /, **kwargs):
+        cog = await super().remove_cog(name, **kwargs)
+        if cog is not None:
+            self.dispatch("cogs_changed")
+        return cog
+
+
+class AdminBot(CogEventsMixin, ShardHealthMixin, commands.Bot):
+    """Single gateway connection"""
+
+
+class ShardedAdminBot(CogEventsMixin, ShardHealthMixin, commands.AutoShardedBot):
+    """One gateway connection per shard, optionally only a range of the shards"""
+
+    lifecycle_events = SHARD_LIFECYCLE_EVENTS
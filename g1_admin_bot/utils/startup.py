@@ -0,0 +1,57 @@
+import logging
+import time
+
+logger = logging.getLogger("g1_admin.startup")
+
+BAR_WIDTH = 40
+
+
+class StartupTimeline:
+    """
+    Records how long each startup phase takes and prints it as a waterfall
+
+    Phases are spans (name, start, end) measured from the moment the timeline
+    is created, which bot.py does before anything else.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._open = {}
+
+    def now(self):
+        return time.perf_counter() - self.origin
+
+    def begin(self, name):
+        self._open[name] = self.now()
+
+    def end(self, name):
+        """Close a phase opened with begin(), returns False if it wasn't open"""
+        start = self._open.pop(name, None)
+        if start is None:
+            return False
+        self.spans.append((name, start, self.now()))
+        return True
+
+    def span(self, name, start, end):
+        """Record a span measured elsewhere, start and end as offsets from origin"""
+        self.spans.append((name, start, end))
+
+    def report(self):
+        """The waterfall as text, one line per phase"""
+        if not self.spans:
+            return "No startup phases recorded."
+
+        total = max(end for _, _, end in self.spans) or 1.0
+        width = max(len(name) for name, _, _ in self.spans)
+        lines = [f"Startup waterfall (total {total:.2f}s)"]
+        for name, start, end in sorted(self.spans, key=lambda s: (s[1], s[2])):
+            offset = int(start / total * BAR_WIDTH)
+            length = max(1, int(round((end - start) / total * BAR_WIDTH)))
+            bar = " " * offset + "█" * min(length, BAR_WIDTH - offset)
+            lines.append(f"{name:<{width}}  {start:7.2f}s  {(end - start) * 1000:8.1f}ms  |{bar:<{BAR_WIDTH}}|")
+        return "\n".join(lines)
+
+    def log_report(self):
+        for line in self.report().splitlines():
+            logger.info(line)
@@ -0,0 +1,186 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from utils.perf import RollingSketch, format_seconds
+
+logger = logging.getLogger("g1_admin.watchdog")
+
+INTERVAL = 0.1          # seconds between pings to the loop
+THRESHOLD = 0.25        # a ping answered later than this is a stall
+MAX_SITES = 50          # call sites tracked separately, the rest count as "other"
+RECENT_STALLS = 20
+STACK_DEPTH = 12        # frames kept from each stall's stack
+
+# Stalls are attributed to the innermost frame in the bot's own code
+BOT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+
+def _where(frame):
+    """file:line, relative to the bot for its own files, just the file name for the library's"""
+    if frame.filename.startswith(BOT_ROOT):
+        return f"{os.path.relpath(frame.filename, BOT_ROOT)}:{frame.lineno}"
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+
+
+def call_site(stack):
+    """
+    (site, blocking) for a captured stack, innermost frame last
+
+    site is the innermost frame in the bot's code, e.g. "cogs/settings.py:31
+    save_config", where the bot called into whatever blocked. blocking is the
+    innermost frame overall, e.g. "encoder.py:432 _iterencode".
+    """
+    if not stack:
+        return "unknown", "unknown"
+    innermost = stack[-1]
+    blocking = f"{_where(innermost)} {innermost.name}"
+    for frame in reversed(stack):
+        if frame.filename.startswith(BOT_ROOT) and not frame.filename.endswith("watchdog.py"):
+            return f"{_where(frame)} {frame.name}", blocking
+    return blocking, blocking
+
+
+class Stall:
+    __slots__ = ("when", "seconds", "site", "blocking", "stack")
+
+    def __init__(self, when, seconds, site, blocking, stack):
+        self.when = when
+        self.seconds = seconds
+        self.site = site
+        self.blocking = blocking
+        self.stack = stack
+
+
+class StallSite:
+    __slots__ = ("count", "total", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+
+
+class LoopWatchdog:
+    """
+    A thread that checks the event loop keeps answering, and catches it when it doesn't
+
+    Every interval the thread schedules a callback on the loop and waits for
+    it. The delay before it runs is the loop's lag. When it hasn't run after
+    threshold seconds something is blocking the loop, so the thread grabs the
+    loop thread's current stack, which points at the code that's blocking.
+    Once the loop answers again the stall is recorded against its call site.
+
+    Everything is recorded on the loop thread (the thread hands the stall over
+    with call_soon_threadsafe), so nothing here needs a lock. on_stall
+    callbacks get each finished Stall, e.g. to feed metrics.
+    """
+
+    def __init__(self, interval=INTERVAL, threshold=THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = RollingSketch()
+        self.last_lag = 0.0
+        self.sites = {}
+        self.recent = collections.deque(maxlen=RECENT_STALLS)
+        self.stalls = 0
+        self.on_stall = []
+
+        self._loop = None
+        self._loop_thread = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._answered = threading.Event()
+
+    def start(self, loop):
+        """Start watching loop, call from the loop's own thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._answered.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _answer(self, sent):
+        # Runs on the loop
+        lag = time.monotonic() - sent
+        self.last_lag = lag
+        self.lag.add(lag, time.time())
+        self._answered.set()
+
+    def _capture(self):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return []
+        return traceback.extract_stack(frame)[-STACK_DEPTH:]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            sent = time.monotonic()
+            self._answered.clear()
+            try:
+                self._loop.call_soon_threadsafe(self._answer, sent)
+            except RuntimeError:
+                # The loop is closed
+                return
+            if self._answered.wait(self.threshold):
+                continue
+
+            stack = self._capture()
+            when = time.time()
+            while not self._answered.wait(1.0):
+                if self._stop.is_set():
+                    return
+            if self._stop.is_set():
+                return
+
+            site, blocking = call_site(stack)
+            stall = Stall(when, time.monotonic() - sent, site, blocking, stack)
+            try:
+                self._loop.call_soon_threadsafe(self._record, stall)
+            except RuntimeError:
+                return
+
+    def _record(self, stall):
+        logger.warning(f"Event loop blocked for {format_seconds(stall.seconds)} at {stall.site} (in {stall.blocking})")
+        self.stalls += 1
+        self.recent.append(stall)
+
+        # Bounded, as sites become metric labels
+        if stall.site not in self.sites and len(self.sites) >= MAX_SITES:
+            stall.site = "other"
+        stats = self.sites.get(stall.site)
+        if stats is None:
+            stats = self.sites[stall.site] = StallSite()
+        stats.count += 1
+        stats.total += stall.seconds
+        stats.max = max(stats.max, stall.seconds)
+        stats.last = stall
+
+        for callback in self.on_stall:
+            try:
+                callback(stall)
+            except Exception as e:
+                logger.error(f"Stall callback failed: {e}")
+
+    def top_sites(self, limit=10):
+        """(site, StallSite) with the most time stalled first"""
+        return sorted(self.sites.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+
+    def lag_percentiles(self, now=None):
+        """(count, p50, p99, max) of the loop lag over the last hour"""
+        sketch = self.lag.merged(time.time() if now is None else now)
+        return sketch.count, sketch.quantile(0.5), sketch.quantile(0.99), sketch.max
@@ -0,0 +1,173 @@
+import asyncio
+import collections
+import logging
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger("g1_admin.web")
+
+MAX_DOWNLOAD = 8 * 1024 * 1024       # default cap on a single download
+CHUNK_SIZE = 64 * 1024
+CACHE_ENTRIES = 128
+CACHE_BYTES = 32 * 1024 * 1024
+CACHE_TTL = 600                      # seconds a cached download stays fresh
+MAX_REDIRECTS = 3
+USER_AGENT = "G1AdminBot (+https://github.com/ilyyeees/Discord_Management_Bot)"
+
+
+class DownloadError(Exception):
+    """A download failed or broke the limits, the message is fit to show users"""
+
+
+class Download:
+    __slots__ = ("url", "content_type", "data", "fetched_at")
+
+    def __init__(self, url, content_type, data):
+        self.url = url
+        self.content_type = content_type
+        self.data = data
+        self.fetched_at = time.monotonic()
+
+
+class WebClient:
+    """
+    One pooled HTTP session for the bot's lifetime
+
+    Connections and DNS lookups are reused, every request has timeouts, and
+    downloads are streamed with a size cap so a huge or endless body is cut
+    off instead of filling memory. Recent downloads are kept in a small LRU
+    cache by URL, and concurrent downloads of the same URL share one request.
+    """
+
+    def __init__(self, max_connections=20, per_host=4, timeout=30.0, connect_timeout=10.0,
+                 cache_entries=CACHE_ENTRIES, cache_bytes=CACHE_BYTES, cache_ttl=CACHE_TTL):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout, sock_read=connect_timeout)
+        self._session = None
+
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+        self.cache_ttl = cache_ttl
+        self._cache = collections.OrderedDict()
+        self._cache_size = 0
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def session(self):
+        """Created on first use, it has to be made inside the running event loop"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.per_host,
+                ttl_dns_cache=300,
+                use_dns_cache=True
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"User-Agent": USER_AGENT}
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _cached(self, url):
+        entry = self._cache.get(url)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.fetched_at > self.cache_ttl:
+            self._evict(url)
+            return None
+        self._cache.move_to_end(url)
+        return entry
+
+    def _evict(self, url):
+        entry = self._cache.pop(url, None)
+        if entry is not None:
+            self._cache_size -= len(entry.data)
+
+    def _store(self, url, download):
+        """Cache a download under the URL that was asked for, download.url is where redirects ended"""
+        if len(download.data) > self.cache_bytes // 4:
+            # One big file shouldn't flush everything else
+            return
+        self._evict(url)
+        self._cache[url] = download
+        self._cache_size += len(download.data)
+        while self._cache and (len(self._cache) > self.cache_entries or self._cache_size > self.cache_bytes):
+            self._evict(next(iter(self._cache)))
+
+    async def fetch(self, url, max_bytes=MAX_DOWNLOAD, use_cache=True):
+        """Download url into memory, at most max_bytes of it. Raises DownloadError."""
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise DownloadError("Only http and https links can be downloaded.")
+
+        if use_cache:
+            cached = self._cached(url)
+            if cached is not None:
+                if len(cached.data) > max_bytes:
+                    raise DownloadError(f"The file is larger than {max_bytes // 1024 // 1024} MB.")
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+            # Someone is already downloading it, wait for theirs
+            pending = self._in_flight.get((url, max_bytes))
+            if pending is not None:
+                return await asyncio.shield(pending)
+
+        task = asyncio.ensure_future(self._download(url, max_bytes))
+        self._in_flight[(url, max_bytes)] = task
+        try:
+            download = await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._in_flight.pop((url, max_bytes), None)
+            else:
+                task.add_done_callback(lambda _: self._in_flight.pop((url, max_bytes), None))
+
+        if use_cache:
+            self._store(url, download)
+        return download
+
+    async def _download(self, url, max_bytes):
+        try:
+            async with self.session.get(url, max_redirects=MAX_REDIRECTS) as response:
+                if response.status != 200:
+                    raise DownloadError(f"Download failed with status code {response.status}.")
+
+                # Refuse up front when the server says it's too big
+                if response.content_length is not None and response.content_length > max_bytes:
+                    raise DownloadError(f"The file is larger than {max_bytes // 1024 // 1024} MB.")
+
+                chunks = []
+                size = 0
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise DownloadError(f"The file is larger than {max_bytes // 1024 // 1024} MB.")
+                    chunks.append(chunk)
+
+                return Download(str(response.url), response.content_type, b"".join(chunks))
+        except asyncio.TimeoutError:
+            raise DownloadError("The download timed out.")
+        except aiohttp.TooManyRedirects:
+            raise DownloadError("The link redirected too many times.")
+        except aiohttp.ClientError as e:
+            raise DownloadError(f"The download failed: {e}")
+
+    def stats(self):
+        return {
+            "entries": len(self._cache),
+            "bytes": self._cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }